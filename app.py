@@ -7,7 +7,7 @@ from flask_cors import CORS
 import os
 from src.routes import main_bp, api_bp
 from src.utils import config
-from src.services import vitals_simulator
+from src.services import vitals_simulator, state_backend, websocket_hub, vitals_wal, ai_assistant
 
 def create_app(config_name=None):
     """Application factory pattern"""
@@ -24,6 +24,25 @@ def create_app(config_name=None):
     app.register_blueprint(main_bp)
     app.register_blueprint(api_bp)
     
+    # Restore vitals and alerts from the write-ahead log before the simulation
+    # starts, in the worker that owns it
+    if vitals_wal is not None:
+        state_backend.on_leader(lambda: vitals_simulator.attach_wal(vitals_wal))
+    
+    # Join the shared simulation when several workers serve the app
+    state_backend.start()
+    
+    # Start the WebSocket hub for central monitoring screens when configured;
+    # it runs in the worker that owns the simulation
+    if app.config.get('WEBSOCKET_PORT'):
+        state_backend.on_leader(lambda: websocket_hub.start(
+            app.config.get('HOST', '0.0.0.0'), app.config['WEBSOCKET_PORT']
+        ))
+    
+    # Check AI provider availability in the background, so the first status
+    # request already has an answer
+    ai_assistant.provider_status.start()
+    
     # Create templates directory if it doesn't exist
     if not os.path.exists('templates'):
         os.makedirs('templates')
@@ -35,7 +54,7 @@ def main():
     app = create_app()
     
     # Start the simulation thread when running directly (not via gunicorn)
-    vitals_simulator.start_simulation()
+    state_backend.simulator.start_simulation()
     
     port = app.config.get('PORT', 5000)
     host = app.config.get('HOST', '0.0.0.0')
@@ -2,6 +2,9 @@
 import os
 from dotenv import load_dotenv
 
+# Vital Signs Ranges (Normal, Warning, Critical) - shared with the application
+from src.utils.config import VITAL_RANGES
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -14,30 +17,6 @@ PATIENT_CONDITION = "Cancer"
 ATTENDING_DOCTOR = "Dr. Sarah Wilson"
 ASSIGNED_NURSE = "Emily Johnson"
 
-# Vital Signs Ranges (Normal, Warning, Critical)
-VITAL_RANGES = {
-    'heart_rate': {
-        'normal': (60, 100),
-        'warning': (50, 120),
-        'critical': (40, 150)
-    },
-    'spo2': {
-        'normal': (95, 100),
-        'warning': (90, 94),
-        'critical': (0, 89)
-    },
-    'temperature': {
-        'normal': (36.0, 37.5),
-        'warning': (35.0, 38.5),
-        'critical': (34.0, 40.0)
-    },
-    'respiratory_rate': {
-        'normal': (12, 20),
-        'warning': (8, 25),
-        'critical': (6, 30)
-    }
-}
-
 # Simulation Settings
 UPDATE_INTERVAL = 5  # seconds
 MAX_HISTORY_RECORDS = 100
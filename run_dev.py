@@ -9,7 +9,7 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
 from app import create_app
-from src.services import vitals_simulator
+from src.services import state_backend
 
 if __name__ == "__main__":
     # Set development environment
@@ -19,7 +19,7 @@ if __name__ == "__main__":
     app = create_app('development')
     
     # Start simulation
-    vitals_simulator.start_simulation()
+    state_backend.simulator.start_simulation()
     
     print("Starting KogniCare Development Server...")
     print("Dashboard available at: http://localhost:5000")
@@ -23,8 +23,8 @@ if __name__ == "__main__":
     # Start production server directly
     app = create_production_app()
     
-    from src.services import vitals_simulator
-    vitals_simulator.start_simulation()
+    from src.services import state_backend
+    state_backend.simulator.start_simulation()
     
     port = int(os.environ.get('PORT', 5000))
     print(f"Starting KogniCare Production Server on port {port}...")
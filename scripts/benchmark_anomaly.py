@@ -0,0 +1,141 @@
+"""
+Benchmark of the vitals anomaly detectors on sample data and the simulator
+
+    python scripts/benchmark_anomaly.py
+    python scripts/benchmark_anomaly.py --patients 500 --hours 48 --ward 10000 --sim-patients 100
+
+Builds a ward from scripts/generate_sample_data.py (one reading every 5
+minutes per patient), then adds a slow heart-rate drift to half the
+patients: +15 BPM over 4 hours, which mostly stays inside the normal range.
+Reports how many drifting and untouched patients the CUSUM detector and the
+fixed VITAL_RANGES thresholds flag after the drift starts, the detection
+delay, false drift alarms on the untouched patients, and detector
+throughput for a large ward.
+
+Then runs the simulator's own random walk, in development and production
+mode, for a day of ticks at SIMULATION_INTERVAL_DEV/PROD and reports the
+spike and drift alarms per patient-day and how soon the first patient's
+anomaly alerts would reach MAX_ANOMALY_ALERTS within the alert retention.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scripts.generate_sample_data import generate_sample_vitals_data
+from src.services.anomaly import AnomalyDetector, SPIKE, DRIFT_UP
+from src.services.thresholds import ThresholdTable, NORMAL
+from src.services.vitals_service import VitalsSimulator, VITAL_FIELDS
+from src.utils.config import Config
+
+READING_MINUTES = 5
+
+def sample_ward(patients, hours, seed):
+    """Per-vital arrays of shape (readings, patients) from the sample data generator"""
+    random.seed(seed)
+    series = [generate_sample_vitals_data(hours) for _ in range(patients)]
+    return {name: np.array([[reading[name] for reading in patient] for patient in series], dtype=np.float64).T
+            for name in VITAL_FIELDS}
+
+def add_drift(ward, patients, start, readings, amount):
+    """Ramp heart rate up by `amount` over `readings` readings from `start`, then hold it"""
+    ramp = np.minimum(np.arange(len(ward['heart_rate']) - start) + 1, readings) * (amount / readings)
+    ward['heart_rate'][start:, patients] += ramp[:, None]
+
+def simulator_alarms(patients, interval, production, seed):
+    """Spike and drift alarm counts, and the tick each patient's alarms first fill the
+    anomaly cap within the retention window, over a day of simulator ticks"""
+    os.environ['DEBUG'] = 'false' if production else 'true'
+    simulator = VitalsSimulator(patient_ids=[f'bed-{i}' for i in range(patients)], seed=seed)
+    # Only the random walk is needed: threshold alerts are never raised
+    simulator.alerts.max_per_patient = 0
+    detector = AnomalyDetector(VITAL_FIELDS, z_threshold=Config.ANOMALY_Z_THRESHOLD,
+                               cusum_threshold=Config.ANOMALY_CUSUM_THRESHOLD, patients=patients)
+    retention_ticks = Config.ALERT_RETENTION_MINUTES * 60 // interval
+    fired = [[] for _ in range(patients)]
+    full_at = np.full(patients, -1)
+    spikes = drifts = 0
+    for tick in range(86400 // interval):
+        simulator.generate_realistic_vitals()
+        for row, vital, kind, z in detector.update({name: simulator.vitals[name] for name in VITAL_FIELDS}):
+            spikes += kind == SPIKE
+            drifts += kind != SPIKE
+            recent = [t for t in fired[row] if t > tick - retention_ticks] + [tick]
+            fired[row] = recent
+            if len(recent) >= Config.MAX_ANOMALY_ALERTS and full_at[row] < 0:
+                full_at[row] = tick
+    return spikes / patients, drifts / patients, full_at
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the vitals anomaly detectors')
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--hours', type=int, default=24)
+    parser.add_argument('--ward', type=int, default=10000, help='patients for the throughput run')
+    parser.add_argument('--sim-patients', type=int, default=50, help='patients for the simulator run')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    ward = sample_ward(args.patients, args.hours, args.seed)
+    readings = len(ward['heart_rate'])
+    drifted = np.arange(args.patients) % 2 == 1
+    drift_start = readings // 2
+    add_drift(ward, drifted, drift_start, 4 * 60 // READING_MINUTES, 15)
+
+    detector = AnomalyDetector(VITAL_FIELDS, patients=args.patients)
+    thresholds = ThresholdTable()
+    # First tick after the drift starts at which each patient's heart rate is flagged
+    cusum_at = np.full(args.patients, -1)
+    threshold_at = np.full(args.patients, -1)
+    false_drifts = 0
+    for tick in range(readings):
+        values = {name: ward[name][tick] for name in VITAL_FIELDS}
+        for row, vital, kind, z in detector.update(values):
+            if kind != SPIKE and not drifted[row]:
+                false_drifts += 1
+            if tick >= drift_start and vital == 'heart_rate' and kind == DRIFT_UP and cusum_at[row] < 0:
+                cusum_at[row] = tick
+        if tick >= drift_start:
+            flagged = thresholds.classify('heart_rate', values['heart_rate']) != NORMAL
+            threshold_at[flagged & (threshold_at < 0)] = tick
+
+    # The sample data has random heart-rate spikes, so untouched patients show how
+    # often each method flags a patient whose heart rate did not drift
+    clean_days = (~drifted).sum() * args.hours / 24
+    for label, detected_at in (('CUSUM', cusum_at), ('VITAL_RANGES thresholds', threshold_at)):
+        caught = detected_at[drifted] >= 0
+        delay = (detected_at[drifted][caught] - drift_start) * READING_MINUTES
+        median = f", median delay {np.median(delay):.0f} min" if caught.any() else ''
+        print(f"{label}: flagged {caught.sum()}/{drifted.sum()} drifting patients{median}; "
+              f"also flagged {(detected_at[~drifted] >= 0).sum()}/{(~drifted).sum()} untouched patients")
+    print(f"False drift alarms (any vital) on untouched patients: {false_drifts / clean_days:.2f} per patient-day")
+
+    # The simulator's random walk has no clinical events, so every alarm on it is noise;
+    # the de-duplication window is ignored, so these are upper bounds on the alerts raised
+    for label, interval, production in (('development', Config.SIMULATION_INTERVAL_DEV, False),
+                                        ('production', Config.SIMULATION_INTERVAL_PROD, True)):
+        spikes, drifts, full_at = simulator_alarms(args.sim_patients, interval, production, args.seed)
+        full = full_at >= 0
+        when = f", first after {full_at[full].min() * interval / 60:.0f} min" if full.any() else ''
+        print(f"Simulator random walk ({label}, one tick every {interval}s): {spikes:.1f} spike and "
+              f"{drifts:.1f} drift alarms per patient-day; {full.sum()}/{args.sim_patients} patients reach "
+              f"{Config.MAX_ANOMALY_ALERTS} anomaly alerts within {Config.ALERT_RETENTION_MINUTES} min{when}")
+
+    # Throughput: a large ward fed one tick at a time, as the simulator does
+    rng = np.random.default_rng(args.seed)
+    detector = AnomalyDetector(VITAL_FIELDS, patients=args.ward)
+    ticks = 200
+    values = [{name: ward[name][tick % readings][rng.integers(0, args.patients, args.ward)]
+               for name in VITAL_FIELDS} for tick in range(ticks)]
+    started = time.perf_counter()
+    for tick_values in values:
+        detector.update(tick_values)
+    elapsed = time.perf_counter() - started
+    print(f"Throughput ({args.ward:,} patients): {elapsed / ticks * 1000:.2f} ms per tick, "
+          f"{ticks * args.ward * len(VITAL_FIELDS) / elapsed:,.0f} vital readings/s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Benchmark of time-to-first-token of /api/chat, buffered and streamed
+
+    python scripts/benchmark_chat_stream.py
+    python scripts/benchmark_chat_stream.py --first-token-delay 0.8 --token-delay 0.03 --tokens 300
+
+Points the app at scripts/mock_llm_server.py and asks distinct questions
+(so none is answered from the cache) through the Flask endpoint, once
+polling the background job until its JSON answer is done and once reading
+the Server-Sent Events stream.
+Reports the median time to the first byte of the answer and to the end.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DISABLE_SIMULATION', 'true')
+
+from scripts.mock_llm_server import MockLLMServer
+
+def timed_buffered(client, question):
+    started = time.perf_counter()
+    job = client.post('/api/chat', json={'message': question}).get_json()
+    status_url = job['status_url']
+    # The answer is prepared in the background; it arrives whole once the job is done
+    while job['status'] not in ('done', 'failed'):
+        time.sleep(0.01)
+        job = client.get(status_url).get_json()
+    elapsed = time.perf_counter() - started
+    return elapsed, elapsed
+
+def timed_streamed(client, question):
+    started = time.perf_counter()
+    response = client.post('/api/chat', json={'message': question, 'stream': True}, buffered=False)
+    first = None
+    for chunk in response.response:
+        if first is None and b'event: token' in chunk:
+            first = time.perf_counter() - started
+    response.close()
+    return first, time.perf_counter() - started
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streamed and buffered chat latency')
+    parser.add_argument('--first-token-delay', type=float, default=0.5)
+    parser.add_argument('--token-delay', type=float, default=0.02)
+    parser.add_argument('--tokens', type=int, default=120)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    mock = MockLLMServer(first_token_delay=args.first_token_delay, token_delay=args.token_delay,
+                         tokens=args.tokens).start()
+    # The assistant reads its base URL when the services are imported
+    os.environ['AI_BASE_URL'] = mock.url
+    from app import create_app
+    client = create_app('development').test_client()
+
+    print(f"Mock LLM: {args.tokens} tokens, first after {args.first_token_delay}s, then every {args.token_delay}s")
+    for label, measure in (('buffered JSON', timed_buffered), ('streamed SSE', timed_streamed)):
+        timings = [measure(client, f'{label} question {run}') for run in range(args.runs)]
+        first = statistics.median(t[0] for t in timings)
+        total = statistics.median(t[1] for t in timings)
+        print(f"{label}: first token {first * 1000:.0f} ms, complete answer {total * 1000:.0f} ms")
+    mock.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""
+Benchmark of the vitals write-ahead log: append throughput and restart time
+
+    python scripts/benchmark_wal.py
+    python scripts/benchmark_wal.py --patients 200 --interval 10 --hours 24
+
+Appends a simulated ward's ticks to a log in a temporary directory, once
+with group commit and once with an fsync per tick, then restores a day of
+data from the log alone and from a snapshot plus the last hour of log.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DISABLE_SIMULATION', 'true')
+
+from src.models import Alert
+from src.services.scheduler import TickScheduler
+from src.services.vitals_service import VitalsSimulator, VITAL_FIELDS, VITAL_DTYPES
+from src.services.vitals_wal import WriteAheadLog
+
+def make_ward(patients):
+    return VitalsSimulator([f'BED-{i:04d}' for i in range(patients)], seed=1, scheduler=TickScheduler())
+
+def tick_values(rng, patients):
+    return {
+        'heart_rate': rng.integers(60, 100, patients).astype(VITAL_DTYPES['heart_rate']),
+        'spo2': rng.integers(94, 100, patients).astype(VITAL_DTYPES['spo2']),
+        'temperature': rng.uniform(36.5, 37.5, patients).astype(VITAL_DTYPES['temperature']),
+        'respiratory_rate': rng.integers(12, 20, patients).astype(VITAL_DTYPES['respiratory_rate'])
+    }
+
+def write_day(directory, patients, interval, hours, snapshot_before_end=None):
+    """Log hours of ticks for a ward through a simulator, optionally snapshotting near the end"""
+    simulator = make_ward(patients)
+    wal = WriteAheadLog(directory, flush_interval=0.1, snapshot_interval=3600 * 24 * 365)
+    simulator.attach_wal(wal)
+    rng = np.random.default_rng(2)
+    ticks = int(hours * 3600 / interval)
+    start = time.time() - ticks * interval
+    for tick in range(ticks):
+        now = start + tick * interval
+        values = tick_values(rng, patients)
+        for name in VITAL_FIELDS:
+            simulator.vitals[name][:] = values[name]
+        simulator.timestamps[:] = now
+        simulator._record_readings(now, values)
+        if tick % 100 == 0:
+            simulator._raise_alert(Alert('warning', 'heart_rate', 101, 'Heart Rate is warning: 101',
+                                         f'BED-{tick % patients:04d}'))
+        if snapshot_before_end is not None and tick == ticks - int(snapshot_before_end / interval):
+            wal.snapshot()
+    wal.stop()
+    return ticks * patients
+
+def bench_append(directory, patients, ticks, group_commit):
+    simulator = make_ward(patients)
+    wal = WriteAheadLog(directory, flush_interval=0.05 if group_commit else 3600)
+    simulator.attach_wal(wal)
+    rng = np.random.default_rng(3)
+    values = tick_values(rng, patients)
+    started = time.perf_counter()
+    for _ in range(ticks):
+        simulator._record_readings(time.time(), values)
+        if not group_commit:
+            wal.flush()
+    wal.stop()
+    elapsed = time.perf_counter() - started
+    return elapsed, wal.flushes
+
+def bench_recover(directory, patients):
+    simulator = make_ward(patients)
+    wal = WriteAheadLog(directory)
+    result = wal.recover(simulator)
+    return result['seconds'], len(simulator.alerts)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the vitals write-ahead log')
+    parser.add_argument('--patients', type=int, default=50)
+    parser.add_argument('--interval', type=float, default=30, help='seconds between readings')
+    parser.add_argument('--hours', type=float, default=24)
+    parser.add_argument('--ticks', type=int, default=2000, help='ticks for the append benchmark')
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix='kognicare-wal-')
+    try:
+        for group_commit in (True, False):
+            directory = os.path.join(root, f'append-{group_commit}')
+            elapsed, flushes = bench_append(directory, args.patients, args.ticks, group_commit)
+            readings = args.ticks * args.patients
+            label = 'group commit' if group_commit else 'fsync per tick'
+            print(f"Append ({label}): {readings / elapsed:,.0f} readings/s, "
+                  f"{args.ticks / elapsed:,.0f} ticks/s, {flushes} fsyncs")
+
+        directory = os.path.join(root, 'log-only')
+        readings = write_day(directory, args.patients, args.interval, args.hours)
+        size = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+        seconds, alerts = bench_recover(directory, args.patients)
+        print(f"Recover {readings:,} readings from the log alone ({size / 1e6:.1f} MB): "
+              f"{seconds:.3f}s, {alerts} alerts kept")
+
+        directory = os.path.join(root, 'snapshot')
+        write_day(directory, args.patients, args.interval, args.hours, snapshot_before_end=3600)
+        seconds, alerts = bench_recover(directory, args.patients)
+        print(f"Recover from a snapshot plus the last hour of log: {seconds:.3f}s, {alerts} alerts kept")
+    finally:
+        shutil.rmtree(root)
+
+if __name__ == '__main__':
+    main()
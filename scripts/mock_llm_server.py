@@ -0,0 +1,109 @@
+"""
+Local stand-in for the OpenRouter chat API with configurable generation delays
+
+    python scripts/mock_llm_server.py --port 8088 --first-token-delay 0.8 --token-delay 0.03
+    AI_BASE_URL=http://127.0.0.1:8088 python run_dev.py
+
+Answers POST /chat/completions with a fixed answer of --tokens words, either
+as one JSON body after the whole answer has been "generated" or, when the
+request has ``"stream": true``, as server-sent events with one chunk per
+word, like OpenRouter. GET /models lists the configured model.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MODEL = 'microsoft/phi-3.5-mini-128k-instruct'
+
+class MockLLMServer:
+    """Threaded HTTP/1.1 server emitting a canned answer at a set pace"""
+
+    def __init__(self, host='127.0.0.1', port=0, first_token_delay=0.5, token_delay=0.02, tokens=120):
+        self.first_token_delay = first_token_delay   # seconds before the first word, like prompt processing
+        self.token_delay = token_delay               # seconds between words
+        self.words = [f'word{i} ' for i in range(tokens)]
+        self.requests = 0
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.url = f'http://{host}:{self.server.server_address[1]}'
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                self._send_json({'data': [{'id': MODEL}]})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                mock.requests += 1
+                if body.get('stream'):
+                    self._stream_answer()
+                else:
+                    time.sleep(mock.first_token_delay + mock.token_delay * (len(mock.words) - 1))
+                    self._send_json({'choices': [{'message': {'content': ''.join(mock.words)}}]})
+
+            def _send_json(self, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream_answer(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                self._chunk(b': OPENROUTER PROCESSING\n\n')
+                time.sleep(mock.first_token_delay)
+                for i, word in enumerate(mock.words):
+                    if i:
+                        time.sleep(mock.token_delay)
+                    event = {'choices': [{'index': 0, 'delta': {'content': word}}]}
+                    self._chunk(f'data: {json.dumps(event)}\n\n'.encode())
+                self._chunk(b'data: [DONE]\n\n')
+                self._chunk(b'')
+
+            def _chunk(self, data):
+                self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        """Serve from a background thread"""
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a mock OpenRouter chat API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8088)
+    parser.add_argument('--first-token-delay', type=float, default=0.5)
+    parser.add_argument('--token-delay', type=float, default=0.02)
+    parser.add_argument('--tokens', type=int, default=120)
+    args = parser.parse_args()
+
+    mock = MockLLMServer(args.host, args.port, args.first_token_delay, args.token_delay, args.tokens)
+    print(f"Mock LLM API on {mock.url} ({args.tokens} tokens, first after {args.first_token_delay}s, "
+          f"then every {args.token_delay}s)")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        mock.stop()
+
+if __name__ == '__main__':
+    main()
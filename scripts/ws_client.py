@@ -0,0 +1,96 @@
+"""
+Scripted WebSocket client for trying the monitoring hub locally
+
+    python scripts/ws_client.py --port 8765 default
+    python scripts/ws_client.py --port 8765 --idle 500 default
+
+The first form subscribes to the given patients and prints every message.
+The second also opens that many idle connections to check how the hub
+holds up with many open screens.
+"""
+import argparse
+import base64
+import json
+import os
+import socket
+import struct
+
+def connect(host, port):
+    """Open a socket and complete the WebSocket handshake"""
+    sock = socket.create_connection((host, port))
+    key = base64.b64encode(os.urandom(16)).decode()
+    sock.sendall(
+        f'GET / HTTP/1.1\r\nHost: {host}:{port}\r\nUpgrade: websocket\r\n'
+        f'Connection: Upgrade\r\nSec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n'.encode()
+    )
+    response = b''
+    while b'\r\n\r\n' not in response:
+        chunk = sock.recv(1024)
+        if not chunk:
+            raise ConnectionError('Connection closed during handshake')
+        response += chunk
+    if not response.startswith(b'HTTP/1.1 101'):
+        raise ConnectionError(response.split(b'\r\n', 1)[0].decode())
+    return sock
+
+def send_json(sock, message):
+    """Send a masked text frame, as clients must"""
+    payload = json.dumps(message).encode()
+    mask = os.urandom(4)
+    masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x81, 0x80 | length)
+    else:
+        header = struct.pack('!BBH', 0x81, 0x80 | 126, length)
+    sock.sendall(header + mask + masked)
+
+def recv_exactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise ConnectionError('Connection closed')
+        data += chunk
+    return data
+
+def recv_message(sock):
+    """Read one server frame and return (opcode, payload)"""
+    first, second = recv_exactly(sock, 2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', recv_exactly(sock, 2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', recv_exactly(sock, 8))[0]
+    return first & 0x0F, recv_exactly(sock, length)
+
+def main():
+    parser = argparse.ArgumentParser(description='Subscribe to patients on the WebSocket hub')
+    parser.add_argument('patient_ids', nargs='+')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--idle', type=int, default=0, help='extra idle connections to open')
+    args = parser.parse_args()
+
+    idle = [connect(args.host, args.port) for _ in range(args.idle)]
+    if idle:
+        print(f"Opened {len(idle)} idle connections")
+
+    sock = connect(args.host, args.port)
+    send_json(sock, {'action': 'subscribe', 'patient_ids': args.patient_ids})
+    try:
+        while True:
+            opcode, payload = recv_message(sock)
+            if opcode == 0x8:
+                print('Server closed the connection')
+                break
+            print(payload.decode())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sock.close()
+        for conn in idle:
+            conn.close()
+
+if __name__ == '__main__':
+    main()
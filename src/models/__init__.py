@@ -45,8 +45,9 @@ class VitalSigns:
 
 class Alert:
     """Alert data model"""
-    def __init__(self, alert_type, vital, value, message):
+    def __init__(self, alert_type, vital, value, message, patient_id=None):
         self.id = None  # Will be set when added to alerts list
+        self.patient_id = patient_id
         self.type = alert_type
         self.vital = vital
         self.value = value
@@ -57,6 +58,7 @@ class Alert:
     def to_dict(self):
         return {
             'id': self.id,
+            'patient_id': self.patient_id,
             'type': self.type,
             'vital': self.vital,
             'value': self.value,
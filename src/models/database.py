@@ -0,0 +1,284 @@
+"""
+SQLite persistence for patients, vitals readings and alerts
+
+The database runs in WAL mode so request threads can read while the writer
+commits. Every write is queued and applied by one background thread,
+which drains the queue and commits everything pending in one transaction;
+a simulation tick therefore costs one transaction, and request handlers
+never wait for the disk. Reads use a connection per thread and are served
+by the composite indexes on (patient_id, timestamp) and
+(patient_id, vital, type).
+"""
+import queue
+import sqlite3
+import threading
+from datetime import datetime
+import numpy as np
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id TEXT PRIMARY KEY,
+    name TEXT,
+    age INTEGER,
+    gender TEXT,
+    room TEXT,
+    admission_date TEXT,
+    condition TEXT,
+    attending_doctor TEXT,
+    nurse TEXT
+);
+CREATE TABLE IF NOT EXISTS vitals (
+    patient_id TEXT NOT NULL,
+    timestamp REAL NOT NULL,
+    heart_rate INTEGER,
+    spo2 INTEGER,
+    temperature REAL,
+    respiratory_rate INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_vitals_patient_time ON vitals (patient_id, timestamp);
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY,
+    patient_id TEXT,
+    type TEXT,
+    vital TEXT,
+    value NUMERIC,
+    message TEXT,
+    timestamp TEXT,
+    created REAL,
+    acknowledged INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_patient_vital_type ON alerts (patient_id, vital, type);
+CREATE INDEX IF NOT EXISTS idx_alerts_created ON alerts (created);
+"""
+
+PATIENT_FIELDS = ('name', 'age', 'gender', 'room', 'admission_date', 'condition', 'attending_doctor', 'nurse')
+VITAL_COLUMNS = ('heart_rate', 'spo2', 'temperature', 'respiratory_rate')
+ALERT_COLUMNS = ('id', 'patient_id', 'type', 'vital', 'value', 'message', 'timestamp', 'acknowledged')
+
+class Database:
+    """SQLite store written by a background thread and read from any thread"""
+
+    def __init__(self, path):
+        self.path = path
+        self.queue = queue.Queue()
+        self.local = threading.local()
+        self.transactions = 0
+        self.errors = 0
+
+        # The writer's connection creates the schema before anything is queued
+        self.writer = self._connect(check_same_thread=False)
+        self.writer.executescript(SCHEMA)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _connect(self, check_same_thread=True):
+        conn = sqlite3.connect(self.path, check_same_thread=check_same_thread)
+        conn.execute('PRAGMA journal_mode=WAL')
+        # WAL mode keeps commits durable against crashes without a full sync each time
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _reader(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = self._connect()
+        return conn
+
+    # Writes (queued)
+
+    def on_readings(self, patient_ids, timestamps, values):
+        """Queue a batch of readings; called by the simulator for every tick and ingest"""
+        # The simulator reuses its arrays for the next tick, so queue copies
+        self.queue.put((self._write_readings, (
+            list(patient_ids), np.array(timestamps), [np.array(values[name]) for name in VITAL_COLUMNS]
+        )))
+
+    def save_alert(self, alert):
+        self.queue.put((self._write_alert, (alert.to_dict(),)))
+
+    def acknowledge_alert(self, alert_id):
+        self.queue.put((self._write_acknowledged, (alert_id,)))
+
+    def save_patients(self, patient_ids):
+        """Register patient ids (details can be added later with save_patient)"""
+        self.queue.put((self._write_patient_ids, (list(patient_ids),)))
+
+    def save_patient(self, patient_id, patient):
+        """Store the details of a Patient model"""
+        self.queue.put((self._write_patient, (patient_id, patient.to_dict())))
+
+    def flush(self, timeout=None):
+        """Wait until everything queued so far is committed"""
+        done = threading.Event()
+        # Set by the writer once the transaction holding the earlier writes has committed
+        self.queue.put((None, done))
+        return done.wait(timeout)
+
+    def _run(self):
+        conn = self.writer
+        while True:
+            tasks = [self.queue.get()]
+            # Everything that piled up while the last transaction ran goes into this one
+            while True:
+                try:
+                    tasks.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            flushed = [args for write, args in tasks if write is None]
+            try:
+                with conn:
+                    for write, args in tasks:
+                        if write is not None:
+                            write(conn, *args)
+                self.transactions += 1
+            except sqlite3.Error as e:
+                self.errors += 1
+                print(f"Database write failed: {e}")
+            for done in flushed:
+                done.set()
+
+    @staticmethod
+    def _write_readings(conn, patient_ids, timestamps, columns):
+        conn.executemany(
+            'INSERT INTO vitals (patient_id, timestamp, heart_rate, spo2, temperature, respiratory_rate) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            zip(patient_ids, timestamps.tolist(), *(column.tolist() for column in columns))
+        )
+
+    @staticmethod
+    def _write_alert(conn, alert):
+        created = datetime.fromisoformat(alert['timestamp']).timestamp()
+        conn.execute(
+            'INSERT OR REPLACE INTO alerts (id, patient_id, type, vital, value, message, timestamp, created, acknowledged) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (alert['id'], alert['patient_id'], alert['type'], alert['vital'], alert['value'],
+             alert['message'], alert['timestamp'], created, int(alert['acknowledged']))
+        )
+
+    @staticmethod
+    def _write_acknowledged(conn, alert_id):
+        conn.execute('UPDATE alerts SET acknowledged = 1 WHERE id = ?', (alert_id,))
+
+    @staticmethod
+    def _write_patient_ids(conn, patient_ids):
+        conn.executemany('INSERT OR IGNORE INTO patients (patient_id) VALUES (?)', ((pid,) for pid in patient_ids))
+
+    @staticmethod
+    def _write_patient(conn, patient_id, patient):
+        conn.execute(
+            f"INSERT OR REPLACE INTO patients (patient_id, {', '.join(PATIENT_FIELDS)}) "
+            f"VALUES (?{', ?' * len(PATIENT_FIELDS)})",
+            (patient_id, *(patient.get(name) for name in PATIENT_FIELDS))
+        )
+
+    # Reads
+
+    def vitals_range(self, patient_id, start=None, end=None, limit=None):
+        """Readings of one patient between two epoch timestamps as columns, oldest first"""
+        sql = 'SELECT timestamp, heart_rate, spo2, temperature, respiratory_rate FROM vitals WHERE patient_id = ?'
+        params = [patient_id]
+        if start is not None:
+            sql += ' AND timestamp >= ?'
+            params.append(start)
+        if end is not None:
+            sql += ' AND timestamp <= ?'
+            params.append(end)
+        if limit:
+            # Newest `limit` readings, returned oldest first
+            sql = f'SELECT * FROM ({sql} ORDER BY timestamp DESC LIMIT ?) ORDER BY timestamp'
+            params.append(limit)
+        else:
+            sql += ' ORDER BY timestamp'
+        rows = self._reader().execute(sql, params).fetchall()
+        data = np.array(rows, dtype=np.float64).reshape(-1, len(VITAL_COLUMNS) + 1)
+        return {name: data[:, i] for i, name in enumerate(('timestamp', *VITAL_COLUMNS))}
+
+    def vitals_page(self, patient_id, start=None, end=None, after=None, limit=10000):
+        """One page of readings in time order plus the cursor of the next page (None at the end).
+
+        The cursor is the (timestamp, rowid) of the last row returned, so
+        each page is an index seek rather than an OFFSET scan.
+        """
+        sql = ('SELECT timestamp, heart_rate, spo2, temperature, respiratory_rate, rowid FROM vitals '
+               'WHERE patient_id = ? AND timestamp >= ? AND timestamp <= ?')
+        params = [patient_id, -float('inf') if start is None else start, float('inf') if end is None else end]
+        if after is not None:
+            sql += ' AND (timestamp, rowid) > (?, ?)'
+            params.extend(after)
+        rows = self._reader().execute(sql + ' ORDER BY timestamp, rowid LIMIT ?', (*params, limit)).fetchall()
+        data = np.array(rows, dtype=np.float64).reshape(-1, len(VITAL_COLUMNS) + 2)
+        columns = {name: data[:, i] for i, name in enumerate(('timestamp', *VITAL_COLUMNS))}
+        cursor = (rows[-1][0], rows[-1][-1]) if len(rows) == limit else None
+        return columns, cursor
+
+    def alerts_page(self, patient_ids=None, start=None, end=None, after_id=0, limit=10000):
+        """Alerts with ids above after_id in id order, optionally for some patients and a time range"""
+        conditions, params = ['id > ?'], [after_id]
+        if patient_ids:
+            conditions.append(f"patient_id IN ({', '.join('?' * len(patient_ids))})")
+            params.extend(patient_ids)
+        if start is not None:
+            conditions.append('created >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('created <= ?')
+            params.append(end)
+        rows = self._reader().execute(
+            f"SELECT {', '.join(ALERT_COLUMNS)} FROM alerts WHERE {' AND '.join(conditions)} ORDER BY id LIMIT ?",
+            (*params, limit)
+        ).fetchall()
+        return [self._alert_dict(row) for row in rows]
+
+    def search_alerts(self, patient_id=None, vital=None, alert_type=None, start=None, end=None,
+                      acknowledged=None, limit=100):
+        """Alerts matching every given filter, newest first"""
+        conditions, params = [], []
+        for column, value in (('patient_id', patient_id), ('vital', vital), ('type', alert_type)):
+            if value is not None:
+                conditions.append(f'{column} = ?')
+                params.append(value)
+        if start is not None:
+            conditions.append('created >= ?')
+            params.append(start)
+        if end is not None:
+            conditions.append('created <= ?')
+            params.append(end)
+        if acknowledged is not None:
+            conditions.append('acknowledged = ?')
+            params.append(int(acknowledged))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = self._reader().execute(
+            f"SELECT {', '.join(ALERT_COLUMNS)} FROM alerts{where} ORDER BY id DESC LIMIT ?", (*params, limit)
+        ).fetchall()
+        return [self._alert_dict(row) for row in rows]
+
+    def first_timestamp(self, patient_id):
+        """Timestamp of a patient's oldest stored reading, or None without readings"""
+        return self._reader().execute(
+            'SELECT MIN(timestamp) FROM vitals WHERE patient_id = ?', (patient_id,)
+        ).fetchone()[0]
+
+    def get_alert(self, alert_id):
+        row = self._reader().execute(
+            f"SELECT {', '.join(ALERT_COLUMNS)} FROM alerts WHERE id = ?", (alert_id,)
+        ).fetchone()
+        return None if row is None else self._alert_dict(row)
+
+    @staticmethod
+    def _alert_dict(row):
+        alert = dict(zip(ALERT_COLUMNS, row))
+        alert['acknowledged'] = bool(alert['acknowledged'])
+        return alert
+
+    def get_patient(self, patient_id):
+        row = self._reader().execute(
+            f"SELECT {', '.join(PATIENT_FIELDS)} FROM patients WHERE patient_id = ?", (patient_id,)
+        ).fetchone()
+        return None if row is None else dict(zip(PATIENT_FIELDS, row))
+
+    def max_alert_id(self):
+        """Highest alert id stored, so ids keep growing across restarts"""
+        return self._reader().execute('SELECT COALESCE(MAX(id), 0) FROM alerts').fetchone()[0]
+
+    def stats(self):
+        return {'pending': self.queue.qsize(), 'transactions': self.transactions, 'errors': self.errors}
@@ -1,13 +1,28 @@
-from flask import Blueprint, jsonify, request, send_file
+from flask import Blueprint, Response, jsonify, request, send_file, stream_with_context
 from datetime import datetime
-from src.services import vitals_simulator, ai_assistant, report_generator
+import hashlib
+import json
+import os
+import tempfile
+from src.services import state_backend, ai_assistant, report_generator, data_exporter
+from src.services.chat_jobs import ChatQueueFull, chat_jobs as local_chat_jobs
+from src.services.export_service import EXPORT_FORMATS
+from src.services.event_bus import Event
+from src.services.vitals_service import DEFAULT_PATIENT_ID
+from src.services.vitals_ingest import parse_batch, validate_batch
+from src.services.vitals_wire import WIRE_MIMETYPE, encode_readings
 from src.models import Patient
+from src.utils import Config, parse_timestamp, export_vitals_columnar
+from src.utils.helpers import COLUMNAR_FORMATS
+
+# The simulator, or a stand-in that forwards to the worker running it
+vitals_simulator = state_backend.simulator
 
 # Create blueprint
 api_bp = Blueprint('api', __name__, url_prefix='/api')
 
-# Patient information
-patient_info = Patient(
+# Patient information, stored in the database (when one is attached) on first start
+default_patient = Patient(
     name='John Doe',
     age=65,
     gender='Male',
@@ -16,13 +31,78 @@ patient_info = Patient(
     condition='Cancer',
     attending_doctor='Dr. Sarah Wilson',
     nurse='Emily Johnson'
-).to_dict()
+)
+patient_info = default_patient.to_dict()
+state_backend.on_leader(lambda: vitals_simulator.get_patient(DEFAULT_PATIENT_ID)
+                        or vitals_simulator.save_patient(DEFAULT_PATIENT_ID, default_patient))
+
+def current_patient_info():
+    """Details of the default patient as stored in the database, else the built-in ones"""
+    return vitals_simulator.get_patient(DEFAULT_PATIENT_ID) or patient_info
+
+# Chat jobs run next to the simulation, so a job can be polled through any worker
+chat_jobs = state_backend.chat_jobs
+# Finished chat jobs are also pushed to the event stream of the patient they are about
+local_chat_jobs.on_done = lambda job: vitals_simulator.events.publish('chat', job.to_dict(), job.patient_id)
+
+def unknown_patient(error):
+    """Build the response for a patient id the simulator does not know"""
+    return jsonify({'error': 'Unknown patient', 'details': error.args[0]}), 404
+
+def conditional_json(etag, build):
+    """Answer 304 when the client already holds this ETag, otherwise jsonify build()"""
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    # Let browsers keep the body but revalidate it on every poll
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @api_bp.route('/vitals')
 def get_vitals():
     """Get current vital signs"""
     vitals_simulator.start_simulation()  # Start controlled simulation
-    return jsonify(vitals_simulator.get_current_vitals())
+    patient_id = request.args.get('patient_id')
+    try:
+        version = vitals_simulator.get_vitals_version(patient_id)
+    except KeyError as e:
+        return unknown_patient(e)
+    return conditional_json(f'{vitals_simulator.epoch}-v{version}',
+                            lambda: vitals_simulator.get_current_vitals(patient_id))
+
+@api_bp.route('/stream')
+def stream_events():
+    """Server-Sent Events stream of vitals and alerts for the requested patients"""
+    vitals_simulator.start_simulation()
+    patient_ids = request.args.getlist('patient_id') or [DEFAULT_PATIENT_ID]
+    try:
+        snapshot = [Event('vitals', vitals_simulator.get_current_vitals(pid), pid) for pid in patient_ids]
+    except KeyError as e:
+        return unknown_patient(e)
+
+    events = vitals_simulator.events
+    subscriber = events.subscribe(patient_ids)
+
+    def generate():
+        try:
+            # Send current vitals right away instead of waiting for the next tick
+            for event in snapshot:
+                yield event.sse
+            while not subscriber.closed:
+                event = subscriber.get(timeout=15)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                elif not subscriber.closed:
+                    yield event.sse
+        finally:
+            events.unsubscribe(subscriber)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @api_bp.route('/health')
 def health_check():
@@ -36,18 +116,157 @@ def health_check():
 
 @api_bp.route('/vitals/history')
 def get_vitals_history():
-    """Get historical vital signs data"""
-    return jsonify(vitals_simulator.get_vitals_history())
+    """Get historical vital signs data, optionally between ?start= and ?end="""
+    # Deltas: only the readings recorded after the version the client last saw
+    since = request.args.get('since', type=int)
+    if since is not None:
+        try:
+            return jsonify(vitals_simulator.get_vitals_since(since, request.args.get('patient_id')))
+        except KeyError as e:
+            return unknown_patient(e)
+
+    try:
+        start = parse_timestamp(request.args.get('start'))
+        end = parse_timestamp(request.args.get('end'))
+    except ValueError as e:
+        return jsonify({'error': 'Invalid time range', 'details': str(e)}), 400
+
+    # Summaries: pick the rollup tier from ?resolution= (seconds) or ?points= over the range
+    resolution = request.args.get('resolution', type=float)
+    points = request.args.get('points', type=int)
+    if resolution is not None or points is not None:
+        if (points is not None and points <= 0) or (resolution is not None and resolution < 0):
+            return jsonify({'error': 'Invalid resolution', 'details': 'points must be positive and resolution non-negative'}), 400
+        patient_id = request.args.get('patient_id')
+        try:
+            if resolution is None:
+                # Without a start the range begins at the oldest reading still stored
+                first = start if start is not None else vitals_simulator.get_first_timestamp(patient_id)
+                now = end if end is not None else datetime.now().timestamp()
+                resolution = max(now - first, 0) / points if first is not None else 0
+            return jsonify(vitals_simulator.get_vitals_rollup(
+                patient_id, start=start, end=end, resolution=resolution
+            ))
+        except KeyError as e:
+            return unknown_patient(e)
+
+    # A time range returns every reading in it unless a limit is given
+    default_limit = 20 if start is None and end is None else None
+    limit = request.args.get('limit', default_limit, type=int)
+    patient_id = request.args.get('patient_id')
+    try:
+        if request.accept_mimetypes.best_match(['application/json', WIRE_MIMETYPE]) == WIRE_MIMETYPE:
+            columns = vitals_simulator.get_history_columns(limit, patient_id, start=start, end=end)
+            return Response(encode_readings(patient_id or DEFAULT_PATIENT_ID, columns), mimetype=WIRE_MIMETYPE)
+        return jsonify(vitals_simulator.get_vitals_history(limit, patient_id, start=start, end=end))
+    except KeyError as e:
+        return unknown_patient(e)
+
+@api_bp.route('/vitals/trends')
+def get_vital_trends():
+    """Rolling EWMA, mean/std, min/max and slope of each vital for ?patient_id="""
+    try:
+        return jsonify(vitals_simulator.get_vital_trends(request.args.get('patient_id')))
+    except KeyError as e:
+        return unknown_patient(e)
+
+@api_bp.route('/ward/scores')
+def get_ward_scores():
+    """Every bed ranked by early-warning score (?limit=, ?min_score=)"""
+    return jsonify(vitals_simulator.get_ward_scores(
+        request.args.get('limit', type=int), request.args.get('min_score', 0, type=int)
+    ))
+
+@api_bp.route('/vitals/ingest', methods=['POST'])
+def ingest_vitals():
+    """Record a batch of device readings sent as a JSON array, NDJSON or columnar JSON"""
+    try:
+        columns = parse_batch(request.get_data(), request.mimetype)
+    except ValueError as e:
+        return jsonify({'error': 'Invalid batch', 'details': str(e)}), 400
+
+    size = len(columns['patient_id'])
+    if size > Config.INGEST_MAX_READINGS:
+        return jsonify({
+            'error': 'Batch too large',
+            'details': f"{size} readings; at most {Config.INGEST_MAX_READINGS} per request"
+        }), 413
+
+    batch = validate_batch(columns)
+    result = vitals_simulator.ingest_readings(batch.patient_ids, batch.timestamps, batch.values)
+    result.update({'rejected': batch.rejected, 'errors': batch.errors})
+    return jsonify(result), 200 if len(batch) or not size else 422
+
+@api_bp.route('/thresholds')
+def get_thresholds():
+    """Get the vital sign ranges used for classification"""
+    try:
+        return jsonify(vitals_simulator.get_thresholds(request.args.get('patient_id')))
+    except KeyError as e:
+        return unknown_patient(e)
+
+@api_bp.route('/thresholds', methods=['POST'])
+def set_thresholds():
+    """Override the normal and/or warning range of one vital for one patient"""
+    data = request.get_json(silent=True) or {}
+    try:
+        thresholds = vitals_simulator.set_patient_thresholds(
+            data.get('patient_id'),
+            data.get('vital'),
+            normal=data.get('normal'),
+            warning=data.get('warning')
+        )
+        return jsonify({'success': True, 'thresholds': thresholds})
+    except KeyError as e:
+        return jsonify({'error': 'Unknown patient or vital', 'details': e.args[0]}), 404
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': 'Invalid range', 'details': str(e)}), 400
 
 @api_bp.route('/patient')
 def get_patient_info():
     """Get patient information"""
-    return jsonify(patient_info)
+    patient = current_patient_info()
+    etag = hashlib.sha1(json.dumps(patient, sort_keys=True).encode()).hexdigest()[:16]
+    return conditional_json(etag, lambda: patient)
 
 @api_bp.route('/alerts')
 def get_alerts():
-    """Get current alerts"""
-    return jsonify(vitals_simulator.get_alerts())
+    """Get current alerts, or only those added after ?since=<alert id>"""
+    patient_id = request.args.get('patient_id')
+    since = request.args.get('since', type=int)
+    if since is not None:
+        return jsonify(vitals_simulator.get_alerts_since(since, patient_id))
+    return conditional_json(f'{vitals_simulator.epoch}-a{vitals_simulator.get_alerts_version()}',
+                            lambda: vitals_simulator.get_alerts(patient_id=patient_id))
+
+@api_bp.route('/alerts/<int:alert_id>/acknowledge', methods=['POST'])
+def acknowledge_alert(alert_id):
+    """Mark an alert as acknowledged"""
+    alert = vitals_simulator.acknowledge_alert(alert_id)
+    if alert is None:
+        return jsonify({'error': 'Unknown alert', 'details': f'No alert with id {alert_id}'}), 404
+    return jsonify({'success': True, 'alert': alert})
+
+@api_bp.route('/alerts/search')
+def search_alerts():
+    """Search alerts by patient, vital, type, time range and acknowledgement"""
+    try:
+        start = parse_timestamp(request.args.get('start'))
+        end = parse_timestamp(request.args.get('end'))
+    except ValueError as e:
+        return jsonify({'error': 'Invalid time range', 'details': str(e)}), 400
+    acknowledged = request.args.get('acknowledged')
+    if acknowledged is not None:
+        acknowledged = acknowledged.lower() == 'true'
+    return jsonify(vitals_simulator.search_alerts(
+        patient_id=request.args.get('patient_id'),
+        vital=request.args.get('vital'),
+        alert_type=request.args.get('type'),
+        start=start,
+        end=end,
+        acknowledged=acknowledged,
+        limit=request.args.get('limit', 100, type=int)
+    ))
 
 @api_bp.route('/alerts/clear', methods=['POST'])
 def clear_alerts():
@@ -70,15 +289,38 @@ def chat_with_ai():
         
         current_vitals = vitals_simulator.get_current_vitals()
         alerts = vitals_simulator.get_alerts()
+        patient = current_patient_info()
         
-        response = ai_assistant.chat(
-            user_message, 
-            patient_info, 
-            current_vitals, 
-            len(alerts)
-        )
+        # Stream the answer as Server-Sent Events when asked to
+        if data.get('stream') or 'text/event-stream' in request.headers.get('Accept', ''):
+            chunks = ai_assistant.chat_stream(
+                user_message,
+                patient,
+                current_vitals,
+                len(alerts),
+                patient_id=DEFAULT_PATIENT_ID
+            )
+            events = (Event('done' if chunk.get('done') else 'token', chunk).sse for chunk in chunks)
+            return Response(stream_with_context(events), mimetype='text/event-stream', headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            })
+        
+        # Otherwise the answer is prepared in the background: poll the job or watch for a 'chat' event
+        try:
+            job = chat_jobs.submit(
+                user_message,
+                patient,
+                current_vitals,
+                len(alerts),
+                patient_id=DEFAULT_PATIENT_ID
+            )
+        except ChatQueueFull as e:
+            response = jsonify({'error': 'Chat queue is full', 'details': str(e)})
+            response.headers['Retry-After'] = '5'
+            return response, 503
         
-        return jsonify(response)
+        return jsonify({**job.to_dict(), 'status_url': f'/api/chat/{job.id}'}), 202
         
     except Exception as e:
         return jsonify({
@@ -86,15 +328,24 @@ def chat_with_ai():
             'details': str(e)
         }), 500
 
+@api_bp.route('/chat/<job_id>')
+def get_chat_job(job_id):
+    """Status of a chat job, with the answer once it is done"""
+    job = chat_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown chat job', 'details': f'No chat job {job_id}, or it has expired'}), 404
+    return jsonify(job.to_dict())
+
 @api_bp.route('/report/generate', methods=['POST'])
 def generate_patient_report():
     """Generate a PDF patient report"""
     try:
         current_vitals = vitals_simulator.get_current_vitals()
         alerts = vitals_simulator.get_alerts()
+        patient = current_patient_info()
         
         buffer = report_generator.generate_patient_report(
-            patient_info,
+            patient,
             current_vitals,
             alerts,
             vitals_simulator.get_vital_status
@@ -103,7 +354,7 @@ def generate_patient_report():
         return send_file(
             buffer,
             as_attachment=True,
-            download_name=f"patient_report_{patient_info['name'].replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
+            download_name=f"patient_report_{patient['name'].replace(' ', '_')}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf",
             mimetype='application/pdf'
         )
         
@@ -113,11 +364,72 @@ def generate_patient_report():
             'details': str(e)
         }), 500
 
+def export_response(name, build, formats=EXPORT_FORMATS):
+    """Stream an export chosen by ?format=, ?start=/&end= and ?patient_id= (repeatable), gzipped with ?gzip=true"""
+    fmt = request.args.get('format', 'csv')
+    if fmt not in formats:
+        return jsonify({'error': 'Unsupported format', 'details': f"Use one of: {', '.join(formats)}"}), 400
+    try:
+        start = parse_timestamp(request.args.get('start'))
+        end = parse_timestamp(request.args.get('end'))
+    except ValueError as e:
+        return jsonify({'error': 'Invalid time range', 'details': str(e)}), 400
+    patient_ids = request.args.getlist('patient_id')
+    try:
+        for patient_id in patient_ids:
+            vitals_simulator.get_patient_row(patient_id)
+    except KeyError as e:
+        return unknown_patient(e)
+
+    if fmt in COLUMNAR_FORMATS:
+        return columnar_response(name, patient_ids, start, end, fmt)
+    chunks = build(patient_ids, start, end, fmt)
+    headers = {
+        'Content-Disposition': f"attachment; filename={name}_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}",
+        'X-Accel-Buffering': 'no'
+    }
+    if request.args.get('gzip', 'false').lower() == 'true':
+        chunks = data_exporter.gzip(chunks)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(stream_with_context(chunks), mimetype=EXPORT_FORMATS[fmt], headers=headers)
+
+def columnar_response(name, patient_ids, start, end, fmt):
+    """Send vitals as an Arrow IPC or .npz file, written page by page to a temporary file first"""
+    patient_ids = patient_ids or vitals_simulator.get_patient_ids()
+    fd, path = tempfile.mkstemp(suffix=f'.{fmt}')
+    os.close(fd)
+    try:
+        export_vitals_columnar(data_exporter.vitals_pages(vitals_simulator, patient_ids, start, end),
+                               patient_ids, path, fmt)
+        f = open(path, 'rb')
+    except ValueError as e:
+        return jsonify({'error': 'Unsupported format', 'details': str(e)}), 400
+    finally:
+        # The open file keeps the data readable until the response is sent
+        os.remove(path)
+    return send_file(f, mimetype=COLUMNAR_FORMATS[fmt], as_attachment=True,
+                     download_name=f"{name}_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}")
+
+@api_bp.route('/export/vitals')
+def export_vitals():
+    """Stream vitals readings of the selected patients (default: all) as CSV or NDJSON, or send them as Arrow/.npz"""
+    return export_response('vitals', lambda patient_ids, start, end, fmt: data_exporter.vitals(
+        vitals_simulator, patient_ids or vitals_simulator.get_patient_ids(), start, end, fmt
+    ), {**EXPORT_FORMATS, **COLUMNAR_FORMATS})
+
+@api_bp.route('/export/alerts')
+def export_alerts():
+    """Stream alerts of the selected patients (default: all) as CSV or NDJSON"""
+    return export_response('alerts', lambda patient_ids, start, end, fmt: data_exporter.alerts(
+        vitals_simulator, patient_ids, start, end, fmt
+    ))
+
 @api_bp.route('/system/status')
 def system_status():
     """Get system status including AI API availability"""
     try:
-        ai_status = ai_assistant.check_api_status()
+        # Checked in the background; the snapshot says how old it is
+        ai_status = ai_assistant.provider_status.snapshot()
         alerts = vitals_simulator.get_alerts()
         vitals_history = vitals_simulator.get_vitals_history(100)
         
@@ -126,8 +438,14 @@ def system_status():
             'ai_api_available': ai_status['api_available'],
             'phi3_available': ai_status['phi3_available'],
             'ai_provider': ai_status['provider'],
+            'ai_status_checked_at': ai_status['checked_at'],
+            'ai_status_age_seconds': ai_status['age_seconds'],
+            'ai_cache': ai_assistant.cache.stats(),
+            'ai_http': ai_assistant.http.stats(),
+            'chat_jobs': chat_jobs.stats(),
             'total_alerts': len(alerts),
             'vitals_history_count': len(vitals_history),
+            'simulation_ticks': vitals_simulator.get_tick_stats(),
             'system_time': datetime.now().isoformat()
         })
     except Exception as e:
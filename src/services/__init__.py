@@ -1,6 +1,11 @@
 # Services package
 from .vitals_service import vitals_simulator
 from .ai_service import ai_assistant
+from .chat_jobs import chat_jobs
 from .report_service import report_generator
+from .export_service import data_exporter
+from .websocket_hub import websocket_hub
+from .state_backend import state_backend
+from .vitals_wal import vitals_wal
 
-__all__ = ['vitals_simulator', 'ai_assistant', 'report_generator']
+__all__ = ['vitals_simulator', 'ai_assistant', 'chat_jobs', 'report_generator', 'data_exporter', 'websocket_hub', 'state_backend', 'vitals_wal']
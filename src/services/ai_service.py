@@ -1,77 +1,205 @@
-import requests
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
+from src.utils.config import Config
+from .http_client import PooledClient
+
+PROVIDER_NAME = 'OpenRouter (Phi-3.5 Mini 128K Instruct)'
+
+# Vitals are rounded to these steps for cache keys, so readings that moved by
+# less than a step still share cached answers
+VITAL_BUCKETS = {'heart_rate': 5, 'spo2': 1, 'temperature': 0.2, 'respiratory_rate': 2}
+
+def normalize_question(message):
+    """Lowercase, collapse whitespace and drop trailing punctuation"""
+    return re.sub(r'\s+', ' ', message).strip().rstrip('?!.').strip().lower()
+
+def vitals_bucket(vitals):
+    """Vitals rounded to VITAL_BUCKETS steps"""
+    return tuple(int(round(vitals[name] / step)) for name, step in VITAL_BUCKETS.items())
+
+def completion_deltas(response):
+    """Content deltas of a streamed (server-sent events) chat completion, in order"""
+    response.encoding = 'utf-8'
+    for line in response.iter_lines(decode_unicode=True):
+        # Blank lines separate events; lines starting with ':' are keep-alive comments
+        if not line or not line.startswith('data:'):
+            continue
+        data = line[5:].strip()
+        if data == '[DONE]':
+            return
+        chunk = json.loads(data)
+        if 'error' in chunk:
+            raise Exception(f"API Error: {chunk['error'].get('message', chunk['error'])}")
+        choices = chunk.get('choices') or [{}]
+        delta = choices[0].get('delta', {}).get('content')
+        if delta:
+            yield delta
+
+def text_chunks(text):
+    """Words of a text with their trailing whitespace, streamed like model tokens"""
+    return re.findall(r'\S+\s*|\s+', text)
+
+class ResponseCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, max_entries=256, ttl=60, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()   # key -> (expires at, value), least recently used first
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= self.clock():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = (self.clock() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+class ProviderStatus:
+    """Provider and model availability, refreshed in the background every interval seconds"""
+
+    def __init__(self, check, interval=60, clock=time.monotonic):
+        self.check = check
+        self.interval = interval
+        self.clock = clock
+        # (checked at, status), replaced whole so readers never wait for a check
+        self.latest = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Start the refresh thread if it is not running; cheap to call repeatedly"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._run, name='ai-status', daemon=True)
+                self.thread.start()
+
+    def refresh(self):
+        """Check the provider now and keep the result"""
+        started = self.clock()
+        status = self.check()
+        checked = self.clock()
+        self.latest = (checked, {
+            **status,
+            'checked_at': datetime.now().isoformat(),
+            'check_ms': round((checked - started) * 1000, 1)
+        })
+
+    def _run(self):
+        while True:
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"AI status check failed: {e}")
+            time.sleep(self.interval)
+
+    def snapshot(self):
+        """The last status and its age in seconds; availability is None until the first check ends"""
+        self.start()
+        latest = self.latest
+        if latest is None:
+            return {'api_available': None, 'phi3_available': None, 'provider': PROVIDER_NAME,
+                    'checked_at': None, 'check_ms': None, 'age_seconds': None}
+        checked, status = latest
+        return {**status, 'age_seconds': round(self.clock() - checked, 1)}
 
 class AIAssistant:
     """Handles AI chat functionality using Phi-3.5 Mini 128K Instruct via OpenRouter API"""
     
-    def __init__(self):
-        self.api_key = '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'
-        self.base_url = 'https://openrouter.ai/api/v1/chat/completions'
-        self.model = 'microsoft/phi-3.5-mini-128k-instruct'
+    def __init__(self, api_key=None, base_url=None, model=None):
+        self.api_key = api_key or Config.OPENROUTER_API_KEY
+        self.model = model or Config.AI_MODEL
+        # One keep-alive session for every call, cut off while OpenRouter keeps failing
+        self.http = PooledClient(
+            base_url or Config.AI_BASE_URL,
+            headers={
+                'Authorization': f'Bearer {self.api_key}',
+                'HTTP-Referer': 'http://localhost:5000',
+                'X-Title': 'Kognicare Patient Monitoring'
+            },
+            pool_size=Config.AI_POOL_SIZE,
+            max_concurrent=Config.AI_MAX_CONCURRENT,
+            timeout=Config.AI_TIMEOUT,
+            failure_threshold=Config.AI_BREAKER_FAILURES,
+            reset_timeout=Config.AI_BREAKER_RESET,
+            probe_path='/models'
+        )
         
         self.system_prompt = """You are a medical AI assistant helping healthcare professionals monitor patients. 
         Provide helpful, professional medical insights while always recommending consulting with a doctor for medical decisions.
         Keep responses concise but informative."""
+        self.cache = ResponseCache(Config.AI_CACHE_SIZE, Config.AI_CACHE_TTL)
+        # Status pages read this instead of fetching the model catalogue per request
+        self.provider_status = ProviderStatus(self.check_api_status, Config.AI_STATUS_INTERVAL)
     
-    def chat(self, user_message, patient_info, current_vitals, alerts_count):
+    def chat(self, user_message, patient_info, current_vitals, alerts_count, patient_id=None):
         """Process chat message with AI assistant"""
         try:
-            user_context = f"""
-            Current Patient: {patient_info['name']}
-            Current Vitals: Heart Rate: {current_vitals['heart_rate']} BPM, SpO2: {current_vitals['spo2']}%, 
-            Temperature: {current_vitals['temperature']}°C, Respiratory Rate: {current_vitals['respiratory_rate']} BPM
-            
-            Recent Alerts: {alerts_count} total alerts
-            
-            Question: {user_message}
-            """
+            # The same question about unchanged vitals gets the answer given moments ago
+            cache_key = self._cache_key(user_message, patient_info, current_vitals, alerts_count, patient_id)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return {**cached, 'cached': True}
+
+            user_context = self._user_context(user_message, patient_info, current_vitals, alerts_count)
             
             # Try to call OpenRouter API with Phi-3.5 Mini 128K Instruct
             try:
-                api_response = requests.post(
-                    self.base_url,
-                    headers={
-                        'Authorization': f'Bearer {self.api_key}',
-                        'Content-Type': 'application/json',
-                        'HTTP-Referer': 'http://localhost:5000',
-                        'X-Title': 'Kognicare Patient Monitoring'
-                    },
-                    json={
-                        'model': self.model,
-                        'messages': [
-                            {'role': 'system', 'content': self.system_prompt},
-                            {'role': 'user', 'content': user_context}
-                        ],
-                        'max_tokens': 500,
-                        'temperature': 0.7
-                    },
-                    timeout=30
-                )
+                api_response = self.http.post('/chat/completions', json=self._completion_request(user_context))
                 
                 if api_response.status_code == 200:
                     response_data = api_response.json()
                     ai_response = response_data['choices'][0]['message']['content']
+                    # Only real answers are cached; fallbacks would hide the API coming back
+                    self.cache.put(cache_key, {'response': ai_response, 'timestamp': datetime.now().isoformat()})
                 else:
                     raise Exception(f"API Error: {api_response.status_code}")
                     
             except Exception as e:
                 print(f"AI API Error: {e}")
-                # Fallback response if API is not available
-                ai_response = f"""I'm currently operating in fallback mode. Based on your question about "{user_message}", here are some general insights:
-
-Current patient status: Heart Rate {current_vitals['heart_rate']} BPM, SpO2 {current_vitals['spo2']}%, Temp {current_vitals['temperature']}°C
-
-Key recommendations:
-- Continue monitoring vital signs closely
-- Watch for any trending changes in heart rate or oxygen saturation
-- Ensure patient comfort and proper positioning
-- Maintain communication with attending physician
-
-Please consult with {patient_info['attending_doctor']} for any specific medical concerns or decisions."""
+                ai_response = self._fallback_response(user_message, patient_info, current_vitals)
 
             return {
                 'response': ai_response,
-                'timestamp': datetime.now().isoformat()
+                'timestamp': datetime.now().isoformat(),
+                'cached': False
             }
             
         except Exception as e:
@@ -79,15 +207,94 @@ Please consult with {patient_info['attending_doctor']} for any specific medical
                 'error': 'Failed to process chat request',
                 'details': str(e)
             }
+
+    def chat_stream(self, user_message, patient_info, current_vitals, alerts_count, patient_id=None):
+        """Process chat message, yielding the answer as it is generated.
+
+        Yields ``{'delta': text}`` for each piece of the answer, then one
+        ``{'done': True, ...}`` with the same metadata chat() returns.
+        """
+        cache_key = self._cache_key(user_message, patient_info, current_vitals, alerts_count, patient_id)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            yield {'delta': cached['response']}
+            yield {'done': True, 'timestamp': cached['timestamp'], 'cached': True}
+            return
+
+        user_context = self._user_context(user_message, patient_info, current_vitals, alerts_count)
+        parts = []
+        try:
+            request_body = self._completion_request(user_context, stream=True)
+            with self.http.stream('POST', '/chat/completions', json=request_body) as api_response:
+                if api_response.status_code != 200:
+                    raise Exception(f"API Error: {api_response.status_code}")
+                for delta in completion_deltas(api_response):
+                    parts.append(delta)
+                    yield {'delta': delta}
+        except Exception as e:
+            print(f"AI API Error: {e}")
+            if parts:
+                # Part of the answer is already on screen: end it there rather than append the fallback
+                yield {'done': True, 'timestamp': datetime.now().isoformat(), 'cached': False, 'error': str(e)}
+                return
+            for chunk in text_chunks(self._fallback_response(user_message, patient_info, current_vitals)):
+                yield {'delta': chunk}
+            yield {'done': True, 'timestamp': datetime.now().isoformat(), 'cached': False}
+            return
+
+        timestamp = datetime.now().isoformat()
+        self.cache.put(cache_key, {'response': ''.join(parts), 'timestamp': timestamp})
+        yield {'done': True, 'timestamp': timestamp, 'cached': False}
+
+    def _cache_key(self, user_message, patient_info, current_vitals, alerts_count, patient_id):
+        return (
+            normalize_question(user_message), patient_id or patient_info.get('name'),
+            vitals_bucket(current_vitals), int(alerts_count).bit_length()
+        )
+
+    def _user_context(self, user_message, patient_info, current_vitals, alerts_count):
+        return f"""
+            Current Patient: {patient_info['name']}
+            Current Vitals: Heart Rate: {current_vitals['heart_rate']} BPM, SpO2: {current_vitals['spo2']}%, 
+            Temperature: {current_vitals['temperature']}°C, Respiratory Rate: {current_vitals['respiratory_rate']} BPM
+            
+            Recent Alerts: {alerts_count} total alerts
+            
+            Question: {user_message}
+            """
+
+    def _completion_request(self, user_context, stream=False):
+        request_body = {
+            'model': self.model,
+            'messages': [
+                {'role': 'system', 'content': self.system_prompt},
+                {'role': 'user', 'content': user_context}
+            ],
+            'max_tokens': 500,
+            'temperature': 0.7
+        }
+        if stream:
+            request_body['stream'] = True
+        return request_body
+
+    def _fallback_response(self, user_message, patient_info, current_vitals):
+        """Fallback response if API is not available"""
+        return f"""I'm currently operating in fallback mode. Based on your question about "{user_message}", here are some general insights:
+
+Current patient status: Heart Rate {current_vitals['heart_rate']} BPM, SpO2 {current_vitals['spo2']}%, Temp {current_vitals['temperature']}°C
+
+Key recommendations:
+- Continue monitoring vital signs closely
+- Watch for any trending changes in heart rate or oxygen saturation
+- Ensure patient comfort and proper positioning
+- Maintain communication with attending physician
+
+Please consult with {patient_info['attending_doctor']} for any specific medical concerns or decisions."""
     
     def check_api_status(self):
         """Check OpenRouter API availability"""
         try:
-            api_status = requests.get(
-                'https://openrouter.ai/api/v1/models', 
-                headers={'Authorization': f'Bearer {self.api_key}'},
-                timeout=5
-            )
+            api_status = self.http.get('/models', timeout=5)
             api_available = api_status.status_code == 200
             
             if api_available:
@@ -103,7 +310,7 @@ Please consult with {patient_info['attending_doctor']} for any specific medical
         return {
             'api_available': api_available,
             'phi3_available': phi_available,
-            'provider': 'OpenRouter (Phi-3.5 Mini 128K Instruct)'
+            'provider': PROVIDER_NAME
         }
 
 # Global instance
@@ -0,0 +1,147 @@
+"""
+Alert storage indexed for de-duplication and expiry
+"""
+import heapq
+import time
+from itertools import islice, takewhile
+
+ANOMALY = 'anomaly'
+
+class AlertStore:
+    """Holds active alerts with O(1) de-duplication and O(log n) expiry.
+
+    The last time each (patient, vital, severity) fired is kept on the
+    monotonic clock, so de-duplication never parses timestamps or scans
+    other alerts. Expiry deadlines sit in a min-heap and are popped as
+    they fall due.
+
+    Anomaly alerts have their own per-patient cap, so a noisy detector can
+    never crowd out warning and critical alerts.
+
+    ``version`` changes whenever the set of alerts does, and alert ids
+    only grow, so clients can poll for the alerts added after an id.
+
+    The store has no lock of its own; the simulator holds its lock for
+    every read and write.
+    """
+
+    def __init__(self, dedupe_seconds=60, retention_seconds=1800, max_per_patient=50, max_anomalies_per_patient=10,
+                 clock=time.monotonic):
+        self.dedupe_seconds = dedupe_seconds
+        self.retention_seconds = retention_seconds
+        self.max_per_patient = max_per_patient
+        self.max_anomalies_per_patient = max_anomalies_per_patient
+        self.clock = clock
+        self.next_id = 1
+        self.version = 0
+        self.cleared_through = 0   # highest id issued when the store was last cleared
+        self._reset()
+
+    def _reset(self):
+        self.alerts = {}        # id -> Alert, in creation order
+        self.by_patient = {}    # patient id -> {id: Alert}, in creation order
+        self.last_fired = {}    # (patient id, vital, severity) -> monotonic time
+        self.counts = {}        # (patient id, is anomaly) -> active alerts, for the caps
+        self.expiry = []        # heap of (expires at, alert id)
+
+    def __len__(self):
+        return len(self.alerts)
+
+    def should_fire(self, patient_id, vital, severity, now=None):
+        """Whether a new alert for this patient/vital/severity is neither a duplicate nor over its cap"""
+        now = self.clock() if now is None else now
+        last = self.last_fired.get((patient_id, vital, severity))
+        if last is not None and now - last < self.dedupe_seconds:
+            return False
+        anomaly = severity == ANOMALY
+        cap = self.max_anomalies_per_patient if anomaly else self.max_per_patient
+        return self.counts.get((patient_id, anomaly), 0) < cap
+
+    def _count(self, alert, change):
+        key = (alert.patient_id, alert.type == ANOMALY)
+        count = self.counts.get(key, 0) + change
+        if count:
+            self.counts[key] = count
+        else:
+            del self.counts[key]
+
+    def add(self, alert, now=None):
+        """Store an alert, assigning its id and scheduling its expiry"""
+        now = self.clock() if now is None else now
+        alert.id = self.next_id
+        self.next_id += 1
+        self.alerts[alert.id] = alert
+        self.by_patient.setdefault(alert.patient_id, {})[alert.id] = alert
+        self._count(alert, 1)
+        self.last_fired[(alert.patient_id, alert.vital, alert.type)] = now
+        heapq.heappush(self.expiry, (now + self.retention_seconds, alert.id))
+        self.version += 1
+        return alert
+
+    def restore(self, alert, fired_at):
+        """Re-add an alert that keeps its id, e.g. when replaying a log"""
+        self.next_id = max(self.next_id, alert.id + 1)
+        if alert.id not in self.alerts:
+            self._count(alert, 1)
+        self.alerts[alert.id] = alert
+        self.by_patient.setdefault(alert.patient_id, {})[alert.id] = alert
+        key = (alert.patient_id, alert.vital, alert.type)
+        self.last_fired[key] = max(fired_at, self.last_fired.get(key, fired_at))
+        heapq.heappush(self.expiry, (fired_at + self.retention_seconds, alert.id))
+        self.version += 1
+
+    def acknowledge(self, alert_id):
+        """Mark an active alert as acknowledged; returns it, or None if it is not active"""
+        alert = self.alerts.get(alert_id)
+        if alert is not None and not alert.acknowledged:
+            alert.acknowledged = True
+            self.version += 1
+        return alert
+
+    def expire(self, now=None):
+        """Drop every alert whose retention period has passed"""
+        now = self.clock() if now is None else now
+        expiry = self.expiry
+        while expiry and expiry[0][0] <= now:
+            _, alert_id = heapq.heappop(expiry)
+            alert = self.alerts.pop(alert_id, None)
+            if alert is None:
+                continue
+            self.version += 1
+            patient_alerts = self.by_patient[alert.patient_id]
+            del patient_alerts[alert_id]
+            if not patient_alerts:
+                del self.by_patient[alert.patient_id]
+            self._count(alert, -1)
+            # An older alert with the same key may already have dropped it
+            key = (alert.patient_id, alert.vital, alert.type)
+            last = self.last_fired.get(key)
+            if last is not None and now - last >= self.dedupe_seconds:
+                del self.last_fired[key]
+
+    def recent(self, limit=10, patient_id=None):
+        """The newest alerts, oldest first, optionally for one patient"""
+        alerts = self.alerts if patient_id is None else self.by_patient.get(patient_id, {})
+        newest = list(islice(reversed(alerts.values()), limit))
+        newest.reverse()
+        return newest
+
+    def since(self, alert_id, patient_id=None):
+        """Alerts added after the given id, oldest first, optionally for one patient"""
+        alerts = self.alerts if patient_id is None else self.by_patient.get(patient_id, {})
+        newer = list(takewhile(lambda alert: alert.id > alert_id, reversed(alerts.values())))
+        newer.reverse()
+        return newer
+
+    @property
+    def last_id(self):
+        """Highest id issued so far"""
+        return self.next_id - 1
+
+    def clear(self):
+        """Remove every alert and forget when alerts last fired"""
+        self._reset()
+        # The clear consumes an id so pollers can tell whether they saw it
+        self.cleared_through = self.next_id
+        self.next_id += 1
+        self.version += 1
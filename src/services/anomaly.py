@@ -0,0 +1,124 @@
+"""
+Online anomaly detection on vitals: rolling z-scores and two-sided CUSUM
+
+Fixed ranges only fire once a value leaves them; a heart rate creeping from
+70 to 95 over an hour never does. Every patient and vital therefore keeps an
+exponentially weighted baseline (mean and variance) and two CUSUM sums of
+the standardized deviation from it:
+
+    z      = (x - mean) / max(std, MIN_STD[vital])
+    s_up   = max(0, s_up   + z - slack)      drift upwards when s_up   > h
+    s_down = max(0, s_down - z - slack)      drift downwards when s_down > h
+
+A single |z| above the z threshold is a spike. The baseline follows the data
+slowly, with deviations clipped at the spike threshold, so a drift
+accumulates in CUSUM before the baseline absorbs it. All state is a handful
+of ``(patients, vitals)`` arrays updated for a whole batch at once; only
+detected anomalies reach Python.
+"""
+import numpy as np
+from .vitals_buffer import batch_ranks
+
+# Smallest standard deviation used for z-scores, roughly the smallest change
+# that matters clinically: vitals that sit on one value would otherwise turn
+# a single-unit change into a huge z
+MIN_STD = {'heart_rate': 5.0, 'spo2': 1.5, 'temperature': 0.2, 'respiratory_rate': 2.0}
+
+SPIKE, DRIFT_UP, DRIFT_DOWN = range(3)
+ANOMALY_KINDS = ('spike', 'drift up', 'drift down')
+
+class AnomalyDetector:
+    """Per-patient, per-vital z-score and CUSUM detectors held in arrays"""
+
+    def __init__(self, vital_fields, z_threshold=4.0, cusum_threshold=12.0, slack=0.5,
+                 alpha=0.02, warmup=20, patients=0):
+        self.vital_fields = tuple(vital_fields)
+        self.z_threshold = z_threshold
+        self.cusum_threshold = cusum_threshold
+        self.slack = slack          # deviations below this many std are not accumulated
+        self.alpha = alpha          # weight of each reading in the baseline
+        self.warmup = warmup        # readings that only build the baseline
+        self.min_std = np.array([MIN_STD.get(name, 1e-3) for name in self.vital_fields], dtype=np.float32)
+        vitals = len(self.vital_fields)
+        self.count = np.zeros(0, dtype=np.int32)
+        self.mean = np.zeros((0, vitals), dtype=np.float32)
+        self.var = np.zeros((0, vitals), dtype=np.float32)
+        self.cusum_up = np.zeros((0, vitals), dtype=np.float32)
+        self.cusum_down = np.zeros((0, vitals), dtype=np.float32)
+        self.resize(patients)
+
+    def resize(self, patients):
+        """Grow the state to hold the given number of patients"""
+        extra = patients - len(self.count)
+        if extra <= 0:
+            return
+        for name in ('count', 'mean', 'var', 'cusum_up', 'cusum_down'):
+            array = getattr(self, name)
+            setattr(self, name, np.concatenate([array, np.zeros((extra, *array.shape[1:]), array.dtype)]))
+
+    def update(self, values, rows=None):
+        """Fold a batch of readings in, in batch order (every patient when rows is omitted).
+
+        Returns the anomalies found as ``(batch index, vital, kind, z)``.
+        """
+        if rows is None:
+            rows = np.arange(len(self.count))
+        rows = np.asarray(rows, dtype=np.int64)
+        x = np.stack([np.broadcast_to(values[name], rows.shape) for name in self.vital_fields],
+                     axis=1).astype(np.float32)
+        ranks = batch_ranks(rows) if len(rows) else rows
+        if not len(rows) or not ranks.max():
+            return self._update(rows, x, np.arange(len(rows)))
+        # A row's readings must be folded in one after another: one pass per rank
+        anomalies = []
+        for rank in range(ranks.max() + 1):
+            selected = np.flatnonzero(ranks == rank)
+            anomalies.extend(self._update(rows[selected], x[selected], selected))
+        return sorted(anomalies, key=lambda anomaly: anomaly[0])
+
+    def _update(self, rows, x, index):
+        """Fold in one reading for each of a set of unique rows"""
+        count = self.count[rows]
+        mean = self.mean[rows]
+        var = self.var[rows]
+        ready = (count >= self.warmup)[:, None]
+
+        std = np.maximum(np.sqrt(var), self.min_std)
+        z = (x - mean) / std
+        cusum_up = np.where(ready, np.maximum(0, self.cusum_up[rows] + z - self.slack), 0)
+        cusum_down = np.where(ready, np.maximum(0, self.cusum_down[rows] - z - self.slack), 0)
+        spike = ready & (np.abs(z) > self.z_threshold)
+        drift_up = cusum_up > self.cusum_threshold
+        drift_down = cusum_down > self.cusum_threshold
+        # A side that fired starts accumulating again from zero
+        self.cusum_up[rows] = np.where(drift_up, 0, cusum_up)
+        self.cusum_down[rows] = np.where(drift_down, 0, cusum_down)
+
+        # Exponentially weighted baseline, seeded by the first reading. Deviations are
+        # clipped at the spike threshold, so a spike barely moves it while a
+        # lasting shift is still learned within a few dozen readings
+        first = (count == 0)[:, None]
+        limit = self.z_threshold * std
+        delta = np.clip(x - mean, -limit, limit)
+        self.mean[rows] = np.where(first, x, mean + self.alpha * delta)
+        self.var[rows] = np.where(first, 0, (1 - self.alpha) * (var + self.alpha * delta * delta))
+        self.count[rows] = np.minimum(count + 1, np.iinfo(np.int32).max)
+
+        anomalies = []
+        for kind, flags in ((SPIKE, spike), (DRIFT_UP, drift_up & ~spike), (DRIFT_DOWN, drift_down & ~spike)):
+            for i, v in zip(*np.nonzero(flags)):
+                anomalies.append((int(index[i]), self.vital_fields[v], kind, float(z[i, v])))
+        return anomalies
+
+    def baseline(self, row, vital):
+        """Current baseline mean of one patient's vital"""
+        return float(self.mean[row, self.vital_fields.index(vital)])
+
+    def state(self):
+        """Copies of the arrays needed to rebuild the detectors"""
+        return {name: getattr(self, name).copy() for name in ('count', 'mean', 'var', 'cusum_up', 'cusum_down')}
+
+    def load_state(self, state):
+        """Restore arrays produced by state()"""
+        for name, value in state.items():
+            getattr(self, name)[:len(value)] = value
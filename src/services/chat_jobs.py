@@ -0,0 +1,173 @@
+"""
+Chat requests run as background jobs on a bounded worker pool
+
+A chat answer can take as long as the AI API timeout; handled inline it
+holds a web worker for all of that time. ``ChatJobQueue.submit`` queues the
+call and returns a job at once, a fixed number of threads work through the
+queue, and the result is read back by job id (or pushed through
+``on_done``). When the queue is full, new jobs are refused with
+``ChatQueueFull`` instead of piling up behind a slow API.
+
+Jobs live in the process running the simulation (the shared state
+backend forwards submit, get and stats to it from the other workers);
+finished ones are kept for ``result_ttl`` seconds.
+"""
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+from src.utils.config import Config
+from .ai_service import ai_assistant
+
+QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+
+class ChatQueueFull(Exception):
+    """Raised when a job is submitted while max_queue jobs are already waiting"""
+
+class ChatJob:
+    """One queued call and, once it has run, its result"""
+
+    def __init__(self, args, kwargs, submitted_at):
+        self.id = uuid.uuid4().hex
+        self.args = args
+        self.kwargs = kwargs
+        self.patient_id = kwargs.get('patient_id')
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.submitted_at = submitted_at
+        self.started_at = None
+        self.finished_at = None
+        self.position = None   # jobs ahead of this one when it was queued
+
+    def to_dict(self):
+        job = {'id': self.id, 'status': self.status}
+        if self.status == QUEUED:
+            job['position'] = self.position
+        if self.started_at is not None:
+            job['wait_ms'] = round((self.started_at - self.submitted_at) * 1000, 1)
+        if self.finished_at is not None:
+            job['run_ms'] = round((self.finished_at - self.started_at) * 1000, 1)
+        if self.status == DONE:
+            job['result'] = self.result
+        elif self.status == FAILED:
+            job['error'] = self.error
+        return job
+
+class ChatJobQueue:
+    """Bounded FIFO of jobs served by a fixed pool of worker threads"""
+
+    def __init__(self, run, workers=2, max_queue=20, result_ttl=300, clock=time.monotonic, on_done=None):
+        self.run = run
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self.clock = clock
+        self.on_done = on_done   # called with each finished job, from the worker thread
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.jobs = {}
+        self.finished = deque()  # (finished at, job id), oldest first, for expiry
+        self.lock = threading.Lock()
+        self.threads = []
+        self.running = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.waits = deque(maxlen=200)   # seconds queued, for the most recent jobs
+        self.run_times = deque(maxlen=200)
+
+    def start(self):
+        """Start the worker threads; called on the first submit, after any fork"""
+        with self.lock:
+            if self.threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'chat-worker-{i}', daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def submit(self, *args, **kwargs):
+        """Queue a call of run(*args, **kwargs); raises ChatQueueFull when the queue is full"""
+        self.start()
+        job = ChatJob(args, kwargs, self.clock())
+        with self.lock:
+            self._expire()
+            job.position = self.queue.qsize()
+            try:
+                self.queue.put_nowait(job)
+            except queue.Full:
+                self.rejected += 1
+                raise ChatQueueFull(f"{self.queue.maxsize} chat requests are already waiting")
+            self.jobs[job.id] = job
+            self.submitted += 1
+        return job
+
+    def get(self, job_id):
+        """A job by id, or None when it is unknown or expired"""
+        with self.lock:
+            self._expire()
+            return self.jobs.get(job_id)
+
+    def _expire(self):
+        cutoff = self.clock() - self.result_ttl
+        while self.finished and self.finished[0][0] <= cutoff:
+            self.jobs.pop(self.finished.popleft()[1], None)
+
+    def _work(self):
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                job.started_at = self.clock()
+                job.status = RUNNING
+                self.running += 1
+                self.waits.append(job.started_at - job.submitted_at)
+            try:
+                job.result = self.run(*job.args, **job.kwargs)
+                job.status = DONE
+            except Exception as e:
+                print(f"Chat job {job.id} failed: {e}")
+                job.error = str(e)
+                job.status = FAILED
+            with self.lock:
+                job.finished_at = self.clock()
+                self.running -= 1
+                self.completed += job.status == DONE
+                self.failed += job.status == FAILED
+                self.run_times.append(job.finished_at - job.started_at)
+                self.finished.append((job.finished_at, job.id))
+                # Arguments are not needed once the job has run
+                job.args = job.kwargs = None
+            if self.on_done is not None:
+                self.on_done(job)
+
+    def stats(self):
+        """Queue depth, throughput counters and recent wait/run times in milliseconds"""
+        with self.lock:
+            waits = sorted(self.waits)
+            run_times = list(self.run_times)
+            stats = {
+                'workers': self.workers,
+                'queued': self.queue.qsize(),
+                'max_queue': self.queue.maxsize,
+                'running': self.running,
+                'submitted': self.submitted,
+                'completed': self.completed,
+                'failed': self.failed,
+                'rejected': self.rejected
+            }
+        stats['wait_ms'] = {
+            'mean': round(sum(waits) / len(waits) * 1000, 1) if waits else 0.0,
+            'p95': round(waits[int(0.95 * (len(waits) - 1))] * 1000, 1) if waits else 0.0,
+            'max': round(waits[-1] * 1000, 1) if waits else 0.0
+        }
+        stats['run_ms'] = {'mean': round(sum(run_times) / len(run_times) * 1000, 1) if run_times else 0.0}
+        return stats
+
+# Global instance
+chat_jobs = ChatJobQueue(
+    ai_assistant.chat,
+    workers=Config.CHAT_WORKERS,
+    max_queue=Config.CHAT_QUEUE_SIZE,
+    result_ttl=Config.CHAT_RESULT_TTL
+)
@@ -0,0 +1,49 @@
+"""
+NEWS2-style early-warning scores computed for a whole ward at once
+
+Each vital maps to 0-3 points through the NEWS2 bands, and the points add up
+to an aggregate score. Only the vitals the simulator tracks are scored
+(respiratory rate, SpO2 on scale 1, temperature and heart rate); blood
+pressure, consciousness and supplemental oxygen are not available, so
+scores run from 0 to 12 instead of 0 to 20.
+"""
+import numpy as np
+
+# Upper bound of every band but the last, and the points of each band
+NEWS2_BANDS = {
+    'respiratory_rate': ((8, 11, 20, 24), (3, 1, 0, 2, 3)),
+    'spo2': ((91, 93, 95), (3, 2, 1, 0)),
+    'temperature': ((35.0, 36.0, 38.0, 39.0), (3, 1, 0, 1, 2)),
+    'heart_rate': ((40, 50, 90, 110, 130), (3, 1, 0, 1, 2, 3))
+}
+
+# Clinical response bands: an aggregate of 5+ is medium, 7+ high, and a
+# single vital scoring 3 needs an urgent ward review even when the total is low
+RISK_LEVELS = ('low', 'low-medium', 'medium', 'high')
+LOW, LOW_MEDIUM, MEDIUM, HIGH = range(4)
+
+class EarlyWarningScore:
+    """NEWS2 bands compiled into lookup arrays for batch scoring"""
+
+    def __init__(self, bands=None):
+        self.bands = {vital: (np.array(bounds, dtype=np.float64), np.array(points, dtype=np.int8))
+                      for vital, (bounds, points) in (bands or NEWS2_BANDS).items()}
+        self.vital_fields = tuple(self.bands)
+
+    def points(self, vital, values):
+        """Points of each value: a binary search of the band bounds, then a table lookup"""
+        bounds, points = self.bands[vital]
+        values = np.asarray(values, dtype=np.float64)
+        if vital == 'temperature':
+            # Bands are defined to one decimal; float32 storage would put 36.1 at 36.0999
+            values = np.round(values, 1)
+        return points[np.searchsorted(bounds, values, side='left')]
+
+    def score(self, values):
+        """Aggregate scores, per-vital points and risk levels for a batch of readings"""
+        points = {vital: self.points(vital, values[vital]) for vital in self.vital_fields}
+        stacked = np.stack(list(points.values()))
+        total = stacked.sum(axis=0, dtype=np.int16)
+        risk = np.where(total >= 7, HIGH, np.where(total >= 5, MEDIUM,
+                        np.where(stacked.max(axis=0) >= 3, LOW_MEDIUM, LOW))).astype(np.int8)
+        return total, points, risk
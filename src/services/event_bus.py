@@ -0,0 +1,111 @@
+"""
+In-process fan-out of vitals and alert events to connected clients
+"""
+import json
+import queue
+import threading
+
+class Event:
+    """One event, serialized once no matter how many clients receive it"""
+
+    def __init__(self, event, data, patient_id=None):
+        self.event = event
+        self.patient_id = patient_id
+        self.payload = data
+        self.data = json.dumps(data, separators=(',', ':'))
+        self._sse = None
+
+    @property
+    def sse(self):
+        """The event framed for a text/event-stream response"""
+        if self._sse is None:
+            self._sse = f"event: {self.event}\ndata: {self.data}\n\n"
+        return self._sse
+
+class QueueSubscriber:
+    """A client fed through a bounded queue; it is dropped when the queue overflows"""
+
+    def __init__(self, patient_ids, max_queue=100):
+        self.patient_ids = frozenset(patient_ids)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.closed = False
+
+    def deliver(self, event):
+        """Queue an event without blocking; return False if the client is too slow"""
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.closed = True
+            return False
+
+    def get(self, timeout=None):
+        """Next event, or None when none arrived within the timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class EventBus:
+    """Publishes each event to the subscribers watching its patient.
+
+    Subscribers are indexed by patient id, so publishing costs one lookup
+    plus one queue put per interested client. Events published without a
+    patient id go to everyone.
+    """
+
+    def __init__(self, max_queue=100):
+        self.max_queue = max_queue
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.by_patient = {}
+        self.on_watch = None   # called with the watched patient ids whenever they change
+
+    def subscribe(self, patient_ids, subscriber=None):
+        """Register a subscriber (a new QueueSubscriber by default) for some patients"""
+        if subscriber is None:
+            subscriber = QueueSubscriber(patient_ids, self.max_queue)
+        with self.lock:
+            watched = len(self.by_patient)
+            self.subscribers.add(subscriber)
+            for patient_id in subscriber.patient_ids:
+                self.by_patient.setdefault(patient_id, set()).add(subscriber)
+            changed = len(self.by_patient) != watched
+        if changed:
+            self._watch_changed()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self.lock:
+            watched = len(self.by_patient)
+            self.subscribers.discard(subscriber)
+            for patient_id in subscriber.patient_ids:
+                watchers = self.by_patient.get(patient_id)
+                if watchers is not None:
+                    watchers.discard(subscriber)
+                    if not watchers:
+                        del self.by_patient[patient_id]
+            changed = len(self.by_patient) != watched
+        if changed:
+            self._watch_changed()
+
+    def _watch_changed(self):
+        if self.on_watch is not None:
+            self.on_watch(self.watched_patients())
+
+    def watched_patients(self):
+        """Patient ids with at least one subscriber"""
+        with self.lock:
+            return set(self.by_patient)
+
+    def publish(self, event, data, patient_id=None):
+        """Serialize an event once and hand it to every interested subscriber"""
+        with self.lock:
+            targets = list(self.subscribers if patient_id is None else self.by_patient.get(patient_id, ()))
+        if not targets:
+            return None
+        message = Event(event, data, patient_id)
+        for subscriber in targets:
+            if not subscriber.deliver(message):
+                self.unsubscribe(subscriber)
+        return message
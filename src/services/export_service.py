@@ -0,0 +1,118 @@
+"""
+Streaming CSV / NDJSON export of vitals readings and alerts
+
+Exports are generators of encoded chunks, built one page of readings or
+alerts at a time, so memory use depends on the page size rather than on how
+many rows are exported. Gzip is applied on the fly with a zlib stream.
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+import numpy as np
+
+EXPORT_FORMATS = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+VITALS_COLUMNS = ('patient_id', 'timestamp', 'heart_rate', 'spo2', 'temperature', 'respiratory_rate')
+ALERT_COLUMNS = ('id', 'patient_id', 'type', 'vital', 'value', 'message', 'timestamp', 'acknowledged')
+PAGE_ROWS = 10000
+
+def _csv_line(values):
+    out = io.StringIO()
+    csv.writer(out, lineterminator='\n').writerow(values)
+    return out.getvalue()
+
+def _local_offset(timestamp):
+    return datetime.fromtimestamp(timestamp).astimezone().utcoffset().total_seconds()
+
+def iso_timestamps(timestamps):
+    """Format epoch seconds like datetime.fromtimestamp(ts).isoformat(), a page at a time"""
+    if not len(timestamps):
+        return []
+    offset = _local_offset(float(timestamps[0]))
+    if offset != _local_offset(float(timestamps[-1])):
+        # The page spans a daylight saving change
+        return [datetime.fromtimestamp(ts).isoformat() for ts in timestamps.tolist()]
+    # Round the fraction on its own, as fromtimestamp() does, so microseconds match exactly
+    seconds = np.floor(timestamps)
+    micros = ((seconds + offset).astype(np.int64) * 1000000
+              + np.round((timestamps - seconds) * 1e6).astype(np.int64)).astype('datetime64[us]')
+    strings = np.datetime_as_string(micros)
+    # isoformat() leaves out the fraction on whole seconds
+    whole = micros.astype(np.int64) % 1000000 == 0
+    if whole.any():
+        strings[whole] = np.datetime_as_string(micros[whole], unit='s')
+    return strings.tolist()
+
+class DataExporter:
+    """Encodes pages of vitals and alerts from the simulator as CSV or NDJSON chunks"""
+
+    def __init__(self, page_rows=PAGE_ROWS):
+        self.page_rows = page_rows
+
+    def vitals(self, simulator, patient_ids, start=None, end=None, fmt='csv'):
+        """Yield the readings of each patient in [start, end] as encoded byte chunks"""
+        if fmt == 'csv':
+            yield _csv_line(VITALS_COLUMNS).encode()
+        for patient_id, columns in self.vitals_pages(simulator, patient_ids, start, end):
+            yield self._encode_readings(patient_id, columns, fmt).encode()
+
+    def vitals_pages(self, simulator, patient_ids, start=None, end=None):
+        """Yield (patient_id, columns) for each non-empty page of readings in [start, end]"""
+        for patient_id in patient_ids:
+            cursor = None
+            while True:
+                page = simulator.get_vitals_page(patient_id, start, end, cursor, self.page_rows)
+                if len(page['columns']['timestamp']):
+                    yield patient_id, page['columns']
+                cursor = page['cursor']
+                if cursor is None:
+                    break
+
+    def alerts(self, simulator, patient_ids=None, start=None, end=None, fmt='csv'):
+        """Yield the alerts of the given patients (all when omitted) as encoded byte chunks"""
+        if fmt == 'csv':
+            yield _csv_line(ALERT_COLUMNS).encode()
+        cursor = None
+        while True:
+            page = simulator.get_alerts_page(patient_ids, start, end, cursor, self.page_rows)
+            if page['alerts']:
+                if fmt == 'csv':
+                    out = io.StringIO()
+                    writer = csv.writer(out, lineterminator='\n')
+                    writer.writerows([alert[name] for name in ALERT_COLUMNS] for alert in page['alerts'])
+                    yield out.getvalue().encode()
+                else:
+                    yield ''.join(json.dumps(alert) + '\n' for alert in page['alerts']).encode()
+            cursor = page['cursor']
+            if cursor is None:
+                break
+
+    @staticmethod
+    def _encode_readings(patient_id, columns, fmt):
+        timestamps = iso_timestamps(np.asarray(columns['timestamp'], dtype=np.float64))
+        temperatures = np.round(np.asarray(columns['temperature'], dtype=np.float64), 1).tolist()
+        rows = zip(timestamps, columns['heart_rate'].tolist(), columns['spo2'].tolist(),
+                   temperatures, columns['respiratory_rate'].tolist())
+        # Formatting rows with one template is several times faster than csv/json per row
+        if fmt == 'csv':
+            prefix = _csv_line([patient_id])[:-1]
+            return ''.join(f'{prefix},{ts},{hr},{spo2},{temp},{rr}\n' for ts, hr, spo2, temp, rr in rows)
+        prefix = '{"patient_id": ' + json.dumps(patient_id) + ', "timestamp": "'
+        return ''.join(
+            f'{prefix}{ts}", "heart_rate": {hr}, "spo2": {spo2}, "temperature": {temp}, "respiratory_rate": {rr}}}\n'
+            for ts, hr, spo2, temp, rr in rows
+        )
+
+    @staticmethod
+    def gzip(chunks, level=6):
+        """Compress a stream of byte chunks into a gzip stream as they are produced"""
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            compressed = compressor.compress(chunk)
+            if compressed:
+                yield compressed
+        yield compressor.flush()
+
+# Global instance
+data_exporter = DataExporter()
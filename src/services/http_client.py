@@ -0,0 +1,166 @@
+"""
+Pooled HTTP client with a concurrency limit and a circuit breaker
+
+One ``requests.Session`` keeps TLS connections to an upstream API alive
+across calls. A semaphore bounds how many calls are in flight at once, and a
+circuit breaker stops calling an upstream that keeps failing: after
+``failure_threshold`` failures in a row it opens, every call fails at once
+with ``ServiceUnavailable``, and a background thread probes the upstream
+every ``reset_timeout`` seconds until it answers again.
+"""
+import threading
+import time
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+
+class ServiceUnavailable(Exception):
+    """Raised instead of calling an upstream the client has given up on for now"""
+
+class CircuitBreaker:
+    """Counts consecutive failures and opens after failure_threshold of them"""
+
+    CLOSED, OPEN = 'closed', 'open'
+
+    def __init__(self, failure_threshold=3, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.times_opened = 0
+        self.lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.state == self.OPEN
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.state = self.CLOSED
+            self.opened_at = None
+
+    def record_failure(self):
+        """Count a failure; True when this one opened the breaker"""
+        with self.lock:
+            self.failures += 1
+            if self.state == self.CLOSED and self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+                self.times_opened += 1
+                return True
+            return False
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'open_for': round(self.clock() - self.opened_at, 1) if self.opened_at is not None else None,
+            'times_opened': self.times_opened
+        }
+
+class PooledClient:
+    """Keep-alive session to one upstream, limited to max_concurrent calls and guarded by a breaker"""
+
+    def __init__(self, base_url, headers=None, pool_size=10, max_concurrent=4, timeout=30,
+                 acquire_timeout=5, failure_threshold=3, reset_timeout=30, probe_path=''):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout   # seconds to wait for a free slot
+        self.reset_timeout = reset_timeout       # seconds between probes while open
+        self.probe_path = probe_path
+        self.session = requests.Session()
+        self.session.headers.update(headers or {})
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.breaker = CircuitBreaker(failure_threshold)
+        self.probe_thread = None
+        self.probe_lock = threading.Lock()
+        self.calls = 0
+        self.rejected = 0
+
+    def request(self, method, path, **kwargs):
+        """Send a request; raises ServiceUnavailable when the breaker is open or no slot frees up"""
+        self._acquire()
+        try:
+            response = self._send(method, path, **kwargs)
+        finally:
+            self.slots.release()
+        return response
+
+    @contextmanager
+    def stream(self, method, path, **kwargs):
+        """Send a request whose body is read while the block runs; the slot is held until it ends"""
+        self._acquire()
+        response = None
+        try:
+            response = self._send(method, path, stream=True, **kwargs)
+            yield response
+        except requests.RequestException:
+            # The connection broke while the body was being read
+            if response is not None:
+                self._failed()
+            raise
+        finally:
+            if response is not None:
+                response.close()
+            self.slots.release()
+
+    def _acquire(self):
+        if self.breaker.is_open:
+            self.rejected += 1
+            raise ServiceUnavailable(f"{self.base_url} is failing; retrying in the background")
+        if not self.slots.acquire(timeout=self.acquire_timeout):
+            self.rejected += 1
+            raise ServiceUnavailable(f"Too many concurrent calls to {self.base_url}")
+        self.calls += 1
+
+    def _send(self, method, path, **kwargs):
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=kwargs.pop('timeout', self.timeout),
+                                            **kwargs)
+        except requests.RequestException:
+            self._failed()
+            raise
+        # Server errors and rate limiting count against the upstream; other statuses are answers
+        if response.status_code >= 500 or response.status_code == 429:
+            self._failed()
+        else:
+            self.breaker.record_success()
+        return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def _failed(self):
+        if self.breaker.record_failure():
+            print(f"Circuit opened for {self.base_url} after {self.breaker.failures} failures")
+            self._start_probe()
+
+    def _start_probe(self):
+        with self.probe_lock:
+            if self.probe_thread is None or not self.probe_thread.is_alive():
+                self.probe_thread = threading.Thread(target=self._probe, daemon=True)
+                self.probe_thread.start()
+
+    def _probe(self):
+        """Call the probe path every reset_timeout seconds until it succeeds, then close the breaker"""
+        while self.breaker.is_open:
+            time.sleep(self.reset_timeout)
+            try:
+                response = self.session.get(self.base_url + self.probe_path, timeout=min(self.timeout, 5))
+                healthy = response.status_code < 500 and response.status_code != 429
+            except requests.RequestException:
+                healthy = False
+            if healthy:
+                self.breaker.record_success()
+                print(f"Circuit closed for {self.base_url}")
+
+    def stats(self):
+        return {'calls': self.calls, 'rejected': self.rejected, **self.breaker.stats()}
@@ -0,0 +1,140 @@
+"""
+Fixed-rate tick scheduler running every periodic job on one thread
+"""
+import heapq
+import itertools
+import threading
+import time
+
+class ScheduledJob:
+    """A callback run every ``interval`` seconds, with timing statistics"""
+
+    def __init__(self, name, interval, callback, next_run):
+        self.name = name
+        self.interval = interval
+        self.callback = callback
+        self.next_run = next_run
+        self.cancelled = False
+        self.runs = 0
+        self.late = 0           # ticks that started later than the tolerance allows
+        self.skipped = 0        # ticks dropped because the job fell a whole interval behind
+        self.errors = 0
+        self.max_lag = 0.0      # seconds
+
+    def to_dict(self):
+        return {
+            'interval': self.interval,
+            'runs': self.runs,
+            'late': self.late,
+            'skipped': self.skipped,
+            'errors': self.errors,
+            'max_lag': round(self.max_lag, 4)
+        }
+
+class TickScheduler:
+    """Runs jobs at a fixed rate from a min-heap of due times.
+
+    Each tick is scheduled from the previous tick's due time rather than
+    from when it finished, so run time does not accumulate as drift. A job
+    that falls whole intervals behind skips those ticks instead of running
+    them back to back, and the skips are counted.
+    """
+
+    def __init__(self, tolerance=0.1, clock=time.monotonic):
+        self.tolerance = tolerance  # fraction of the interval a tick may start late
+        self.clock = clock
+        self.jobs = []              # heap of (next run, sequence, job)
+        self.active = set()
+        self.sequence = itertools.count()
+        self.condition = threading.Condition()
+        self.woken = False
+        self.thread = None
+        self.running = False
+
+    def schedule(self, name, interval, callback, delay=0.0):
+        """Run callback every interval seconds, first after delay"""
+        if interval <= 0:
+            raise ValueError(f"Tick interval must be positive: {interval}")
+        job = ScheduledJob(name, interval, callback, self.clock() + delay)
+        with self.condition:
+            heapq.heappush(self.jobs, (job.next_run, next(self.sequence), job))
+            self.active.add(job)
+            self.woken = True
+            self.condition.notify()
+        return job
+
+    def cancel(self, job):
+        """Stop a job; it is dropped from the heap when it next comes due"""
+        with self.condition:
+            job.cancelled = True
+            self.active.discard(job)
+
+    def run_pending(self):
+        """Run every job that is due; return seconds until the next one (None when idle)"""
+        while True:
+            with self.condition:
+                while self.jobs and self.jobs[0][2].cancelled:
+                    heapq.heappop(self.jobs)
+                if not self.jobs:
+                    return None
+                now = self.clock()
+                due, _, job = self.jobs[0]
+                if due > now:
+                    return due - now
+                heapq.heappop(self.jobs)
+
+            lag = now - due
+            job.max_lag = max(job.max_lag, lag)
+            if lag > job.interval * self.tolerance:
+                job.late += 1
+            try:
+                job.callback()
+            except Exception as e:
+                job.errors += 1
+                print(f"Scheduled job {job.name} failed: {e}")
+            job.runs += 1
+
+            # Next tick on the fixed grid, skipping any ticks already missed
+            missed = int(lag // job.interval)
+            if missed:
+                job.skipped += missed
+                print(f"Scheduled job {job.name} fell behind and skipped {missed} tick(s)")
+            job.next_run = due + (missed + 1) * job.interval
+            with self.condition:
+                if not job.cancelled:
+                    heapq.heappush(self.jobs, (job.next_run, next(self.sequence), job))
+
+    def _run(self):
+        while self.running:
+            with self.condition:
+                self.woken = False
+            wait = self.run_pending()
+            with self.condition:
+                # A job scheduled while we were busy may be due before the computed wait
+                if self.running and not self.woken:
+                    self.condition.wait(wait)
+
+    def start(self):
+        """Start the scheduler thread if it is not running"""
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        if self.thread is not None:
+            self.thread.join(5)
+            self.thread = None
+
+    def stats(self):
+        """Timing statistics of every active job, by name"""
+        with self.condition:
+            return {job.name: job.to_dict() for job in self.active}
+
+# Global instance
+tick_scheduler = TickScheduler()
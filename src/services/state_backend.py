@@ -0,0 +1,314 @@
+"""
+State backends deciding which process owns the vitals simulation
+
+With one worker the simulator lives in the process serving requests
+(LocalBackend). SharedBackend lets several gunicorn workers share one
+simulation: the worker holding an exclusive lock on ``<STATE_SOCKET>.lock``
+runs the simulator and serves it over a Unix socket, while every other
+worker forwards calls to it and relays the events its own clients
+subscribe to. Chat jobs run in the leader too, so a job accepted by one
+worker can be polled through any other. When the leader exits, its lock is released and the next
+worker to notice takes over with a fresh simulation.
+
+The socket sits in a directory only this user can open, connections must
+present SECRET_KEY (the shared backend refuses to start with the default
+key), and only the methods in SHARED_METHODS can be called through it.
+"""
+import os
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Listener
+from src.utils.config import Config, DEFAULT_SECRET_KEY
+from .vitals_service import vitals_simulator
+from .chat_jobs import chat_jobs
+
+try:
+    import fcntl
+except ImportError:  # Windows: only the local backend is available
+    fcntl = None
+
+# Methods the routes and exporters call on each object the leader owns;
+# nothing else is reachable over the socket
+SHARED_METHODS = {
+    'simulator': frozenset({
+        'acknowledge_alert', 'clear_alerts', 'create_test_alert', 'get_alerts', 'get_alerts_page',
+        'get_alerts_since', 'get_alerts_version', 'get_current_vitals', 'get_first_timestamp',
+        'get_history_columns', 'get_patient', 'get_patient_ids', 'get_patient_row', 'get_thresholds',
+        'get_tick_stats', 'get_vital_status', 'get_vital_trends', 'get_vitals_history', 'get_vitals_page',
+        'get_vitals_rollup', 'get_vitals_since', 'get_vitals_version', 'get_ward_scores',
+        'ingest_readings', 'save_patient', 'search_alerts', 'set_patient_thresholds'
+    }),
+    'chat_jobs': frozenset({'submit', 'get', 'stats'})
+}
+SHARED_ATTRIBUTES = {'simulator': frozenset({'epoch'}), 'chat_jobs': frozenset()}
+
+class LocalBackend:
+    """Serves everything from the simulator in this process; use with a single worker"""
+
+    def __init__(self, simulator, chat_jobs):
+        self.simulator = simulator
+        self.chat_jobs = chat_jobs
+        self.is_leader = True
+
+    def start(self):
+        pass
+
+    def on_leader(self, callback):
+        """Run a callback in the process that owns the simulation"""
+        callback()
+
+class SharedService:
+    """Forwards the shared methods of an object owned by the leader"""
+
+    def __init__(self, backend, target):
+        self._backend = backend
+        self._target = target
+
+    def __getattr__(self, name):
+        if name not in SHARED_METHODS[self._target]:
+            raise AttributeError(f"'{name}' is not shared between workers")
+        backend, target = self._backend, self._target
+        return lambda *args, **kwargs: backend.call(name, args, kwargs, target=target)
+
+class SharedSimulator(SharedService):
+    """Stands in for the simulator in every worker of a SharedBackend"""
+
+    def __init__(self, backend):
+        super().__init__(backend, 'simulator')
+
+    @property
+    def events(self):
+        # Each worker fans events out to its own clients
+        return self._backend.local.events
+
+    @property
+    def epoch(self):
+        return self._backend.epoch()
+
+    def start_simulation(self):
+        # The leader starts the simulation as soon as it is elected
+        self._backend.start()
+
+class SharedBackend:
+    """One simulation shared by every worker through a leader process"""
+
+    def __init__(self, simulator, chat_jobs, socket_path, authkey):
+        self.local = simulator
+        self.targets = {'simulator': simulator, 'chat_jobs': chat_jobs}
+        self.socket_path = socket_path
+        self.authkey = authkey
+        self.simulator = SharedSimulator(self)
+        self.chat_jobs = SharedService(self, 'chat_jobs')
+        self.is_leader = False
+        self.started = False
+        self.callbacks = []
+        self.election = threading.Lock()
+        self.lock_file = None
+        self.listener = None
+        self.leader_epoch = None
+        self.connections = threading.local()   # one connection to the leader per request thread
+        self.event_conn = None
+        self.event_lock = threading.Lock()
+        self.local.events.on_watch = self._send_watch
+
+    def start(self):
+        """Join the election; followers then relay the leader's events"""
+        with self.election:
+            if self.started:
+                return
+            self.started = True
+        if not self._try_lead():
+            threading.Thread(target=self._relay_events, daemon=True).start()
+
+    def stop(self):
+        """Stop serving and give up leadership"""
+        self.started = False
+        if self.listener is not None:
+            listener, self.listener = self.listener, None
+            listener.close()
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+        self.is_leader = False
+
+    def on_leader(self, callback):
+        """Run a callback once this process owns the simulation"""
+        self.callbacks.append(callback)
+        if self.is_leader:
+            callback()
+
+    def _try_lead(self):
+        """Take the leader lock if no other worker holds it"""
+        with self.election:
+            if self.is_leader:
+                return True
+            private_directory(os.path.dirname(os.path.abspath(self.socket_path)))
+            lock_file = open(self.socket_path + '.lock', 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+            self.lock_file = lock_file
+            # A socket left behind by a previous leader is stale once we hold the lock
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+            self.listener = Listener(self.socket_path, 'AF_UNIX', authkey=self.authkey)
+            self.is_leader = True
+
+        print(f"Worker {os.getpid()} now runs the shared vitals simulation")
+        threading.Thread(target=self._serve, args=(self.listener,), daemon=True).start()
+        # Callbacks such as restoring the write-ahead log run before the first tick
+        for callback in self.callbacks:
+            callback()
+        self.local.start_simulation()
+        return True
+
+    def _connect(self):
+        return Client(self.socket_path, 'AF_UNIX', authkey=self.authkey)
+
+    def epoch(self):
+        if self.is_leader:
+            return self.local.epoch
+        if self.leader_epoch is None:
+            self.leader_epoch = self.call('epoch', attribute=True)
+        return self.leader_epoch
+
+    def call(self, name, args=(), kwargs=None, attribute=False, target='simulator'):
+        """Run a method of the simulator or chat jobs (or read an attribute) in the leader process"""
+        for attempt in range(3):
+            if self.is_leader:
+                value = getattr(self.targets[target], name)
+                return value if attribute else value(*args, **(kwargs or {}))
+            try:
+                conn = getattr(self.connections, 'conn', None)
+                if conn is None:
+                    conn = self.connections.conn = self._connect()
+                conn.send((target, name, args, kwargs or {}, attribute))
+                status, result = conn.recv()
+            except (OSError, EOFError):
+                # The leader went away (or is still starting): take over if nobody else has
+                self.connections.conn = None
+                self.leader_epoch = None
+                if not self._try_lead():
+                    time.sleep(0.1 * (attempt + 1))
+                continue
+            if status == 'error':
+                raise result
+            return result
+        raise ConnectionError("The worker running the vitals simulation is unavailable")
+
+    def _serve(self, listener):
+        """Leader: accept connections from the other workers"""
+        while self.listener is listener:
+            try:
+                conn = listener.accept()
+            except (OSError, EOFError, AuthenticationError):
+                continue
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        """Leader: answer calls from one worker thread, or stream events to a worker"""
+        try:
+            while True:
+                request = conn.recv()
+                if request[0] == 'watch':
+                    self._forward_events(conn, request[1])
+                    return
+                target, name, args, kwargs, attribute = request
+                try:
+                    if name not in (SHARED_ATTRIBUTES if attribute else SHARED_METHODS).get(target, ()):
+                        raise AttributeError(f"'{name}' is not shared between workers")
+                    value = getattr(self.targets[target], name)
+                    conn.send(('ok', value if attribute else value(*args, **kwargs)))
+                except Exception as e:
+                    conn.send(('error', e))
+        except (OSError, EOFError):
+            pass
+        finally:
+            conn.close()
+
+    def _forward_events(self, conn, patient_ids):
+        """Leader: push events for the patients a worker watches until it disconnects"""
+        bus = self.local.events
+        current = {'subscriber': bus.subscribe(patient_ids)}
+
+        def read_watch_updates():
+            try:
+                while True:
+                    _, patient_ids = conn.recv()
+                    previous = current['subscriber']
+                    current['subscriber'] = bus.subscribe(patient_ids)
+                    bus.unsubscribe(previous)
+            except (OSError, EOFError):
+                current['subscriber'] = None
+
+        threading.Thread(target=read_watch_updates, daemon=True).start()
+        try:
+            while True:
+                subscriber = current['subscriber']
+                # A closed subscriber fell too far behind; the worker reconnects and resubscribes
+                if subscriber is None or subscriber.closed:
+                    break
+                event = subscriber.get(timeout=1)
+                if event is not None and subscriber is current['subscriber']:
+                    conn.send((event.event, event.payload, event.patient_id))
+        finally:
+            subscriber = current['subscriber']
+            if subscriber is not None:
+                bus.unsubscribe(subscriber)
+
+    def _relay_events(self):
+        """Follower: republish the leader's events for the patients watched here"""
+        while self.started and not self.is_leader:
+            try:
+                conn = self._connect()
+            except (OSError, EOFError):
+                if not self._try_lead():
+                    time.sleep(1)
+                continue
+            with self.event_lock:
+                self.event_conn = conn
+                conn.send(('watch', self.local.events.watched_patients()))
+            try:
+                while True:
+                    event, data, patient_id = conn.recv()
+                    self.local.events.publish(event, data, patient_id)
+            except (OSError, EOFError):
+                pass
+            finally:
+                with self.event_lock:
+                    self.event_conn = None
+                conn.close()
+
+    def _send_watch(self, patient_ids):
+        with self.event_lock:
+            if self.event_conn is not None:
+                try:
+                    self.event_conn.send(('watch', patient_ids))
+                except OSError:
+                    pass
+
+def private_directory(path):
+    """Create a directory only this user can open; refuse one anybody else can"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    info = os.stat(path)
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise RuntimeError(f"{path} must be a directory owned by this user with mode 0700")
+
+def create_backend(kind, simulator, chat_jobs):
+    """Build the backend named by STATE_BACKEND ('local' or 'shared')"""
+    if kind == 'shared':
+        if Config.SECRET_KEY == DEFAULT_SECRET_KEY:
+            raise RuntimeError("STATE_BACKEND=shared authenticates workers with SECRET_KEY; "
+                               "set SECRET_KEY to a private value")
+        if fcntl is not None:
+            return SharedBackend(simulator, chat_jobs, Config.STATE_SOCKET, Config.SECRET_KEY.encode())
+        print("The shared state backend needs fcntl; using the local backend")
+    elif kind != 'local':
+        print(f"Unknown STATE_BACKEND '{kind}'; using the local backend")
+    return LocalBackend(simulator, chat_jobs)
+
+# Global instance
+state_backend = create_backend(Config.STATE_BACKEND, vitals_simulator, chat_jobs)
@@ -0,0 +1,85 @@
+"""
+Vital-sign thresholds compiled into arrays for batch classification
+"""
+import numpy as np
+from src.utils.config import VITAL_RANGES
+
+# Classification codes returned by ThresholdTable.classify()
+STATUS_NAMES = ('normal', 'warning', 'critical')
+NORMAL, WARNING, CRITICAL = range(3)
+
+class ThresholdTable:
+    """Normal/warning bounds per vital, with optional per-patient overrides.
+
+    Each vital compiles to a ``(4, patients)`` array holding the normal low,
+    normal high, warning low and warning high bound of every patient, so a
+    whole ward is classified with four vectorized comparisons per vital. A
+    value inside the normal range is normal, inside the warning range is a
+    warning and anything else is critical.
+    """
+
+    def __init__(self, ranges=None, patients=0):
+        self.ranges = {vital: dict(bands) for vital, bands in (ranges or VITAL_RANGES).items()}
+        self.vital_fields = tuple(self.ranges)
+        self.defaults = {vital: self._compile(bands) for vital, bands in self.ranges.items()}
+        self.bounds = {vital: np.empty((4, 0)) for vital in self.vital_fields}
+        self.overrides = {}  # row -> {vital: bands}
+        self.resize(patients)
+
+    @staticmethod
+    def _compile(bands):
+        return np.array([*bands['normal'], *bands['warning']], dtype=np.float64)
+
+    @property
+    def patients(self):
+        return self.bounds[self.vital_fields[0]].shape[1]
+
+    def resize(self, patients):
+        """Grow the table to hold the given number of patients"""
+        extra = patients - self.patients
+        if extra <= 0:
+            return
+        for vital, default in self.defaults.items():
+            added = np.repeat(default[:, None], extra, axis=1)
+            self.bounds[vital] = np.concatenate([self.bounds[vital], added], axis=1)
+
+    def set_patient_ranges(self, row, vital, normal=None, warning=None):
+        """Override the normal and/or warning range of one vital for one patient"""
+        if vital not in self.ranges:
+            raise KeyError(f"Unknown vital: {vital}")
+        bands = dict(self.overrides.get(row, {}).get(vital, self.ranges[vital]))
+        for name, bound in (('normal', normal), ('warning', warning)):
+            if bound is not None:
+                low, high = bound
+                if low > high:
+                    raise ValueError(f"Invalid {name} range for {vital}: {low} > {high}")
+                bands[name] = (low, high)
+        self.overrides.setdefault(row, {})[vital] = bands
+        self.bounds[vital][:, row] = self._compile(bands)
+
+    def classify(self, vital, values, rows=None):
+        """Classify values into NORMAL/WARNING/CRITICAL codes.
+
+        Without ``rows`` the default ranges apply; otherwise ``rows`` (an
+        index array or slice aligned with ``values``) selects the patients
+        whose own ranges apply.
+        """
+        bounds = self.defaults[vital] if rows is None else self.bounds[vital][:, rows]
+        values = np.asarray(values)
+        normal = (values >= bounds[0]) & (values <= bounds[1])
+        warning = (values >= bounds[2]) & (values <= bounds[3])
+        return np.where(normal, NORMAL, np.where(warning, WARNING, CRITICAL)).astype(np.int8)
+
+    def classify_all(self, values, rows=None):
+        """Classify a batch of readings for every vital in one call"""
+        return {vital: self.classify(vital, values[vital], rows) for vital in self.vital_fields}
+
+    def status(self, vital, value, row=None):
+        """Status name of a single value"""
+        return STATUS_NAMES[int(self.classify(vital, value, row))]
+
+    def to_dict(self, row=None):
+        """The effective ranges, for one patient when a row is given"""
+        overrides = self.overrides.get(row, {}) if row is not None else {}
+        return {vital: {band: list(limits) for band, limits in overrides.get(vital, bands).items()}
+                for vital, bands in self.ranges.items()}
@@ -0,0 +1,109 @@
+"""
+Columnar ring buffer holding recent vitals history for a ward of patients
+"""
+import numpy as np
+
+def batch_ranks(rows):
+    """Rank of each entry among the entries for the same row, in batch order"""
+    order = np.argsort(rows, kind='stable')
+    sorted_rows = rows[order]
+    starts = np.flatnonzero(np.r_[True, sorted_rows[1:] != sorted_rows[:-1]])
+    sizes = np.diff(np.r_[starts, len(rows)])
+    ranks = np.empty(len(rows), dtype=np.int64)
+    ranks[order] = np.arange(len(rows)) - np.repeat(starts, sizes)
+    return ranks
+
+class VitalsRingBuffer:
+    """Fixed-capacity columnar history with one column per field.
+
+    Each column is a ``(2 * capacity, patients)`` array. Every value is
+    written twice, ``capacity`` slots apart, so the newest readings of a
+    patient always form one contiguous slice: appends are O(1) and history
+    reads return views instead of copies.
+    """
+
+    def __init__(self, fields, capacity=1000, patients=0):
+        if capacity < 1:
+            raise ValueError("Ring buffer capacity must be at least 1")
+        self.capacity = capacity
+        self.dtypes = dict(fields)
+        self.columns = {name: np.zeros((2 * capacity, patients), dtype=dtype)
+                        for name, dtype in self.dtypes.items()}
+        # Total readings ever appended per patient; doubles as a sequence number
+        self.counts = np.zeros(patients, dtype=np.int64)
+
+    @property
+    def patients(self):
+        return len(self.counts)
+
+    def resize(self, patients):
+        """Grow the buffer to hold the given number of patients"""
+        extra = patients - self.patients
+        if extra <= 0:
+            return
+        for name, column in self.columns.items():
+            padding = np.zeros((2 * self.capacity, extra), dtype=column.dtype)
+            self.columns[name] = np.concatenate([column, padding], axis=1)
+        self.counts = np.concatenate([self.counts, np.zeros(extra, dtype=np.int64)])
+
+    def append(self, values, rows=None):
+        """Append one reading per entry of ``rows`` (every patient when omitted).
+
+        ``values`` maps each field to a scalar or to an array aligned with
+        ``rows``. A patient may appear several times in one batch; its
+        readings are stored in batch order.
+        """
+        if rows is None:
+            rows = np.arange(self.patients)
+            offsets = self.counts
+            added = 1
+        else:
+            rows = np.asarray(rows, dtype=np.int64)
+            ranks = batch_ranks(rows)
+            added = np.bincount(rows, minlength=self.patients)
+            # Only a row's newest `capacity` readings survive; skip the rest so no slot is written twice
+            keep = ranks >= added[rows] - self.capacity
+            if not keep.all():
+                values = {name: np.broadcast_to(values[name], keep.shape)[keep] for name in self.columns}
+                rows, ranks = rows[keep], ranks[keep]
+            offsets = self.counts[rows] + ranks
+
+        slots = offsets % self.capacity
+        for name, column in self.columns.items():
+            value = values[name]
+            column[slots, rows] = value
+            column[slots + self.capacity, rows] = value
+        self.counts += added
+
+    def newest(self, name, rows, empty=np.nan):
+        """The newest value of one field for each of ``rows``, or ``empty`` for rows without readings"""
+        rows = np.asarray(rows, dtype=np.int64)
+        counts = self.counts[rows]
+        values = self.columns[name][(counts - 1) % self.capacity, rows]
+        return np.where(counts > 0, values, empty)
+
+    def latest(self, row, limit=None):
+        """Return views of the newest ``limit`` readings of one patient, oldest first"""
+        count = int(self.counts[row])
+        available = min(count, self.capacity)
+        size = available if limit is None else max(0, min(limit, available))
+        end = (count - 1) % self.capacity + self.capacity + 1 if count else 0
+        return {name: column[end - size:end, row] for name, column in self.columns.items()}
+
+    def state(self):
+        """Copies of the arrays needed to rebuild the buffer"""
+        # The second half of every column mirrors the first
+        state = {name: column[:self.capacity].copy() for name, column in self.columns.items()}
+        state['counts'] = self.counts.copy()
+        return state
+
+    def load_state(self, state):
+        """Restore arrays produced by state() for the same fields, capacity and patients"""
+        counts = state['counts']
+        if len(counts) != self.patients or any(state[name].shape != (self.capacity, self.patients)
+                                               for name in self.columns):
+            raise ValueError("Saved buffer does not match this buffer's capacity or patients")
+        for name, column in self.columns.items():
+            column[:self.capacity] = state[name]
+            column[self.capacity:] = state[name]
+        self.counts[:] = counts
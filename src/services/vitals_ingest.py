@@ -0,0 +1,165 @@
+"""
+Parsing and validation of batched readings sent by bedside device gateways
+
+A batch is a JSON array of readings, NDJSON (one reading per line) or a
+columnar JSON object of equal-length arrays::
+
+    [{"patient_id": "ICU-201", "timestamp": 1718000000.0, "heart_rate": 82,
+      "spo2": 97, "temperature": 37.2, "respiratory_rate": 16}, ...]
+
+    {"patient_id": [...], "timestamp": [...], "heart_rate": [...], ...}
+
+``timestamp`` is optional (epoch seconds or ISO 8601) and defaults to the
+time the batch arrived. Gateways can also send the fixed-width binary
+format of vitals_wire as ``application/octet-stream``. The batch is turned
+into arrays and checked against VITAL_LIMITS with one vectorized
+comparison per vital.
+"""
+import json
+import time
+import numpy as np
+from src.utils.helpers import VITAL_LIMITS, parse_timestamp
+from .vitals_wire import WIRE_MIMETYPE, decode_records, records_to_columns
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+INGEST_FIELDS = ('patient_id', 'timestamp', *VITAL_LIMITS)
+MAX_REPORTED_ERRORS = 100
+
+# Accepted timestamps: from 2000-01-01 up to a few minutes past the server
+# clock. Epoch milliseconds, infinities and far-future values are rejected
+# rather than stored, since they cannot be turned back into dates
+MIN_TIMESTAMP = 946684800.0
+MAX_CLOCK_SKEW = 300
+
+class ReadingBatch:
+    """The valid readings of a batch as parallel arrays, plus what was rejected"""
+
+    def __init__(self, patient_ids, timestamps, values, rejected, errors):
+        self.patient_ids = patient_ids      # list of patient id strings
+        self.timestamps = timestamps        # float64 epoch seconds
+        self.values = values                # vital -> float64 array
+        self.rejected = rejected            # number of invalid readings
+        self.errors = errors                # details of the first MAX_REPORTED_ERRORS
+
+    def __len__(self):
+        return len(self.patient_ids)
+
+def parse_batch(body, mimetype=None):
+    """Decode a request body into columns (field -> list or array of values)"""
+    if mimetype == WIRE_MIMETYPE:
+        return records_to_columns(decode_records(body))
+
+    text = body.decode('utf-8')
+    if mimetype in NDJSON_MIMETYPES:
+        lines = [line for line in text.splitlines() if line.strip()]
+        try:
+            # One C-level parse for the whole batch instead of one per line
+            data = json.loads('[' + ','.join(lines) + ']')
+        except ValueError:
+            for number, line in enumerate(lines, 1):
+                try:
+                    json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"Line {number}: {e}")
+            raise
+    else:
+        data = json.loads(text)
+
+    if isinstance(data, dict):
+        if not isinstance(data.get('patient_id'), list):
+            raise ValueError("A columnar batch needs a 'patient_id' array")
+        size = len(data['patient_id'])
+        columns = {}
+        for name in INGEST_FIELDS:
+            column = data.get(name)
+            if column is None:
+                column = [None] * size
+            elif not isinstance(column, list) or len(column) != size:
+                raise ValueError(f"'{name}' must be an array as long as 'patient_id'")
+            columns[name] = column
+        return columns
+
+    if isinstance(data, list):
+        if not all(isinstance(reading, dict) for reading in data):
+            raise ValueError("Each reading must be a JSON object")
+        return {name: [reading.get(name) for reading in data] for name in INGEST_FIELDS}
+
+    raise ValueError("Expected a JSON array, NDJSON or an object of arrays")
+
+def _to_floats(values):
+    """Convert a list to float64, with NaN for anything missing or not numeric"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        converted = np.empty(len(values))
+        for i, value in enumerate(values):
+            try:
+                converted[i] = float(value) if value is not None and not isinstance(value, bool) else np.nan
+            except (TypeError, ValueError):
+                converted[i] = np.nan
+        return converted
+
+def _to_timestamps(values, now):
+    """Convert timestamps to epoch seconds; missing ones become now, bad ones NaN"""
+    try:
+        timestamps = np.array(values, dtype=np.float64)
+    except (TypeError, ValueError):
+        timestamps = np.empty(len(values))
+        for i, value in enumerate(values):
+            try:
+                parsed = parse_timestamp(value)
+                timestamps[i] = now if parsed is None else parsed
+            except (TypeError, ValueError):
+                timestamps[i] = np.nan
+        return timestamps
+    timestamps[np.isnan(timestamps)] = now
+    return timestamps
+
+def _describe_error(columns, values, timestamps, now, i):
+    patient_id = columns['patient_id'][i]
+    if not isinstance(patient_id, str) or not patient_id:
+        return 'patient_id must be a non-empty string'
+    if np.isnan(timestamps[i]):
+        return f"Invalid timestamp: {columns['timestamp'][i]!r}"
+    if not MIN_TIMESTAMP <= timestamps[i] <= now + MAX_CLOCK_SKEW:
+        return f"Timestamp {columns['timestamp'][i]!r} is not epoch seconds between 2000 and now"
+    for name, (low, high) in VITAL_LIMITS.items():
+        value = values[name][i]
+        if np.isnan(value):
+            return f"Missing or non-numeric {name}: {columns[name][i]!r}"
+        if not low <= value <= high:
+            return f"{name} {columns[name][i]} is outside {low}-{high}"
+    return 'Invalid reading'
+
+def validate_batch(columns, now=None):
+    """Check every reading of a batch in one pass and keep the valid ones"""
+    now = time.time() if now is None else now
+    patient_ids = columns['patient_id']
+    timestamps = _to_timestamps(columns['timestamp'], now)
+    values = {name: _to_floats(columns[name]) for name in VITAL_LIMITS}
+
+    if set(map(type, patient_ids)) <= {str} and '' not in set(patient_ids):
+        valid = np.ones(len(patient_ids), dtype=bool)
+    else:
+        valid = np.fromiter((isinstance(pid, str) and pid != '' for pid in patient_ids),
+                            dtype=bool, count=len(patient_ids))
+    # NaN and infinities fail the comparisons too
+    valid &= (timestamps >= MIN_TIMESTAMP) & (timestamps <= now + MAX_CLOCK_SKEW)
+    for name, (low, high) in VITAL_LIMITS.items():
+        # Same bounds as validate_vital_ranges(); NaN fails both comparisons
+        valid &= (values[name] >= low) & (values[name] <= high)
+
+    if valid.all():
+        return ReadingBatch(patient_ids, timestamps, values, 0, [])
+
+    invalid = np.flatnonzero(~valid)
+    errors = [{'index': int(i), 'error': _describe_error(columns, values, timestamps, now, i)}
+              for i in invalid[:MAX_REPORTED_ERRORS]]
+    keep = np.flatnonzero(valid)
+    return ReadingBatch(
+        [patient_ids[i] for i in keep.tolist()],
+        timestamps[keep],
+        {name: value[keep] for name, value in values.items()},
+        len(invalid),
+        errors
+    )
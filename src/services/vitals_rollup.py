@@ -0,0 +1,241 @@
+"""
+Incremental downsampling tiers (1 minute, 1 hour) over the vitals history
+
+Each tier keeps, per patient, the bucket currently being filled plus a ring
+buffer of closed buckets with the min/max/mean of every vital and the
+reading count. Buckets are updated with array operations as readings
+arrive, so long-window queries read a bounded number of buckets instead of
+scanning raw readings.
+"""
+import numpy as np
+from .vitals_buffer import VitalsRingBuffer
+
+class RollupTier:
+    """Fixed-width time buckets with min/max/mean/count per vital"""
+
+    def __init__(self, bucket_seconds, capacity, vital_fields, patients=0):
+        self.bucket_seconds = bucket_seconds
+        self.vital_fields = tuple(vital_fields)
+        fields = {'timestamp': np.float64, 'count': np.int32}
+        for name in self.vital_fields:
+            fields.update({f'{name}_min': np.float32, f'{name}_max': np.float32, f'{name}_mean': np.float32})
+        self.buckets = VitalsRingBuffer(fields, capacity=capacity)
+
+        # State of the bucket being filled, one entry per patient
+        self.open_start = np.empty(0, dtype=np.float64)
+        self.open_count = np.empty(0, dtype=np.int64)
+        self.open_min = {name: np.empty(0) for name in self.vital_fields}
+        self.open_max = {name: np.empty(0) for name in self.vital_fields}
+        self.open_sum = {name: np.empty(0) for name in self.vital_fields}
+        self.resize(patients)
+
+    def resize(self, patients):
+        """Grow the tier to hold the given number of patients"""
+        extra = patients - len(self.open_start)
+        if extra <= 0:
+            return
+        self.buckets.resize(patients)
+        self.open_start = np.concatenate([self.open_start, np.full(extra, np.nan)])
+        self.open_count = np.concatenate([self.open_count, np.zeros(extra, dtype=np.int64)])
+        for name in self.vital_fields:
+            self.open_min[name] = np.concatenate([self.open_min[name], np.full(extra, np.inf)])
+            self.open_max[name] = np.concatenate([self.open_max[name], np.full(extra, -np.inf)])
+            self.open_sum[name] = np.concatenate([self.open_sum[name], np.zeros(extra)])
+
+    def _close(self, rows):
+        """Move the open buckets of the given rows into the ring buffer"""
+        counts = self.open_count[rows]
+        closed = {'timestamp': self.open_start[rows], 'count': counts}
+        for name in self.vital_fields:
+            closed[f'{name}_min'] = self.open_min[name][rows]
+            closed[f'{name}_max'] = self.open_max[name][rows]
+            closed[f'{name}_mean'] = self.open_sum[name][rows] / counts
+            self.open_min[name][rows] = np.inf
+            self.open_max[name][rows] = -np.inf
+            self.open_sum[name][rows] = 0.0
+        self.buckets.append(closed, rows=rows)
+        self.open_count[rows] = 0
+
+    def update(self, rows, timestamps, values):
+        """Fold one reading per (unique) row into its bucket"""
+        bucket = np.floor(np.asarray(timestamps, dtype=np.float64) / self.bucket_seconds) * self.bucket_seconds
+        bucket = np.broadcast_to(bucket, rows.shape)
+        has_open = self.open_count[rows] > 0
+        # Late readings are folded into the open bucket rather than reopening an old one
+        bucket = np.where(has_open, np.maximum(bucket, self.open_start[rows]), bucket)
+
+        closing = has_open & (bucket != self.open_start[rows])
+        if closing.any():
+            self._close(rows[closing])
+
+        self.open_start[rows] = bucket
+        self.open_count[rows] += 1
+        for name in self.vital_fields:
+            value = np.broadcast_to(values[name], rows.shape)
+            self.open_min[name][rows] = np.minimum(self.open_min[name][rows], value)
+            self.open_max[name][rows] = np.maximum(self.open_max[name][rows], value)
+            self.open_sum[name][rows] += value
+
+    def update_many(self, rows, timestamps, values):
+        """Fold any number of readings per row into the buckets, in batch order.
+
+        Same result as one update() per reading, but readings are grouped
+        by (row, bucket) and reduced with ``reduceat`` instead.
+        """
+        order = np.argsort(rows, kind='stable')
+        rows = rows[order]
+        bucket = np.floor(np.broadcast_to(timestamps, order.shape)[order] / self.bucket_seconds) * self.bucket_seconds
+        first = np.r_[True, rows[1:] != rows[:-1]]
+        starts = np.flatnonzero(first)
+
+        # Late readings fold into the open bucket: a row's bucket never moves backwards
+        open_rows = starts[self.open_count[rows[starts]] > 0]
+        bucket[open_rows] = np.maximum(bucket[open_rows], self.open_start[rows[open_rows]])
+        if (bucket[1:] < bucket[:-1])[~first[1:]].any():
+            # Running maximum within each row: offset every row past the previous one's range
+            low = bucket.min()
+            span = bucket.max() - low + self.bucket_seconds
+            offset = rows * span
+            bucket = np.maximum.accumulate(bucket - low + offset) - offset + low
+
+        # Rows moving on from their open bucket close it first
+        first_bucket = bucket[starts]
+        closing = rows[starts][(self.open_count[rows[starts]] > 0) & (first_bucket != self.open_start[rows[starts]])]
+        if len(closing):
+            self._close(closing)
+
+        group_starts = np.flatnonzero(first | np.r_[True, bucket[1:] != bucket[:-1]])
+        group_rows = rows[group_starts]
+        counts = np.diff(np.r_[group_starts, len(rows)])
+        is_last = np.r_[group_rows[1:] != group_rows[:-1], True]
+        is_first = np.r_[True, group_rows[1:] != group_rows[:-1]]
+
+        # The first group of each row continues whatever its open bucket holds
+        first_rows = group_rows[is_first]
+        counts[is_first] += self.open_count[first_rows]
+        stats = {}
+        for name in self.vital_fields:
+            value = np.broadcast_to(values[name], order.shape)[order].astype(np.float64)
+            low = np.minimum.reduceat(value, group_starts)
+            high = np.maximum.reduceat(value, group_starts)
+            total = np.add.reduceat(value, group_starts)
+            low[is_first] = np.minimum(low[is_first], self.open_min[name][first_rows])
+            high[is_first] = np.maximum(high[is_first], self.open_max[name][first_rows])
+            total[is_first] += self.open_sum[name][first_rows]
+            stats[name] = (low, high, total)
+
+        done = ~is_last
+        if done.any():
+            closed = {'timestamp': bucket[group_starts][done], 'count': counts[done]}
+            for name, (low, high, total) in stats.items():
+                closed[f'{name}_min'] = low[done]
+                closed[f'{name}_max'] = high[done]
+                closed[f'{name}_mean'] = total[done] / counts[done]
+            self.buckets.append(closed, rows=group_rows[done])
+
+        last_rows = group_rows[is_last]
+        self.open_start[last_rows] = bucket[group_starts][is_last]
+        self.open_count[last_rows] = counts[is_last]
+        for name, (low, high, total) in stats.items():
+            self.open_min[name][last_rows] = low[is_last]
+            self.open_max[name][last_rows] = high[is_last]
+            self.open_sum[name][last_rows] = total[is_last]
+
+    def state(self):
+        """Copies of the arrays needed to rebuild the tier"""
+        state = {f'buckets.{name}': value for name, value in self.buckets.state().items()}
+        state['open_start'] = self.open_start.copy()
+        state['open_count'] = self.open_count.copy()
+        for name in self.vital_fields:
+            state[f'open_min.{name}'] = self.open_min[name].copy()
+            state[f'open_max.{name}'] = self.open_max[name].copy()
+            state[f'open_sum.{name}'] = self.open_sum[name].copy()
+        return state
+
+    def load_state(self, state):
+        """Restore arrays produced by state()"""
+        self.buckets.load_state({name[len('buckets.'):]: value for name, value in state.items()
+                                 if name.startswith('buckets.')})
+        self.open_start[:] = state['open_start']
+        self.open_count[:] = state['open_count']
+        for name in self.vital_fields:
+            self.open_min[name][:] = state[f'open_min.{name}']
+            self.open_max[name][:] = state[f'open_max.{name}']
+            self.open_sum[name][:] = state[f'open_sum.{name}']
+
+    def covers(self, row, start=None):
+        """Whether the tier still holds every bucket of a patient from start on (from the first without a start)"""
+        if self.buckets.counts[row] <= self.buckets.capacity:
+            return True
+        return start is not None and start >= self.buckets.latest(row)['timestamp'][0]
+
+    def query(self, row, start=None, end=None):
+        """Buckets of one patient starting within [start, end], including the open one"""
+        columns = self.buckets.latest(row)
+        timestamps = columns['timestamp']
+        lo = 0 if start is None else np.searchsorted(timestamps, start - self.bucket_seconds, side='right')
+        hi = len(timestamps) if end is None else np.searchsorted(timestamps, end, side='right')
+        columns = {name: column[lo:hi] for name, column in columns.items()}
+
+        open_start = self.open_start[row]
+        if self.open_count[row] and (start is None or open_start > start - self.bucket_seconds) \
+                and (end is None or open_start <= end):
+            count = self.open_count[row]
+            partial = {'timestamp': [open_start], 'count': [count]}
+            for name in self.vital_fields:
+                partial[f'{name}_min'] = [self.open_min[name][row]]
+                partial[f'{name}_max'] = [self.open_max[name][row]]
+                partial[f'{name}_mean'] = [self.open_sum[name][row] / count]
+            columns = {name: np.concatenate([column, np.asarray(partial[name], dtype=column.dtype)])
+                       for name, column in columns.items()}
+        return columns
+
+class VitalsRollups:
+    """The set of rollup tiers kept for every patient"""
+
+    def __init__(self, vital_fields, tiers, patients=0):
+        # tiers: iterable of (bucket_seconds, capacity), kept finest first
+        self.tiers = [RollupTier(seconds, capacity, vital_fields, patients)
+                      for seconds, capacity in sorted(tiers)]
+
+    def resize(self, patients):
+        for tier in self.tiers:
+            tier.resize(patients)
+
+    def update(self, timestamps, values, rows=None):
+        """Fold a batch of readings into every tier (every patient when rows is omitted)"""
+        if rows is None:
+            rows = np.arange(len(self.tiers[0].open_start))
+            for tier in self.tiers:
+                tier.update(rows, timestamps, values)
+        elif len(rows):
+            # A patient may have several readings in the batch
+            rows = np.asarray(rows, dtype=np.int64)
+            for tier in self.tiers:
+                tier.update_many(rows, timestamps, values)
+
+    def state(self):
+        """Arrays of every tier, keyed by tier width"""
+        return {f'{tier.bucket_seconds}s.{name}': value
+                for tier in self.tiers for name, value in tier.state().items()}
+
+    def load_state(self, state):
+        for tier in self.tiers:
+            prefix = f'{tier.bucket_seconds}s.'
+            tier.load_state({name[len(prefix):]: value for name, value in state.items() if name.startswith(prefix)})
+
+    def select(self, resolution, row=None, start=None):
+        """Coarsest tier whose buckets are no wider than the requested resolution.
+
+        With a row, the tier must also still reach back to start; when it has
+        already dropped those buckets, the next coarser tier that does is
+        used. None when the resolution is finer than every tier or no tier
+        reaches back far enough.
+        """
+        meeting = [tier for tier in self.tiers if tier.bucket_seconds <= resolution]
+        if not meeting:
+            return None
+        for tier in meeting[::-1] + self.tiers[len(meeting):]:
+            if row is None or tier.covers(row, start):
+                return tier
+        return None
@@ -1,198 +1,885 @@
-import random
 import time
 import threading
 import os
-from datetime import datetime, timedelta
+import json
+from datetime import datetime
+import numpy as np
 from src.models import VitalSigns, Alert
+from src.models.database import Database
+from src.utils.config import Config
+from .vitals_buffer import VitalsRingBuffer
+from .vitals_store import VitalsStore
+from .vitals_rollup import VitalsRollups
+from .vitals_trends import VitalsTrends
+from .early_warning import EarlyWarningScore, RISK_LEVELS
+from .anomaly import AnomalyDetector, ANOMALY_KINDS
+from .alert_store import AlertStore
+from .thresholds import ThresholdTable, STATUS_NAMES
+from .event_bus import EventBus
+from .scheduler import tick_scheduler
+
+DEFAULT_PATIENT_ID = 'default'
+
+# Order of the per-vital arrays held by the simulator
+VITAL_FIELDS = ('heart_rate', 'spo2', 'temperature', 'respiratory_rate')
+
+# Whole-number vitals are stored as small integers, temperature as float
+VITAL_DTYPES = {
+    'heart_rate': np.int16,
+    'spo2': np.int16,
+    'temperature': np.float32,
+    'respiratory_rate': np.int16
+}
+
+# History columns: epoch-seconds timestamp followed by the vitals
+HISTORY_FIELDS = {'timestamp': np.float64, **VITAL_DTYPES}
+
+def vital_value(vital_name, value):
+    """Convert an array element to the plain Python value reported by the API"""
+    value = value.item()
+    # float32 storage would otherwise leak digits like 37.09999847
+    return round(value, 1) if vital_name == 'temperature' else value
+
+def columns_to_readings(columns):
+    """Convert per-field history columns into the list of reading dicts served by the API"""
+    timestamps = [datetime.fromtimestamp(ts).isoformat() for ts in columns['timestamp'].tolist()]
+    temperatures = [round(value, 1) for value in columns['temperature'].tolist()]
+    return [
+        {
+            'heart_rate': heart_rate,
+            'spo2': spo2,
+            'temperature': temperature,
+            'respiratory_rate': respiratory_rate,
+            'timestamp': timestamp
+        }
+        for heart_rate, spo2, temperature, respiratory_rate, timestamp in zip(
+            columns['heart_rate'].tolist(), columns['spo2'].tolist(), temperatures,
+            columns['respiratory_rate'].tolist(), timestamps
+        )
+    ]
 
 class VitalsSimulator:
-    """Handles real-time vitals simulation"""
-    
-    def __init__(self):
-        self.current_vitals = VitalSigns()
-        self.vitals_history = []
-        self.alerts_list = []
+    """Handles real-time vitals simulation for a ward of patients.
+
+    Every vital is held as one NumPy array with a row per patient, so a
+    single tick advances the whole ward with a handful of array operations.
+    """
+
+    def __init__(self, patient_ids=None, seed=None, history_capacity=None, scheduler=None):
+        self.rng = np.random.default_rng(seed)
+        self.patient_ids = []
+        self.patient_index = {}
+        self.vitals = {name: np.empty(0, dtype=VITAL_DTYPES[name]) for name in VITAL_FIELDS}
+        self.timestamps = np.empty(0, dtype=np.float64)
+        self.vitals_history = VitalsRingBuffer(
+            HISTORY_FIELDS, capacity=history_capacity or Config.VITALS_HISTORY_CAPACITY
+        )
+        self.rollups = VitalsRollups(VITAL_FIELDS, [
+            (60, Config.ROLLUP_MINUTE_CAPACITY),
+            (3600, Config.ROLLUP_HOUR_CAPACITY)
+        ])
+        self.trends = VitalsTrends(VITAL_FIELDS, Config.TREND_WINDOW, Config.TREND_EWMA_ALPHA)
+        self.alerts = AlertStore(
+            dedupe_seconds=60,
+            retention_seconds=Config.ALERT_RETENTION_MINUTES * 60,
+            max_per_patient=Config.MAX_ALERTS,
+            max_anomalies_per_patient=Config.MAX_ANOMALY_ALERTS
+        )
         self.simulation_started = False
-        
+        # Serializes simulated ticks and device ingestion, which both write the arrays
+        self.lock = threading.RLock()
+        self.scheduler = scheduler or tick_scheduler
+        self.tick_jobs = {}           # interval -> tick job, kept across reschedules
+        self.tick_groups = {}         # interval -> rows its job ticks (None for the whole ward)
+        self.tick_origin = None       # scheduler time the tick grid is laid from
+        self.patient_intervals = {}   # row -> tick interval overriding the default; None pauses the patient
+        # Distinguishes this process's version counters from a previous run's in ETags
+        self.epoch = os.urandom(4).hex()
+        self.listeners = []
+        self.store = None
+        self.wal = None
+        self.database = None
+        self.events = EventBus()
+
         # Normal ranges for vitals - optimized to reduce false alerts
-        self.VITAL_RANGES = {
-            'heart_rate': {'normal': (60, 100), 'warning': (45, 120), 'critical': (35, 140)},
-            'spo2': {'normal': (95, 100), 'warning': (88, 94), 'critical': (0, 87)},
-            'temperature': {'normal': (36.0, 38.0), 'warning': (35.0, 39.0), 'critical': (33.0, 41.0)},
-            'respiratory_rate': {'normal': (10, 25), 'warning': (8, 30), 'critical': (5, 35)}
+        self.thresholds = ThresholdTable()
+        self.early_warning = EarlyWarningScore()
+        self.anomalies = AnomalyDetector(
+            VITAL_FIELDS, z_threshold=Config.ANOMALY_Z_THRESHOLD, cusum_threshold=Config.ANOMALY_CUSUM_THRESHOLD
+        ) if Config.ANOMALY_DETECTION else None
+
+        self.add_patients(patient_ids or [DEFAULT_PATIENT_ID])
+
+    def add_patients(self, patient_ids):
+        """Register new patients starting from baseline vitals"""
+        with self.lock:
+            if self._register_patients(patient_ids) and self.simulation_started:
+                self._schedule_ticks()
+
+    def _register_patients(self, patient_ids):
+        """Add rows for the patients not registered yet and return their ids; call with the lock held"""
+        new_ids = [pid for pid in dict.fromkeys(patient_ids) if pid not in self.patient_index]
+        if not new_ids:
+            return new_ids
+
+        baseline = VitalSigns()
+        for name in VITAL_FIELDS:
+            fill = np.full(len(new_ids), getattr(baseline, name), dtype=VITAL_DTYPES[name])
+            self.vitals[name] = np.concatenate([self.vitals[name], fill])
+        self.timestamps = np.concatenate([self.timestamps, np.full(len(new_ids), time.time())])
+
+        for pid in new_ids:
+            self.patient_index[pid] = len(self.patient_ids)
+            self.patient_ids.append(pid)
+        self.vitals_history.resize(len(self.patient_ids))
+        self.rollups.resize(len(self.patient_ids))
+        self.trends.resize(len(self.patient_ids))
+        if self.anomalies is not None:
+            self.anomalies.resize(len(self.patient_ids))
+        self.thresholds.resize(len(self.patient_ids))
+        if self.wal is not None:
+            self.wal.log_patients(new_ids)
+        if self.database is not None:
+            self.database.save_patients(new_ids)
+        return new_ids
+
+    def add_patient(self, patient_id):
+        """Register a single patient"""
+        self.add_patients([patient_id])
+
+    def add_listener(self, listener):
+        """Register a sink whose on_readings() receives every batch of new readings"""
+        self.listeners.append(listener)
+
+    def attach_store(self, store):
+        """Persist readings to a long-term store and serve time-range queries from it"""
+        self.store = store
+        self.add_listener(store)
+
+    def attach_database(self, database):
+        """Persist patients, readings and alerts to SQLite and serve searches from it"""
+        self.database = database
+        database.save_patients(self.patient_ids)
+        self.add_listener(database)
+        # Keep alert ids unique across restarts
+        self.alerts.next_id = max(self.alerts.next_id, database.max_alert_id() + 1)
+
+    def save_patient(self, patient_id, patient):
+        """Store the details of a Patient model in the database, when one is attached"""
+        if self.database is not None:
+            self.database.save_patient(patient_id, patient)
+
+    def get_patient(self, patient_id=None):
+        """Stored details of a patient, or None without a database or stored details"""
+        if self.database is None:
+            return None
+        details = self.database.get_patient(self.patient_ids[self.get_patient_row(patient_id)])
+        # Patients registered by id alone have no details yet
+        return details if details is not None and details['name'] is not None else None
+
+    def attach_wal(self, wal):
+        """Restore state from a write-ahead log, then log every change to it"""
+        if self.wal is not None:
+            return
+        with self.lock:
+            # Patients only take replayed readings newer than their current ones
+            self.timestamps[:] = -np.inf
+            wal.recover(self)
+            self.timestamps[np.isneginf(self.timestamps)] = time.time()
+            self.wal = wal
+        wal.start(self)
+
+    def snapshot_state(self):
+        """Copies of the whole in-memory state as named arrays, for a write-ahead log snapshot"""
+        meta = {
+            'patient_ids': self.patient_ids,
+            'patient_intervals': self.patient_intervals,
+            'alerts': [alert.to_dict() for alert in self.alerts.alerts.values()],
+            'next_alert_id': self.alerts.next_id,
+            'cleared_through': self.alerts.cleared_through
         }
-    
-    def get_vital_status(self, vital_name, value):
-        """Determine the status of a vital sign"""
-        ranges = self.VITAL_RANGES[vital_name]
-        
-        if ranges['normal'][0] <= value <= ranges['normal'][1]:
-            return 'normal'
-        elif ranges['warning'][0] <= value <= ranges['warning'][1]:
-            return 'warning'
-        else:
-            return 'critical'
-    
-    def generate_realistic_vitals(self):
-        """Generate realistic vital signs with controlled variation"""
-        # Production mode: very conservative with occasional alerts
-        is_production = os.environ.get('DEBUG', 'False').lower() == 'false'
-        
-        if is_production:
-            # Very controlled changes in production - mostly stay normal
-            if random.random() < 0.05:  # 5% chance of any change
-                self.current_vitals.heart_rate += random.randint(-1, 1)
-                self.current_vitals.spo2 += random.randint(-1, 1) if random.random() < 0.3 else 0
-                self.current_vitals.temperature += random.uniform(-0.05, 0.05)
-                self.current_vitals.respiratory_rate += random.randint(-1, 1) if random.random() < 0.3 else 0
-            
-            # Occasionally create a brief alert condition (very rare)
-            if random.random() < 0.001:  # 0.1% chance of alert condition
-                alert_type = random.choice(['temp_high', 'hr_low', 'rr_high'])
-                if alert_type == 'temp_high':
-                    self.current_vitals.temperature = 38.2  # Warning level
-                elif alert_type == 'hr_low':
-                    self.current_vitals.heart_rate = 55  # Warning level  
-                elif alert_type == 'rr_high':
-                    self.current_vitals.respiratory_rate = 26  # Warning level
-            
-            # Keep within safe bounds - allow brief excursions for alerts
-            self.current_vitals.heart_rate = max(50, min(100, self.current_vitals.heart_rate))
-            self.current_vitals.spo2 = max(95, min(100, self.current_vitals.spo2))
-            self.current_vitals.temperature = max(36.0, min(38.5, round(self.current_vitals.temperature, 1)))
-            self.current_vitals.respiratory_rate = max(12, min(28, self.current_vitals.respiratory_rate))
-        else:
-            # Development mode: more variation for testing
-            self.current_vitals.heart_rate += random.randint(-2, 2)
-            self.current_vitals.spo2 += random.randint(-1, 1) if random.random() < 0.3 else 0
-            self.current_vitals.temperature += random.uniform(-0.1, 0.1)
-            self.current_vitals.respiratory_rate += random.randint(-1, 1) if random.random() < 0.4 else 0
-            
-            # Keep within wider testing ranges
-            self.current_vitals.heart_rate = max(45, min(120, self.current_vitals.heart_rate))
-            self.current_vitals.spo2 = max(88, min(100, self.current_vitals.spo2))
-            self.current_vitals.temperature = max(35.5, min(39.0, round(self.current_vitals.temperature, 1)))
-            self.current_vitals.respiratory_rate = max(8, min(30, self.current_vitals.respiratory_rate))
-        
-        self.current_vitals.timestamp = datetime.now().isoformat()
-        
-        # Add to history
-        self.vitals_history.append(self.current_vitals.to_dict())
-        
-        # Keep only last 100 readings
-        if len(self.vitals_history) > 100:
-            self.vitals_history.pop(0)
-        
-        # Check for alerts - less frequently in production
-        check_frequency = 0.1 if is_production else 0.3
-        if random.random() < check_frequency:
-            self.check_vitals_alerts()
-    
-    def check_vitals_alerts(self):
-        """Check vital signs and generate alerts if necessary"""
-        # Limit total alerts to prevent memory issues
-        MAX_ALERTS = 50
-        
-        vitals_dict = self.current_vitals.to_dict()
-        for vital_name, value in vitals_dict.items():
-            if vital_name == 'timestamp':
-                continue
-                
-            status = self.get_vital_status(vital_name, value)
-            
-            if status in ['warning', 'critical']:
-                # Check for recent similar alerts (within 60 seconds)
-                current_time = datetime.now()
-                recent_alerts = [a for a in self.alerts_list if 
-                               a.vital == vital_name and 
-                               a.type == status and
-                               (current_time - datetime.fromisoformat(a.timestamp)).total_seconds() < 60]
-                
-                # Only add alert if no recent similar alerts
-                if not recent_alerts and len(self.alerts_list) < MAX_ALERTS:
+        state = {'meta': np.array(json.dumps(meta)), 'timestamps': self.timestamps.copy()}
+        for name in VITAL_FIELDS:
+            state[f'vitals.{name}'] = self.vitals[name].copy()
+        state.update({f'history.{name}': value for name, value in self.vitals_history.state().items()})
+        state.update({f'rollups.{name}': value for name, value in self.rollups.state().items()})
+        state.update({f'trends.{name}': value for name, value in self.trends.state().items()})
+        if self.anomalies is not None:
+            state.update({f'anomalies.{name}': value for name, value in self.anomalies.state().items()})
+        return state
+
+    def load_snapshot_state(self, state):
+        """Restore a snapshot_state() taken by a simulator built the same way"""
+        meta = json.loads(str(state['meta']))
+        if meta['patient_ids'][:len(self.patient_ids)] != self.patient_ids:
+            raise ValueError("Snapshot was taken with different initial patients")
+        self.add_patients(meta['patient_ids'])
+        self.timestamps[:] = state['timestamps']
+        for name in VITAL_FIELDS:
+            self.vitals[name][:] = state[f'vitals.{name}']
+
+        targets = [('history.', self.vitals_history), ('rollups.', self.rollups), ('trends.', self.trends)]
+        if self.anomalies is not None:
+            targets.append(('anomalies.', self.anomalies))
+        for prefix, target in targets:
+            try:
+                target.load_state({name[len(prefix):]: value for name, value in state.items()
+                                   if name.startswith(prefix)})
+            except (KeyError, ValueError) as e:
+                # e.g. VITALS_HISTORY_CAPACITY changed since the snapshot
+                print(f"Could not restore {prefix.rstrip('.')} from snapshot: {e}")
+
+        self.patient_intervals = {int(row): seconds for row, seconds in meta['patient_intervals'].items()}
+        self.alerts.next_id = max(self.alerts.next_id, meta['next_alert_id'])
+        self.alerts.cleared_through = meta['cleared_through']
+        for alert in meta['alerts']:
+            self.restore_alert(alert)
+
+    def replay_patients(self, patient_ids):
+        """Re-register logged patients; their vitals come from the readings replayed next"""
+        known = len(self.patient_ids)
+        self.add_patients(patient_ids)
+        self.timestamps[known:] = -np.inf
+
+    def replay_readings(self, rows, timestamps, values):
+        """Re-apply logged readings to history, rollups and current vitals, without notifying anyone"""
+        self.vitals_history.append({'timestamp': timestamps, **values}, rows=rows)
+        self.rollups.update(timestamps, values, rows=rows)
+        self.trends.update(timestamps, values, rows=rows)
+        if self.anomalies is not None:
+            # Alerts were logged on their own; only the detector state is rebuilt
+            self.anomalies.update(values, rows)
+        self._update_current(rows, timestamps, values)
+
+    def restore_alert(self, data):
+        """Re-add a logged alert, keeping its id and how long ago it fired"""
+        alert = Alert(data['type'], data['vital'], data['value'], data['message'], data['patient_id'])
+        alert.id = data['id']
+        alert.timestamp = data['timestamp']
+        alert.acknowledged = data['acknowledged']
+        age = max(0.0, time.time() - datetime.fromisoformat(alert.timestamp).timestamp())
+        self.alerts.restore(alert, self.alerts.clock() - age)
+
+    def _record_readings(self, timestamps, values, rows=None):
+        """Add a batch of readings (every patient when rows is omitted) to history and listeners"""
+        self.vitals_history.append({'timestamp': timestamps, **values}, rows=rows)
+        self.rollups.update(timestamps, values, rows=rows)
+        self.trends.update(timestamps, values, rows=rows)
+        if self.wal is not None:
+            self.wal.log_readings(np.arange(len(self.patient_ids)) if rows is None else rows, timestamps, values)
+
+        patient_ids = self.patient_ids if rows is None else [self.patient_ids[row] for row in rows]
+        timestamps = np.broadcast_to(timestamps, (len(patient_ids),))
+        for listener in self.listeners:
+            try:
+                listener.on_readings(patient_ids, timestamps, values)
+            except Exception as e:
+                print(f"Vitals listener error: {e}")
+
+        # Push fresh vitals only for patients someone is watching
+        watched = self.events.watched_patients()
+        if rows is not None:
+            watched.intersection_update(patient_ids)
+        for patient_id in watched:
+            if patient_id in self.patient_index:
+                self.events.publish('vitals', self.get_current_vitals(patient_id), patient_id)
+
+    def _raise_alert(self, alert, now=None):
+        """Store a new alert and push it to subscribers"""
+        with self.lock:
+            self.alerts.add(alert, now)
+            if self.wal is not None:
+                self.wal.log_alert(alert)
+            if self.database is not None:
+                self.database.save_alert(alert)
+        self.events.publish('alert', alert.to_dict(), alert.patient_id)
+        return alert
+
+    def get_patient_ids(self):
+        """Ids of every registered patient, in registration order"""
+        return list(self.patient_ids)
+
+    def get_patient_row(self, patient_id=None):
+        """Map a patient id to its row in the vitals arrays"""
+        if patient_id is None:
+            patient_id = DEFAULT_PATIENT_ID
+        try:
+            return self.patient_index[patient_id]
+        except KeyError:
+            raise KeyError(f"Unknown patient: {patient_id}")
+
+    def get_vital_status(self, vital_name, value, patient_id=None):
+        """Determine the status of a vital sign, using a patient's own ranges when given"""
+        row = None if patient_id is None else self.get_patient_row(patient_id)
+        return self.thresholds.status(vital_name, value, row)
+
+    def get_thresholds(self, patient_id=None):
+        """Get the vital ranges in effect, for one patient when given"""
+        row = None if patient_id is None else self.get_patient_row(patient_id)
+        return self.thresholds.to_dict(row)
+
+    def set_patient_thresholds(self, patient_id, vital_name, normal=None, warning=None):
+        """Override the normal and/or warning range of one vital for one patient"""
+        self.thresholds.set_patient_ranges(self.get_patient_row(patient_id), vital_name, normal, warning)
+        return self.get_thresholds(patient_id)
+
+    def generate_realistic_vitals(self, rows=None):
+        """Generate realistic vital signs with controlled variation for every patient (or the given rows)"""
+        with self.lock:
+            # Production mode: very conservative with occasional alerts
+            is_production = os.environ.get('DEBUG', 'False').lower() == 'false'
+
+            rng = self.rng
+            selected = slice(None) if rows is None else rows
+            # Whole-ward ticks work on the arrays in place; a subset works on a copy written back below
+            heart_rate = self.vitals['heart_rate'][selected]
+            spo2 = self.vitals['spo2'][selected]
+            temperature = self.vitals['temperature'][selected]
+            respiratory_rate = self.vitals['respiratory_rate'][selected]
+            n = len(heart_rate)
+
+            if is_production:
+                # Very controlled changes in production - mostly stay normal
+                changing = rng.random(n) < 0.05  # 5% chance of any change
+                heart_rate += rng.integers(-1, 2, n) * changing
+                spo2 += rng.integers(-1, 2, n) * (changing & (rng.random(n) < 0.3))
+                temperature += rng.uniform(-0.05, 0.05, n) * changing
+                respiratory_rate += rng.integers(-1, 2, n) * (changing & (rng.random(n) < 0.3))
+
+                # Occasionally create a brief alert condition (very rare)
+                excursion = rng.random(n) < 0.001  # 0.1% chance of alert condition
+                alert_type = rng.integers(0, 3, n)
+                temperature[excursion & (alert_type == 0)] = 38.2  # Warning level
+                heart_rate[excursion & (alert_type == 1)] = 55  # Warning level
+                respiratory_rate[excursion & (alert_type == 2)] = 26  # Warning level
+
+                # Keep within safe bounds - allow brief excursions for alerts
+                np.clip(heart_rate, 50, 100, out=heart_rate)
+                np.clip(spo2, 95, 100, out=spo2)
+                np.clip(np.round(temperature, 1), 36.0, 38.5, out=temperature)
+                np.clip(respiratory_rate, 12, 28, out=respiratory_rate)
+            else:
+                # Development mode: more variation for testing
+                heart_rate += rng.integers(-2, 3, n)
+                spo2 += rng.integers(-1, 2, n) * (rng.random(n) < 0.3)
+                temperature += rng.uniform(-0.1, 0.1, n)
+                respiratory_rate += rng.integers(-1, 2, n) * (rng.random(n) < 0.4)
+
+                # Keep within wider testing ranges
+                np.clip(heart_rate, 45, 120, out=heart_rate)
+                np.clip(spo2, 88, 100, out=spo2)
+                np.clip(np.round(temperature, 1), 35.5, 39.0, out=temperature)
+                np.clip(respiratory_rate, 8, 30, out=respiratory_rate)
+
+            values = {
+                'heart_rate': heart_rate,
+                'spo2': spo2,
+                'temperature': temperature,
+                'respiratory_rate': respiratory_rate
+            }
+            if rows is not None:
+                for name, value in values.items():
+                    self.vitals[name][rows] = value
+
+            now = time.time()
+            self.timestamps[selected] = now
+
+            # Add the reading of every ticked patient to history
+            self._record_readings(now, values, rows)
+
+            # Anomaly detectors are stateful, so they see every reading
+            self.check_anomalies(rows, values)
+
+            # Check for alerts - less frequently in production
+            check_frequency = 0.1 if is_production else 0.3
+            if rng.random() < check_frequency:
+                self.check_vitals_alerts(rows)
+
+    def check_vitals_alerts(self, rows=None, values=None):
+        """Check vital signs and generate alerts if necessary.
+
+        Checks the current vitals of every patient (or the given rows), or
+        when ``values`` is given, one batch of readings aligned with ``rows``.
+        """
+        now = time.monotonic()
+        rows = np.arange(len(self.patient_ids)) if rows is None else np.asarray(rows)
+        if values is None:
+            values = {name: self.vitals[name][rows] for name in VITAL_FIELDS}
+        statuses = self.thresholds.classify_all(values, rows=rows)
+        for vital_name, codes in statuses.items():
+            # Only patients outside the normal range need a closer look
+            for i in np.flatnonzero(codes):
+                row = rows[i]
+                patient_id = self.patient_ids[row]
+                value = vital_value(vital_name, values[vital_name][i])
+                status = STATUS_NAMES[codes[i]]
+
+                # Skip if a similar alert fired within the last minute or the patient is at the cap
+                if self.alerts.should_fire(patient_id, vital_name, status, now):
                     alert = Alert(
                         alert_type=status,
                         vital=vital_name,
                         value=value,
-                        message=f"{vital_name.replace('_', ' ').title()} is {status}: {value}"
+                        message=f"{vital_name.replace('_', ' ').title()} is {status}: {value}",
+                        patient_id=patient_id
                     )
-                    alert.id = len(self.alerts_list) + 1
-                    self.alerts_list.append(alert)
+                    self._raise_alert(alert, now)
                     # Reduce console spam in production
-                    if len(self.alerts_list) <= 10:  # Only log first 10 alerts
+                    if alert.id <= 10:  # Only log first 10 alerts
                         print(f"Alert generated: {alert.message}")
-        
-        # Keep only recent alerts (last 30 minutes)
-        cutoff_time = datetime.now() - timedelta(minutes=30)
-        self.alerts_list = [a for a in self.alerts_list if 
-                           datetime.fromisoformat(a.timestamp) > cutoff_time]
-    
-    def vitals_simulation_loop(self):
-        """Background thread to simulate real-time vitals"""
-        try:
-            is_production = os.environ.get('DEBUG', 'False').lower() == 'false'
-            sleep_interval = 30 if is_production else 10  # Slower in production
-            
-            while True:
-                self.generate_realistic_vitals()
-                time.sleep(sleep_interval)
-        except Exception as e:
-            print(f"Simulation error: {e}")
-            # Restart simulation after error
-            time.sleep(5)
-            self.vitals_simulation_loop()
-    
+
+        # Keep only recent alerts (last ALERT_RETENTION_MINUTES)
+        self.alerts.expire(now)
+
+    def check_anomalies(self, rows=None, values=None):
+        """Run the z-score/CUSUM detectors on a batch of readings and raise 'anomaly' alerts.
+
+        ``values`` defaults to the current vitals of every patient (or the
+        given rows); otherwise it is one batch aligned with ``rows``.
+        """
+        if self.anomalies is None:
+            return
+        now = time.monotonic()
+        rows = np.arange(len(self.patient_ids)) if rows is None else np.asarray(rows)
+        if values is None:
+            values = {name: self.vitals[name][rows] for name in VITAL_FIELDS}
+        for i, vital_name, kind, z in self.anomalies.update(values, rows):
+            row = rows[i]
+            patient_id = self.patient_ids[row]
+            if not self.alerts.should_fire(patient_id, vital_name, 'anomaly', now):
+                continue
+            value = vital_value(vital_name, values[vital_name][i])
+            baseline = round(self.anomalies.baseline(row, vital_name), 1)
+            self._raise_alert(Alert(
+                alert_type='anomaly',
+                vital=vital_name,
+                value=value,
+                message=f"{vital_name.replace('_', ' ').title()} {ANOMALY_KINDS[kind]}: {value} "
+                        f"(baseline {baseline}, z={z:.1f})",
+                patient_id=patient_id
+            ), now)
+
+    def ingest_readings(self, patient_ids, timestamps, values):
+        """Record a validated batch of device readings for any number of patients.
+
+        Unknown patients are registered, and patients fed by devices stop
+        being simulated. Readings older than a patient's newest recorded one
+        are dropped as late, as the long-term store does, so history stays in
+        time order; the others go to history and alert checks, and the newest
+        reading of each patient becomes its current vitals.
+        """
+        if not len(patient_ids):
+            return {'accepted': 0, 'late': 0, 'patients': 0, 'registered': 0}
+
+        with self.lock:
+            known = len(self.patient_ids)
+            registered = self._register_patients(patient_ids)
+            # Patients registered by this batch have no reading yet; any of theirs is newer
+            self.timestamps[known:] = -np.inf
+            rows = np.array(list(map(self.patient_index.__getitem__, patient_ids)), dtype=np.int64)
+
+            # History and the long-term store expect each patient's readings in time order
+            order = np.argsort(timestamps, kind='stable')
+            rows = rows[order]
+            timestamps = np.asarray(timestamps, dtype=np.float64)[order]
+            values = {
+                name: (np.rint(values[name][order]) if np.issubdtype(VITAL_DTYPES[name], np.integer)
+                       else values[name][order]).astype(VITAL_DTYPES[name])
+                for name in VITAL_FIELDS
+            }
+            # Device rows stop being simulated before the tick groups are rebuilt, once per batch
+            device_rows = np.unique(rows)
+            paused = [row for row in device_rows.tolist() if self.patient_intervals.get(row, 0) is not None]
+            if paused:
+                self.patient_intervals.update(dict.fromkeys(paused))
+                if self.wal is not None:
+                    self.wal.log_intervals(dict.fromkeys(paused))
+            if (registered or paused) and self.simulation_started:
+                self._schedule_ticks()
+
+            # Late readings would put history out of time order; the long-term store drops them too
+            in_order = timestamps >= self.vitals_history.newest('timestamp', rows, -np.inf)
+            late = len(rows) - int(in_order.sum())
+            if late:
+                rows, timestamps = rows[in_order], timestamps[in_order]
+                values = {name: value[in_order] for name, value in values.items()}
+
+            self._update_current(rows, timestamps, values)
+            self._record_readings(timestamps, values, rows)
+            self.check_vitals_alerts(rows, values)
+            self.check_anomalies(rows, values)
+
+        return {'accepted': len(rows), 'late': late, 'patients': len(device_rows),
+                'registered': len(self.patient_ids) - known}
+
+    def _update_current(self, rows, timestamps, values):
+        """Make the newest reading of each row its current vitals, unless the row already has a newer one"""
+        last = len(rows) - 1 - np.unique(rows[::-1], return_index=True)[1]
+        last = last[timestamps[last] >= self.timestamps[rows[last]]]
+        latest_rows = rows[last]
+        for name in VITAL_FIELDS:
+            self.vitals[name][latest_rows] = values[name][last]
+        self.timestamps[latest_rows] = timestamps[last]
+
+    def default_tick_interval(self):
+        """Seconds between simulated readings unless a patient has its own interval"""
+        is_production = os.environ.get('DEBUG', 'False').lower() == 'false'
+        return Config.SIMULATION_INTERVAL_PROD if is_production else Config.SIMULATION_INTERVAL_DEV  # Slower in production
+
+    def set_patient_interval(self, patient_id, seconds):
+        """Tick one patient every given number of seconds; None stops simulating it"""
+        if seconds is not None and seconds <= 0:
+            raise ValueError(f"Tick interval must be positive: {seconds}")
+        row = self.get_patient_row(patient_id)
+        with self.lock:
+            self.patient_intervals[row] = seconds
+            if self.wal is not None:
+                self.wal.log_intervals({row: seconds})
+            if self.simulation_started:
+                self._schedule_ticks()
+
+    def _schedule_ticks(self):
+        """Keep one tick job per distinct patient interval, ticking the rows that use it.
+
+        Jobs already running keep their place on the fixed-rate grid and only
+        get new rows; a new interval starts at the next point of the grid laid
+        from the first schedule, and an interval nobody uses is cancelled.
+        """
+        default = self.default_tick_interval()
+        groups = {}
+        for row in range(len(self.patient_ids)):
+            interval = self.patient_intervals.get(row, default)
+            if interval is not None:
+                groups.setdefault(interval, []).append(row)
+        # The whole ward in one group ticks in place without index arrays
+        self.tick_groups = {interval: None if len(rows) == len(self.patient_ids) else np.array(rows)
+                            for interval, rows in groups.items()}
+
+        for interval in [interval for interval in self.tick_jobs if interval not in groups]:
+            self.scheduler.cancel(self.tick_jobs.pop(interval))
+        now = self.scheduler.clock()
+        if self.tick_origin is None:
+            self.tick_origin = now
+        for interval in sorted(groups):
+            if interval not in self.tick_jobs:
+                # Ticks take the lock, which is held here, so the job is known before its first run
+                scheduled = {}
+                self.tick_jobs[interval] = scheduled['job'] = self.scheduler.schedule(
+                    f'vitals-{interval:g}s', interval, lambda scheduled=scheduled: self._run_tick(scheduled['job']),
+                    delay=-(now - self.tick_origin) % interval
+                )
+
+    def _run_tick(self, job):
+        """Tick the rows of a job's interval as they are once the lock is held"""
+        with self.lock:
+            # A job cancelled while it waited for the lock must not tick; rows paused
+            # meanwhile have already left the group
+            if job.cancelled:
+                return
+            self.generate_realistic_vitals(self.tick_groups[job.interval])
+
+    def get_tick_stats(self):
+        """Run counts and late/skipped ticks of the simulation jobs"""
+        # _schedule_ticks replaces jobs under the lock
+        with self.lock:
+            jobs = list(self.tick_jobs.values())
+        return {job.name: job.to_dict() for job in jobs}
+
     def start_simulation(self):
         """Start the vitals simulation if not already started"""
         # Skip simulation if disabled via environment variable
         if os.environ.get('DISABLE_SIMULATION', 'false').lower() == 'true':
             print("Simulation disabled via DISABLE_SIMULATION environment variable")
             return
-        
+
         # Enable controlled simulation in production
         is_production = os.environ.get('DEBUG', 'False').lower() == 'false'
         if is_production:
             print("Production mode: Starting controlled vitals simulation")
         else:
             print("Development mode: Starting full vitals simulation")
-            
+
         if not self.simulation_started:
             try:
-                simulation_thread = threading.Thread(target=self.vitals_simulation_loop, daemon=True)
-                simulation_thread.start()
+                with self.lock:
+                    self._schedule_ticks()
+                self.scheduler.start()
                 self.simulation_started = True
                 print("Vitals simulation started successfully")
             except Exception as e:
                 print(f"Failed to start simulation: {e}")
-    
-    def get_current_vitals(self):
+
+    def get_current_vitals(self, patient_id=None):
         """Get current vital signs"""
-        return self.current_vitals.to_dict()
-    
-    def get_vitals_history(self, limit=20):
-        """Get historical vital signs data"""
-        return self.vitals_history[-limit:]
-    
-    def get_alerts(self, limit=10):
-        """Get current alerts"""
-        return [alert.to_dict() for alert in self.alerts_list[-limit:]]
-    
+        row = self.get_patient_row(patient_id)
+        vitals = VitalSigns(*(vital_value(name, self.vitals[name][row]) for name in VITAL_FIELDS))
+        vitals.timestamp = datetime.fromtimestamp(self.timestamps[row]).isoformat()
+        return vitals.to_dict()
+
+    def get_ward_scores(self, limit=None, min_score=0):
+        """Early-warning score of every patient from their current vitals, highest first"""
+        with self.lock:
+            values = {name: self.vitals[name].copy() for name in VITAL_FIELDS}
+            timestamps = self.timestamps.copy()
+            patient_ids = list(self.patient_ids)
+        # The whole ward is scored in one pass; only the beds returned are turned into dicts
+        total, points, risk = self.early_warning.score(values)
+        ranked = np.argsort(-total, kind='stable')
+        ranked = ranked[total[ranked] >= min_score][:limit]
+        points = {name: column[ranked].tolist() for name, column in points.items()}
+        return {
+            'scored_at': datetime.now().isoformat(),
+            'patients': len(patient_ids),
+            'scores': [
+                {
+                    'patient_id': patient_ids[row],
+                    'score': score,
+                    'risk': RISK_LEVELS[level],
+                    'points': {name: column[i] for name, column in points.items()},
+                    'vitals_timestamp': datetime.fromtimestamp(timestamp).isoformat()
+                }
+                for i, (row, score, level, timestamp) in enumerate(zip(
+                    ranked.tolist(), total[ranked].tolist(), risk[ranked].tolist(), timestamps[ranked].tolist()
+                ))
+            ]
+        }
+
+    def _history_copy(self, row, limit=None):
+        """Copy of a patient's newest readings, taken under the lock so no tick can overwrite it midway"""
+        with self.lock:
+            return {name: column.copy() for name, column in self.vitals_history.latest(row, limit).items()}
+
+    def get_vitals_columns(self, limit=20, patient_id=None):
+        """Get historical vitals of one patient as per-field arrays"""
+        row = self.get_patient_row(patient_id)
+        return self._history_copy(row, limit)
+
+    def get_vitals_range(self, patient_id=None, start=None, end=None, limit=None):
+        """Get the vitals of one patient between two epoch timestamps as per-field arrays.
+
+        With a limit, only the newest ``limit`` readings of the range are returned.
+        """
+        row = self.get_patient_row(patient_id)
+        if self.store is not None:
+            records = self.store.query(self.patient_ids[row], start, end)
+            return records[-limit:] if limit else records
+        if self.database is not None:
+            columns = self.database.vitals_range(self.patient_ids[row], start, end, limit)
+            return {name: column.astype(HISTORY_FIELDS[name]) for name, column in columns.items()}
+
+        # Without a store only the in-memory history can answer
+        columns = self._history_copy(row)
+        timestamps = columns['timestamp']
+        lo = 0 if start is None else np.searchsorted(timestamps, start, side='left')
+        hi = len(timestamps) if end is None else np.searchsorted(timestamps, end, side='right')
+        if limit:
+            lo = max(lo, hi - limit)
+        return {name: column[lo:hi] for name, column in columns.items()}
+
+    def get_first_timestamp(self, patient_id=None):
+        """Timestamp of a patient's oldest reading still available, or None without readings"""
+        row = self.get_patient_row(patient_id)
+        if self.store is not None:
+            return self.store.first_timestamp(self.patient_ids[row])
+        if self.database is not None:
+            return self.database.first_timestamp(self.patient_ids[row])
+        timestamps = self._history_copy(row)['timestamp']
+        return float(timestamps[0]) if len(timestamps) else None
+
+    def get_vitals_page(self, patient_id=None, start=None, end=None, cursor=None, limit=10000):
+        """Get one page of a patient's readings for exports.
+
+        Returns ``{'columns': ..., 'cursor': ...}``; pass the cursor back to
+        get the next page until it is None.
+        """
+        row = self.get_patient_row(patient_id)
+        if self.store is not None:
+            offset = cursor or 0
+            records = self.store.query_page(self.patient_ids[row], start, end, offset, limit)
+            columns = {name: records[name] for name in HISTORY_FIELDS}
+            return {'columns': columns, 'cursor': offset + limit if len(records) == limit else None}
+        if self.database is not None:
+            columns, cursor = self.database.vitals_page(self.patient_ids[row], start, end, cursor, limit)
+            columns = {name: column.astype(HISTORY_FIELDS[name]) for name, column in columns.items()}
+            return {'columns': columns, 'cursor': cursor}
+        # The in-memory history is small enough to return at once
+        return {'columns': self.get_vitals_range(patient_id, start, end), 'cursor': None}
+
+    def get_alerts_page(self, patient_ids=None, start=None, end=None, cursor=None, limit=10000):
+        """Get one page of alerts in id order for exports, with the cursor of the next page"""
+        if self.database is not None:
+            alerts = self.database.alerts_page(patient_ids, start, end, cursor or 0, limit)
+            return {'alerts': alerts, 'cursor': alerts[-1]['id'] if len(alerts) == limit else None}
+        wanted = set(patient_ids or ())
+        alerts = [alert for alert in self.search_alerts(start=start, end=end, limit=len(self.alerts))
+                  if not wanted or alert['patient_id'] in wanted]
+        alerts.reverse()
+        return {'alerts': alerts, 'cursor': None}
+
+    def get_vitals_version(self, patient_id=None):
+        """Number of readings recorded for a patient; changes whenever its vitals do"""
+        return int(self.vitals_history.counts[self.get_patient_row(patient_id)])
+
+    def get_vitals_since(self, since, patient_id=None):
+        """Get the readings recorded after the given version.
+
+        ``complete`` is False when readings were missed because they already
+        left the in-memory history, or the version is from a previous run.
+        """
+        row = self.get_patient_row(patient_id)
+        with self.lock:
+            version = int(self.vitals_history.counts[row])
+            missed = version - since
+            columns = self._history_copy(row, missed if missed >= 0 else None)
+        complete = 0 <= missed <= self.vitals_history.capacity and since >= 0
+        return {'version': version, 'complete': complete, 'readings': columns_to_readings(columns)}
+
+    def get_history_columns(self, limit=20, patient_id=None, start=None, end=None):
+        """Get historical vitals as per-field arrays, optionally restricted to a time range"""
+        if start is None and end is None:
+            return self.get_vitals_columns(limit, patient_id)
+
+        columns = self.get_vitals_range(patient_id, start, end, limit)
+        return {name: columns[name] for name in HISTORY_FIELDS}
+
+    def get_vitals_history(self, limit=20, patient_id=None, start=None, end=None):
+        """Get historical vital signs data, optionally restricted to a time range"""
+        return columns_to_readings(self.get_history_columns(limit, patient_id, start, end))
+
+    def get_vitals_rollup(self, patient_id=None, start=None, end=None, resolution=0):
+        """Get min/max/mean buckets from the coarsest tier that still meets the resolution.
+
+        A tier that no longer reaches back to start gives way to a coarser
+        one, then to the raw readings of the long-term store. ``complete``
+        is False when nothing kept reaches back that far.
+        """
+        row = self.get_patient_row(patient_id)
+        long_term = self.store is not None or self.database is not None
+        complete = True
+        with self.lock:
+            tier = self.rollups.select(resolution, row, start)
+            if tier is None and not long_term and resolution >= self.rollups.tiers[0].bucket_seconds:
+                # Only memory to answer from: the longest tier is the most there is
+                tier = self.rollups.tiers[-1]
+                complete = False
+            if tier is not None:
+                columns = {key: column.copy() for key, column in tier.query(row, start, end).items()}
+        if tier is None:
+            # Finer than the smallest tier (or older than every tier): every raw reading is its own bucket
+            columns = self.get_vitals_range(patient_id, start, end)
+            columns = {'timestamp': columns['timestamp'], 'count': np.ones(len(columns['timestamp']), dtype=np.int32),
+                       **{f'{name}_{stat}': columns[name] for name in VITAL_FIELDS for stat in ('min', 'max', 'mean')}}
+
+        stats = {key: [round(value, 2) for value in column.tolist()] for key, column in columns.items()
+                 if key not in ('timestamp', 'count')}
+        buckets = []
+        for i, (timestamp, count) in enumerate(zip(columns['timestamp'].tolist(), columns['count'].tolist())):
+            bucket = {'timestamp': datetime.fromtimestamp(timestamp).isoformat(), 'count': count}
+            for name in VITAL_FIELDS:
+                bucket[name] = {stat: stats[f'{name}_{stat}'][i] for stat in ('min', 'max', 'mean')}
+            buckets.append(bucket)
+        return {'resolution': tier.bucket_seconds if tier else 0, 'complete': complete, 'buckets': buckets}
+
+    def get_vital_trends(self, patient_id=None):
+        """Rolling EWMA, mean/std, min/max and slope of each vital over the last TREND_WINDOW readings"""
+        row = self.get_patient_row(patient_id)
+        with self.lock:
+            trends = self.trends.query(row)
+        return {'patient_id': self.patient_ids[row], 'window': self.trends.window, **trends}
+
+    def get_alerts(self, limit=10, patient_id=None):
+        """Get current alerts, optionally for a single patient"""
+        # Ticks and ingest change the alert store under the lock, so reads take it too
+        with self.lock:
+            self.alerts.expire()
+            return [alert.to_dict() for alert in self.alerts.recent(limit, patient_id)]
+
+    def get_alerts_version(self):
+        """Counter that changes whenever alerts are added, expire or are cleared"""
+        with self.lock:
+            self.alerts.expire()
+            return self.alerts.version
+
+    def get_alerts_since(self, since, patient_id=None):
+        """Get the alerts added after the given alert id.
+
+        ``reset`` tells the client to discard the alerts it holds: they were
+        cleared, or the id is from a previous run.
+        """
+        with self.lock:
+            self.alerts.expire()
+            last_id = self.alerts.last_id
+            reset = since < self.alerts.cleared_through or since > last_id
+            alerts = [alert.to_dict() for alert in self.alerts.since(since if since <= last_id else 0, patient_id)]
+        return {'version': last_id, 'reset': reset, 'alerts': alerts}
+
+    def acknowledge_alert(self, alert_id):
+        """Mark an alert as acknowledged; returns it, or None when no such alert exists"""
+        with self.lock:
+            alert = self.alerts.acknowledge(alert_id)
+            if alert is not None and self.wal is not None:
+                self.wal.log_acknowledged(alert_id)
+        if alert is not None:
+            data = alert.to_dict()
+        elif self.database is not None:
+            # Alerts that already expired or were cleared are only in the database
+            data = self.database.get_alert(alert_id)
+            if data is None:
+                return None
+            data['acknowledged'] = True
+        else:
+            return None
+        if self.database is not None:
+            self.database.acknowledge_alert(alert_id)
+        self.events.publish('alert_acknowledged', data, data['patient_id'])
+        return data
+
+    def search_alerts(self, patient_id=None, vital=None, alert_type=None, start=None, end=None,
+                      acknowledged=None, limit=100):
+        """Search past and active alerts, newest first; only active ones without a database"""
+        if self.database is not None:
+            return self.database.search_alerts(patient_id, vital, alert_type, start, end, acknowledged, limit)
+
+        matches = []
+        with self.lock:
+            self.alerts.expire()
+            for alert in reversed(self.alerts.alerts.values()):
+                created = datetime.fromisoformat(alert.timestamp).timestamp()
+                if ((patient_id is None or alert.patient_id == patient_id)
+                        and (vital is None or alert.vital == vital)
+                        and (alert_type is None or alert.type == alert_type)
+                        and (start is None or created >= start)
+                        and (end is None or created <= end)
+                        and (acknowledged is None or alert.acknowledged == acknowledged)):
+                    matches.append(alert.to_dict())
+                    if len(matches) >= limit:
+                        break
+        return matches
+
     def clear_alerts(self):
         """Clear all alerts"""
-        self.alerts_list = []
+        with self.lock:
+            self.alerts.clear()
+            if self.wal is not None:
+                self.wal.log_cleared()
+        self.events.publish('alerts_cleared', {})
         return True
-    
-    def create_test_alert(self):
+
+    def create_test_alert(self, patient_id=None):
         """Generate a test emergency alert"""
         test_alert = Alert(
             alert_type='critical',
             vital='heart_rate',
             value=180,
-            message='TEST ALERT: Critical heart rate detected - 180 BPM'
+            message='TEST ALERT: Critical heart rate detected - 180 BPM',
+            patient_id=patient_id or DEFAULT_PATIENT_ID
         )
-        test_alert.id = len(self.alerts_list) + 1
-        self.alerts_list.append(test_alert)
+        self._raise_alert(test_alert)
         return test_alert.to_dict()
 
 # Global instance
 vitals_simulator = VitalsSimulator()
+if Config.VITALS_STORE_DIR:
+    vitals_simulator.attach_store(VitalsStore(Config.VITALS_STORE_DIR, Config.VITALS_STORE_SEGMENT_RECORDS))
+if Config.DATABASE_PATH:
+    vitals_simulator.attach_database(Database(Config.DATABASE_PATH))
@@ -0,0 +1,252 @@
+"""
+Append-only, memory-mapped time-series store for long-term vitals retention
+
+Every patient gets its own directory of fixed-size segment files. A segment
+is a preallocated array of fixed-width little-endian records (see
+``RECORD_DTYPE``) mapped into memory with ``np.memmap``; appending writes
+straight into the mapping and the OS flushes dirty pages in the background.
+Segments are named after the sequence number of their first record.
+
+Timestamps are non-decreasing within a patient, which keeps two levels of
+index cheap: the first/last timestamp of every segment, and a sparse index
+holding every ``INDEX_STRIDE``-th timestamp of a segment. Range queries
+bisect both and only then binary-search the mapped records, so a query
+touches a handful of pages no matter how much history is on disk.
+"""
+import os
+import threading
+from bisect import bisect_left, bisect_right
+from urllib.parse import quote, unquote
+import numpy as np
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('heart_rate', '<i2'),
+    ('spo2', '<i2'),
+    ('temperature', '<f4'),
+    ('respiratory_rate', '<i2')
+])
+
+SEGMENT_SUFFIX = '.seg'
+INDEX_STRIDE = 1024
+
+def patient_dirname(patient_id):
+    """Encode a patient id as a safe directory name"""
+    return quote(str(patient_id), safe='').replace('.', '%2E')
+
+class Segment:
+    """One memory-mapped segment file of a patient"""
+
+    def __init__(self, path, start_seq, capacity, create=False):
+        self.path = path
+        self.start_seq = start_seq
+        if create:
+            with open(path, 'wb') as f:
+                f.truncate(capacity * RECORD_DTYPE.itemsize)
+        self.records = np.memmap(path, dtype=RECORD_DTYPE, mode='r+')
+        self.capacity = len(self.records)
+        self.timestamps = self.records['timestamp']
+        self.count = self._find_count()
+        self.sparse_index = self.timestamps[:self.count:INDEX_STRIDE].tolist()
+
+    def _find_count(self):
+        """Number of written records: timestamps are positive, unwritten slots are zero"""
+        lo, hi = 0, self.capacity
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamps[mid] > 0:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    @property
+    def first_timestamp(self):
+        return float(self.timestamps[0]) if self.count else None
+
+    @property
+    def last_timestamp(self):
+        return float(self.timestamps[self.count - 1]) if self.count else None
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    def write(self, records):
+        """Write as many records as fit and return how many were written"""
+        size = min(len(records), self.capacity - self.count)
+        start = self.count
+        self.records[start:start + size] = records[:size]
+        self.count += size
+        # Extend the sparse index with every stride boundary just crossed
+        first_entry = -(-start // INDEX_STRIDE) * INDEX_STRIDE
+        self.sparse_index.extend(self.timestamps[first_entry:self.count:INDEX_STRIDE].tolist())
+        return size
+
+    def search(self, start, end):
+        """Return the [lo, hi) record positions with start <= timestamp <= end"""
+        return self._position(start, bisect_left, 'left'), self._position(end, bisect_right, 'right')
+
+    def _position(self, value, bisect, side):
+        block = max(bisect(self.sparse_index, value) - 1, 0)
+        lo = block * INDEX_STRIDE
+        hi = min(lo + 2 * INDEX_STRIDE, self.count)
+        return lo + int(np.searchsorted(self.timestamps[lo:hi], value, side=side))
+
+    def flush(self):
+        self.records.flush()
+
+class PatientSeries:
+    """The ordered segments holding one patient's readings"""
+
+    def __init__(self, directory, segment_records):
+        self.directory = directory
+        self.segment_records = segment_records
+        os.makedirs(directory, exist_ok=True)
+        names = sorted(name for name in os.listdir(directory) if name.endswith(SEGMENT_SUFFIX))
+        self.segments = [
+            Segment(os.path.join(directory, name), int(name[:-len(SEGMENT_SUFFIX)]), segment_records)
+            for name in names
+        ]
+        self.segments = [segment for segment in self.segments if segment.count]
+        self.first_timestamps = [segment.first_timestamp for segment in self.segments]
+
+    @property
+    def count(self):
+        return self.segments[-1].start_seq + self.segments[-1].count if self.segments else 0
+
+    @property
+    def last_timestamp(self):
+        return self.segments[-1].last_timestamp if self.segments else None
+
+    def _new_segment(self):
+        start_seq = self.count
+        path = os.path.join(self.directory, f"{start_seq:016d}{SEGMENT_SUFFIX}")
+        segment = Segment(path, start_seq, self.segment_records, create=True)
+        self.segments.append(segment)
+        self.first_timestamps.append(None)
+        return segment
+
+    def append(self, records):
+        """Append records, rolling over to new segments as they fill up"""
+        while len(records):
+            segment = self.segments[-1] if self.segments and not self.segments[-1].full else None
+            if segment is None:
+                segment = self._new_segment()
+            written = segment.write(records)
+            self.first_timestamps[-1] = segment.first_timestamp
+            records = records[written:]
+
+    def query(self, start, end):
+        """Copy out the records with start <= timestamp <= end"""
+        first = max(bisect_right(self.first_timestamps, start) - 1, 0)
+        last = bisect_right(self.first_timestamps, end)
+        chunks = []
+        for segment in self.segments[first:last]:
+            lo, hi = segment.search(start, end)
+            if hi > lo:
+                chunks.append(segment.records[lo:hi])
+        if not chunks:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.array(np.concatenate(chunks))
+
+    def query_page(self, start, end, offset, limit):
+        """Copy out at most ``limit`` records of query(start, end), skipping the first ``offset``"""
+        first = max(bisect_right(self.first_timestamps, start) - 1, 0)
+        last = bisect_right(self.first_timestamps, end)
+        chunks = []
+        for segment in self.segments[first:last]:
+            lo, hi = segment.search(start, end)
+            skipped = min(offset, hi - lo)
+            offset -= skipped
+            lo += skipped
+            if hi > lo:
+                chunks.append(segment.records[lo:min(hi, lo + limit)])
+                limit -= len(chunks[-1])
+                if not limit:
+                    break
+        if not chunks:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.array(np.concatenate(chunks))
+
+    def flush(self):
+        if self.segments:
+            self.segments[-1].flush()
+
+class VitalsStore:
+    """On-disk store of every patient's vitals, queried by time range"""
+
+    def __init__(self, base_dir, segment_records=65536):
+        self.base_dir = base_dir
+        self.segment_records = segment_records
+        self.series = {}
+        self.dropped = 0
+        self.lock = threading.Lock()
+        os.makedirs(base_dir, exist_ok=True)
+
+    def patient_ids(self):
+        """Every patient with data on disk"""
+        return [unquote(name) for name in sorted(os.listdir(self.base_dir))
+                if os.path.isdir(os.path.join(self.base_dir, name))]
+
+    def _series(self, patient_id):
+        series = self.series.get(patient_id)
+        if series is None:
+            directory = os.path.join(self.base_dir, patient_dirname(patient_id))
+            series = self.series[patient_id] = PatientSeries(directory, self.segment_records)
+        return series
+
+    def append(self, patient_id, records):
+        """Append a record array for one patient, dropping readings older than the last stored one"""
+        with self.lock:
+            series = self._series(patient_id)
+            last = series.last_timestamp or 0.0
+            timestamps = records['timestamp']
+            if timestamps[0] <= last or (len(records) > 1 and (np.diff(timestamps) < 0).any()):
+                newest_before = np.maximum.accumulate(np.r_[last, timestamps])[:-1]
+                in_order = (timestamps >= newest_before) & (timestamps > 0)
+                self.dropped += int(len(records) - in_order.sum())
+                records = records[in_order]
+            series.append(records)
+
+    def on_readings(self, patient_ids, timestamps, values):
+        """Persist a batch of readings, one record per entry of ``patient_ids``"""
+        records = np.empty(len(patient_ids), dtype=RECORD_DTYPE)
+        records['timestamp'] = timestamps
+        for name in RECORD_DTYPE.names[1:]:
+            records[name] = values[name]
+
+        groups = {}
+        for i, patient_id in enumerate(patient_ids):
+            groups.setdefault(patient_id, []).append(i)
+        for patient_id, indexes in groups.items():
+            if len(indexes) == 1:
+                self.append(patient_id, records[indexes[0]:indexes[0] + 1])
+            else:
+                self.append(patient_id, records[indexes])
+
+    def query(self, patient_id, start=None, end=None):
+        """Return the readings of a patient between two epoch timestamps as a record array"""
+        start = -np.inf if start is None else start
+        end = np.inf if end is None else end
+        with self.lock:
+            return self._series(patient_id).query(start, end)
+
+    def first_timestamp(self, patient_id):
+        """Timestamp of a patient's oldest stored reading, or None without readings"""
+        with self.lock:
+            first_timestamps = self._series(patient_id).first_timestamps
+            return first_timestamps[0] if first_timestamps else None
+
+    def query_page(self, patient_id, start=None, end=None, offset=0, limit=10000):
+        """Like query(), but only ``limit`` records starting at ``offset``, for paging through long ranges"""
+        start = -np.inf if start is None else start
+        end = np.inf if end is None else end
+        with self.lock:
+            return self._series(patient_id).query_page(start, end, offset, limit)
+
+    def flush(self):
+        """Flush dirty pages of every open segment to disk"""
+        with self.lock:
+            for series in self.series.values():
+                series.flush()
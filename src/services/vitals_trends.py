@@ -0,0 +1,191 @@
+"""
+Incremental rolling statistics of every vital, per patient
+
+For each patient and vital this keeps an EWMA, the mean and variance of the
+last ``window`` readings (Welford's update, with the reading leaving the
+window removed as the new one enters), their rolling min/max and the
+least-squares slope against time. Each reading updates the state in O(1)
+with array operations over the whole batch, so a trend query reads a few
+array cells however long the history is.
+
+Rolling min/max use the van Herk/Gil-Werman block scheme rather than a
+monotonic deque, which would need a Python loop per patient: the window is
+the filled part of the current block (a running min/max) plus the tail of
+the previous block (suffix minima/maxima computed once per ``window``
+readings). The regression sums are recomputed from the window at the same
+time, relative to the newest timestamp, so they never lose precision.
+"""
+import numpy as np
+from .vitals_buffer import batch_ranks
+
+# A fitted change over the window smaller than this is reported as stable
+STABLE_CHANGE = 0.1
+
+class VitalsTrends:
+    """Rolling EWMA, mean/variance, min/max and slope of each vital over the last readings"""
+
+    def __init__(self, vital_fields, window=30, alpha=0.3, patients=0):
+        self.vital_fields = tuple(vital_fields)
+        self.window = window
+        self.alpha = alpha
+        vitals = len(self.vital_fields)
+        self.count = np.zeros(0, dtype=np.int64)
+        self.ewma = np.zeros((0, vitals))
+        self.mean = np.zeros((0, vitals))
+        self.m2 = np.zeros((0, vitals))
+        self.values = np.zeros((0, window, vitals))   # ring of the last readings
+        self.times = np.zeros((0, window))
+        self.prefix_min = np.zeros((0, vitals))       # min/max of the block being filled
+        self.prefix_max = np.zeros((0, vitals))
+        self.suffix_min = np.zeros((0, window + 1, vitals))   # suffix min/max of the previous block
+        self.suffix_max = np.zeros((0, window + 1, vitals))
+        self.origin = np.zeros(0)                     # regression times are relative to this
+        self.sum_t = np.zeros(0)
+        self.sum_tt = np.zeros(0)
+        self.sum_y = np.zeros((0, vitals))
+        self.sum_ty = np.zeros((0, vitals))
+        self.resize(patients)
+
+    def resize(self, patients):
+        """Grow the state to hold the given number of patients"""
+        extra = patients - len(self.count)
+        if extra <= 0:
+            return
+
+        def grow(array, fill=0):
+            return np.concatenate([array, np.full((extra, *array.shape[1:]), fill, array.dtype)])
+
+        for name in ('count', 'ewma', 'mean', 'm2', 'values', 'times', 'prefix_min', 'prefix_max',
+                     'origin', 'sum_t', 'sum_tt', 'sum_y', 'sum_ty'):
+            setattr(self, name, grow(getattr(self, name)))
+        # Before a block completes there is no previous block to contribute
+        self.suffix_min = grow(self.suffix_min, np.inf)
+        self.suffix_max = grow(self.suffix_max, -np.inf)
+
+    def update(self, timestamps, values, rows=None):
+        """Fold a batch of readings in, in batch order (every patient when rows is omitted)"""
+        if rows is None:
+            rows = np.arange(len(self.count))
+        rows = np.asarray(rows, dtype=np.int64)
+        timestamps = np.broadcast_to(np.asarray(timestamps, dtype=np.float64), rows.shape)
+        x = np.stack([np.broadcast_to(values[name], rows.shape) for name in self.vital_fields],
+                     axis=1).astype(np.float64)
+        ranks = batch_ranks(rows) if len(rows) else rows
+        if not len(rows) or not ranks.max():
+            self._update(rows, timestamps, x)
+            return
+        # A row's readings must be folded in one after another: one pass per rank
+        for rank in range(ranks.max() + 1):
+            selected = ranks == rank
+            self._update(rows[selected], timestamps[selected], x[selected])
+
+    def _update(self, rows, t, x):
+        """Fold in one reading for each of a set of unique rows"""
+        count = self.count[rows]
+        pos = count % self.window
+        full = (count >= self.window)[:, None]
+        first = count == 0
+
+        # EWMA, starting from the first reading
+        ewma = self.ewma[rows]
+        self.ewma[rows] = np.where(first[:, None], x, ewma + self.alpha * (x - ewma))
+
+        # Welford: add x, and remove the reading it replaces once the window is full
+        old_x = self.values[rows, pos]
+        old_t = self.times[rows, pos]
+        mean = self.mean[rows]
+        n = np.minimum(count + 1, self.window)[:, None]
+        new_mean = np.where(full, mean + (x - old_x) / n, mean + (x - mean) / n)
+        self.m2[rows] += np.where(full, (x - old_x) * (x - new_mean + old_x - mean), (x - mean) * (x - new_mean))
+        self.mean[rows] = new_mean
+
+        # Regression sums, relative to the row's origin
+        self.origin[rows] = np.where(first, t, self.origin[rows])
+        origin = self.origin[rows]
+        dt = t - origin
+        old_dt = np.where(full[:, 0], old_t - origin, 0.0)
+        old_y = np.where(full, old_x, 0.0)
+        self.sum_t[rows] += dt - old_dt
+        self.sum_tt[rows] += dt * dt - old_dt * old_dt
+        self.sum_y[rows] += x - old_y
+        self.sum_ty[rows] += dt[:, None] * x - old_dt[:, None] * old_y
+
+        self.values[rows, pos] = x
+        self.times[rows, pos] = t
+        block_start = (pos == 0)[:, None]
+        self.prefix_min[rows] = np.where(block_start, x, np.minimum(self.prefix_min[rows], x))
+        self.prefix_max[rows] = np.where(block_start, x, np.maximum(self.prefix_max[rows], x))
+        self.count[rows] = count + 1
+
+        # A completed block becomes the previous block: O(window) once every window readings
+        done = rows[pos == self.window - 1]
+        if len(done):
+            block = self.values[done]
+            self.suffix_min[done, :self.window] = np.minimum.accumulate(block[:, ::-1], axis=1)[:, ::-1]
+            self.suffix_max[done, :self.window] = np.maximum.accumulate(block[:, ::-1], axis=1)[:, ::-1]
+            self._rebase(done)
+
+    def _rebase(self, rows):
+        """Recompute the regression sums of full windows exactly, relative to their newest time"""
+        times = self.times[rows]
+        origin = times[np.arange(len(rows)), (self.count[rows] - 1) % self.window]
+        dt = times - origin[:, None]
+        block = self.values[rows]
+        self.origin[rows] = origin
+        self.sum_t[rows] = dt.sum(axis=1)
+        self.sum_tt[rows] = (dt * dt).sum(axis=1)
+        self.sum_y[rows] = block.sum(axis=1)
+        self.sum_ty[rows] = (dt[:, :, None] * block).sum(axis=1)
+
+    def query(self, row):
+        """Statistics of every vital for one patient, or None for vitals with no readings"""
+        count = int(self.count[row])
+        if not count:
+            return {'readings': 0, 'vitals': {name: None for name in self.vital_fields}}
+        n = min(count, self.window)
+        pos = (count - 1) % self.window
+        low = np.minimum(self.prefix_min[row], self.suffix_min[row, pos + 1])
+        high = np.maximum(self.prefix_max[row], self.suffix_max[row, pos + 1])
+        variance = self.m2[row] / (n - 1) if n > 1 else np.full(len(self.vital_fields), np.nan)
+        denominator = n * self.sum_tt[row] - self.sum_t[row] ** 2
+        oldest = (pos + 1) % self.window if count >= self.window else 0
+        span = abs(self.times[row, pos] - self.times[row, oldest])
+        if n > 1 and denominator > 0:
+            slope = (n * self.sum_ty[row] - self.sum_t[row] * self.sum_y[row]) / denominator
+        else:
+            slope = np.full(len(self.vital_fields), np.nan)
+
+        vitals = {}
+        for i, name in enumerate(self.vital_fields):
+            if np.isnan(slope[i]):
+                trend = 'insufficient_data'
+            elif abs(slope[i] * span) < STABLE_CHANGE:
+                trend = 'stable'
+            else:
+                trend = 'increasing' if slope[i] > 0 else 'decreasing'
+            vitals[name] = {
+                'ewma': round(float(self.ewma[row, i]), 2),
+                'mean': round(float(self.mean[row, i]), 2),
+                'std': None if np.isnan(variance[i]) else round(float(np.sqrt(max(variance[i], 0.0))), 2),
+                'min': round(float(low[i]), 2),
+                'max': round(float(high[i]), 2),
+                # Per minute, which reads better than per second for vitals
+                'slope_per_minute': None if np.isnan(slope[i]) else round(float(slope[i] * 60), 3),
+                'trend': trend
+            }
+        return {'readings': n, 'vitals': vitals}
+
+    def state(self):
+        """Copies of the arrays needed to rebuild the statistics"""
+        return {name: getattr(self, name).copy() for name in (
+            'count', 'ewma', 'mean', 'm2', 'values', 'times', 'prefix_min', 'prefix_max',
+            'suffix_min', 'suffix_max', 'origin', 'sum_t', 'sum_tt', 'sum_y', 'sum_ty'
+        )}
+
+    def load_state(self, state):
+        """Restore arrays produced by state() for the same window"""
+        for name, value in state.items():
+            target = getattr(self, name)
+            if value.shape[1:] != target.shape[1:]:
+                raise ValueError(f"trend state {name} has shape {value.shape}, expected {target.shape}")
+            target[:len(value)] = value
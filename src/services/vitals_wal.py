@@ -0,0 +1,282 @@
+"""
+Write-ahead log of readings and alert events, with snapshots for fast restarts
+
+Every change to the simulator's in-memory state is appended to the current
+log segment (``wal-<seq>.log``) as a framed record::
+
+    header:  uint8 type  uint32 payload length  uint32 CRC-32 of the payload
+    payload: PATIENTS   JSON list of newly registered patient ids
+             READINGS   packed READING_DTYPE records
+             ALERT      JSON of the alert
+             CLEARED    empty (all alerts were cleared)
+             ACKED      uint32 id of an acknowledged alert
+             INTERVALS  JSON {row: tick interval in seconds, or null}
+
+Appends only go to a memory buffer. A flusher thread writes the buffer and
+fsyncs it once per WAL_FLUSH_INTERVAL_MS (group commit), so ticks never wait
+for the disk and a crash loses at most that window. Every
+WAL_SNAPSHOT_INTERVAL seconds the log rolls over to a new segment, the whole
+state is saved to ``snapshot.npz`` and the segments it covers are deleted.
+
+Recovery loads the snapshot and replays the segments written after it,
+stopping at the first torn or corrupt record.
+"""
+import atexit
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+import numpy as np
+from src.utils.config import Config
+from .vitals_store import RECORD_DTYPE
+
+PATIENTS, READINGS, ALERT, CLEARED, INTERVALS, ACKED = 1, 2, 3, 4, 5, 6
+RECORD_HEADER = struct.Struct('<BII')
+ALERT_ID = struct.Struct('<I')
+
+# One reading: the patient's row followed by a long-term store record
+READING_DTYPE = np.dtype([('row', '<i4'), *RECORD_DTYPE.descr])
+
+SEGMENT_PREFIX = 'wal-'
+SEGMENT_SUFFIX = '.log'
+SNAPSHOT_NAME = 'snapshot.npz'
+REPLAY_BATCH_RECORDS = 4096
+
+def read_records(data):
+    """Yield (type, payload) of each intact record, then the offset where they end"""
+    offset = 0
+    view = memoryview(data)
+    while offset + RECORD_HEADER.size <= len(data):
+        record_type, length, crc = RECORD_HEADER.unpack_from(data, offset)
+        start = offset + RECORD_HEADER.size
+        payload = view[start:start + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            break
+        yield record_type, payload
+        offset = start + length
+    yield None, offset
+
+class WriteAheadLog:
+    """Durable log of the simulator's readings and alerts, replayed on restart"""
+
+    def __init__(self, directory, flush_interval=0.1, snapshot_interval=300):
+        self.directory = directory
+        self.flush_interval = flush_interval        # seconds per group commit
+        self.snapshot_interval = snapshot_interval  # seconds between snapshots
+        os.makedirs(directory, exist_ok=True)
+        self.buffer = bytearray()
+        self.buffer_lock = threading.Lock()
+        self.io_lock = threading.Lock()            # orders flushes, rollovers and snapshots
+        self.file = None
+        self.segment = 0
+        self.simulator = None
+        self.thread = None
+        self.stopping = threading.Event()
+        self.last_snapshot = time.monotonic()
+        self.appended = 0
+        self.flushes = 0
+
+    def _segment_path(self, segment):
+        return os.path.join(self.directory, f'{SEGMENT_PREFIX}{segment:08d}{SEGMENT_SUFFIX}')
+
+    def segments(self):
+        """Sequence numbers of the segments on disk, oldest first"""
+        return sorted(
+            int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+            if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_SUFFIX)
+        )
+
+    # Appending
+
+    def _append(self, record_type, payload=b''):
+        header = RECORD_HEADER.pack(record_type, len(payload), zlib.crc32(payload))
+        with self.buffer_lock:
+            self.buffer += header
+            self.buffer += payload
+            self.appended += 1
+
+    def log_patients(self, patient_ids):
+        self._append(PATIENTS, json.dumps(list(patient_ids)).encode())
+
+    def log_readings(self, rows, timestamps, values):
+        """Log a batch of readings aligned with rows (timestamps may be a scalar)"""
+        records = np.empty(len(rows), dtype=READING_DTYPE)
+        records['row'] = rows
+        records['timestamp'] = timestamps
+        for name in RECORD_DTYPE.names[1:]:
+            records[name] = values[name]
+        self._append(READINGS, records.tobytes())
+
+    def log_alert(self, alert):
+        self._append(ALERT, json.dumps(alert.to_dict()).encode())
+
+    def log_cleared(self):
+        self._append(CLEARED)
+
+    def log_acknowledged(self, alert_id):
+        self._append(ACKED, ALERT_ID.pack(alert_id))
+
+    def log_intervals(self, intervals):
+        self._append(INTERVALS, json.dumps(intervals).encode())
+
+    def flush(self):
+        """Write everything appended so far and fsync it: one disk sync per group of records"""
+        with self.io_lock:
+            self._flush()
+
+    def _flush(self):
+        with self.buffer_lock:
+            data, self.buffer = self.buffer, bytearray()
+        if data and self.file is not None:
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            self.flushes += 1
+
+    def _open_segment(self, segment):
+        if self.file is not None:
+            self.file.close()
+        self.segment = segment
+        self.file = open(self._segment_path(segment), 'ab')
+
+    # Recovery
+
+    def recover(self, simulator):
+        """Load the snapshot and replay the log into a freshly built simulator"""
+        started = time.perf_counter()
+        first_segment = 0
+        snapshot_path = os.path.join(self.directory, SNAPSHOT_NAME)
+        if os.path.exists(snapshot_path):
+            with np.load(snapshot_path) as snapshot:
+                state = {name: snapshot[name] for name in snapshot.files}
+            first_segment = int(state.pop('wal_segment'))
+            simulator.load_snapshot_state(state)
+
+        records = 0
+        for segment in self.segments():
+            if segment < first_segment:
+                continue
+            path = self._segment_path(segment)
+            with open(path, 'rb') as f:
+                data = f.read()
+            pending = []
+            for record_type, payload in read_records(data):
+                # Runs of readings are applied as one batch rather than tick by tick
+                if record_type == READINGS:
+                    pending.append(payload)
+                    records += 1
+                    if len(pending) < REPLAY_BATCH_RECORDS:
+                        continue
+                if pending:
+                    self._replay_readings(simulator, pending)
+                    pending = []
+                if record_type is None:
+                    end = payload
+                    break
+                if record_type != READINGS:
+                    self._replay(simulator, record_type, payload)
+                    records += 1
+            if end < len(data):
+                # Drop the torn tail so records appended after a restart stay readable
+                print(f"Write-ahead log {path} ends in a torn record; truncating at byte {end}")
+                with open(path, 'r+b') as f:
+                    f.truncate(end)
+
+        simulator.alerts.expire()
+        elapsed = time.perf_counter() - started
+        if records or first_segment:
+            print(f"Restored vitals from write-ahead log ({records} records) in {elapsed:.3f}s")
+        return {'snapshot': bool(first_segment), 'records': records, 'seconds': elapsed}
+
+    def _replay_readings(self, simulator, payloads):
+        records = np.frombuffer(b''.join(payloads), dtype=READING_DTYPE)
+        simulator.replay_readings(
+            records['row'].astype(np.int64), records['timestamp'],
+            {name: records[name] for name in RECORD_DTYPE.names[1:]}
+        )
+
+    def _replay(self, simulator, record_type, payload):
+        if record_type == PATIENTS:
+            simulator.replay_patients(json.loads(bytes(payload)))
+        elif record_type == ALERT:
+            simulator.restore_alert(json.loads(bytes(payload)))
+        elif record_type == CLEARED:
+            simulator.alerts.clear()
+        elif record_type == ACKED:
+            simulator.alerts.acknowledge(ALERT_ID.unpack(payload)[0])
+        elif record_type == INTERVALS:
+            simulator.patient_intervals.update(
+                {int(row): seconds for row, seconds in json.loads(bytes(payload)).items()}
+            )
+
+    # Snapshots
+
+    def snapshot(self):
+        """Save the full state, roll over to a new segment and delete the ones it covers"""
+        simulator = self.simulator
+        with self.io_lock:
+            with simulator.lock:
+                # Nothing can be logged between the rollover and the copy of the state
+                self._flush()
+                self._open_segment(self.segment + 1)
+                state = simulator.snapshot_state()
+            state['wal_segment'] = np.array(self.segment)
+
+            path = os.path.join(self.directory, SNAPSHOT_NAME)
+            with open(path + '.tmp', 'wb') as f:
+                np.savez(f, **state)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + '.tmp', path)
+            for segment in self.segments():
+                if segment < self.segment:
+                    os.remove(self._segment_path(segment))
+        self.last_snapshot = time.monotonic()
+
+    # Background flusher
+
+    def start(self, simulator):
+        """Start appending to a new segment and flushing it in the background"""
+        self.simulator = simulator
+        segments = self.segments()
+        with self.io_lock:
+            self._open_segment((segments[-1] if segments else 0) + 1)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self.stopping.wait(self.flush_interval):
+            try:
+                self.flush()
+                if time.monotonic() - self.last_snapshot >= self.snapshot_interval:
+                    self.snapshot()
+            except Exception as e:
+                print(f"Write-ahead log error: {e}")
+
+    def stop(self):
+        """Flush what is left and stop the flusher"""
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join(5)
+            self.thread = None
+        with self.io_lock:
+            self._flush()
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+
+    def stats(self):
+        return {
+            'segment': self.segment,
+            'records': self.appended,
+            'flushes': self.flushes,
+            'pending_bytes': len(self.buffer)
+        }
+
+# Global instance (None when WAL_DIR is not set); attached by the worker that owns the simulation
+vitals_wal = WriteAheadLog(
+    Config.WAL_DIR, Config.WAL_FLUSH_INTERVAL_MS / 1000, Config.WAL_SNAPSHOT_INTERVAL
+) if Config.WAL_DIR else None
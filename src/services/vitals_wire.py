@@ -0,0 +1,68 @@
+"""
+Fixed-width binary encoding of vitals readings (see docs/BINARY_FORMAT.md)
+
+A message is an 8-byte header followed by 40-byte little-endian records:
+
+    header:  b'KCVW'  uint16 version (1)  uint16 record size (40)
+    record:  patient_id        16 bytes, UTF-8, NUL-padded
+             timestamp_ms      int64, epoch milliseconds (0 = time of arrival)
+             heart_rate        float32
+             spo2              float32
+             temperature       float32
+             respiratory_rate  float32
+
+Records are read straight out of the request body with ``np.frombuffer``,
+so decoding does not copy or parse individual readings.
+"""
+import struct
+import numpy as np
+
+WIRE_MIMETYPE = 'application/octet-stream'
+WIRE_MAGIC = b'KCVW'
+WIRE_VERSION = 1
+WIRE_DTYPE = np.dtype([
+    ('patient_id', 'S16'),
+    ('timestamp_ms', '<i8'),
+    ('heart_rate', '<f4'),
+    ('spo2', '<f4'),
+    ('temperature', '<f4'),
+    ('respiratory_rate', '<f4')
+])
+HEADER = struct.Struct('<4sHH')
+
+def encode_header():
+    return HEADER.pack(WIRE_MAGIC, WIRE_VERSION, WIRE_DTYPE.itemsize)
+
+def decode_records(body):
+    """View a message as a structured array of records, without copying"""
+    if len(body) < HEADER.size:
+        raise ValueError("Binary batch is shorter than its header")
+    magic, version, record_size = HEADER.unpack_from(body)
+    if magic != WIRE_MAGIC:
+        raise ValueError("Binary batch does not start with b'KCVW'")
+    if version != WIRE_VERSION or record_size != WIRE_DTYPE.itemsize:
+        raise ValueError(f"Unsupported binary format version {version} with {record_size}-byte records")
+    if (len(body) - HEADER.size) % record_size:
+        raise ValueError(f"Binary batch is not a whole number of {record_size}-byte records")
+    return np.frombuffer(body, dtype=WIRE_DTYPE, offset=HEADER.size)
+
+def records_to_columns(records):
+    """Columns in the form parse_batch() returns, for validation and ingestion"""
+    # Decode each distinct patient id once rather than once per reading
+    unique_ids, inverse = np.unique(records['patient_id'], return_inverse=True)
+    names = [raw.decode('utf-8', 'replace') for raw in unique_ids.tolist()]
+    timestamps = records['timestamp_ms'] / 1000.0
+    timestamps[records['timestamp_ms'] == 0] = np.nan  # filled with the arrival time
+    columns = {'patient_id': [names[i] for i in inverse.tolist()], 'timestamp': timestamps}
+    for name in WIRE_DTYPE.names[2:]:
+        columns[name] = records[name]
+    return columns
+
+def encode_readings(patient_id, columns):
+    """Encode one patient's history columns (epoch-second timestamps) as a binary message"""
+    records = np.empty(len(columns['timestamp']), dtype=WIRE_DTYPE)
+    records['patient_id'] = patient_id.encode('utf-8')[:16]
+    records['timestamp_ms'] = np.rint(np.asarray(columns['timestamp']) * 1000)
+    for name in WIRE_DTYPE.names[2:]:
+        records[name] = columns[name]
+    return encode_header() + records.tobytes()
@@ -0,0 +1,299 @@
+"""
+WebSocket fan-out hub for central monitoring screens
+
+Clients connect to ``ws://<host>:<WEBSOCKET_PORT>/`` and send JSON text
+messages to choose the patients they watch::
+
+    {"action": "subscribe", "patient_ids": ["ICU-201", "ICU-202"]}
+    {"action": "unsubscribe", "patient_ids": ["ICU-202"]}
+
+The server answers with JSON text messages:
+
+    {"type": "snapshot", "patient_id": ..., "vitals": {...}}    full vitals on subscribe
+    {"type": "vitals", "patient_id": ..., "changes": {...}}     only the fields that changed
+    {"type": "alert", "patient_id": ..., "data": {...}}         every new alert
+    {"type": "alert_acknowledged", "patient_id": ..., "data": {...}}
+    {"type": "alerts_cleared", "patient_id": null, "data": {}}
+    {"type": "error", "message": ...}
+
+The hub runs one asyncio loop on a background thread, so idle connections
+cost a socket and a reader task each. Every update is encoded into a single
+frame that is written to all watching sockets; a socket whose unsent
+buffer grows past ``max_buffer`` bytes is a slow consumer and is dropped.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+from .vitals_service import vitals_simulator
+
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x8, 0x9, 0xA
+MAX_MESSAGE_BYTES = 64 * 1024
+
+def encode_frame(payload, opcode=OP_TEXT):
+    """Build a single unmasked server frame"""
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+def apply_mask(payload, mask):
+    """XOR a payload with the 4-byte masking key used by client frames"""
+    length = len(payload)
+    key = (mask * (length // 4 + 1))[:length]
+    return (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+
+async def read_frame(reader):
+    """Read one frame and return (fin, opcode, payload)"""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', await reader.readexactly(8))[0]
+    if length > MAX_MESSAGE_BYTES:
+        raise ValueError(f"Frame of {length} bytes exceeds the limit")
+    mask = await reader.readexactly(4) if second & 0x80 else None
+    payload = await reader.readexactly(length)
+    if mask:
+        payload = apply_mask(payload, mask)
+    return bool(first & 0x80), first & 0x0F, payload
+
+class HubClient:
+    """One connected monitoring screen"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.patient_ids = set()
+
+    def send(self, frame, max_buffer):
+        """Write a frame unless the client already has too much unsent data"""
+        transport = self.writer.transport
+        if transport.is_closing() or transport.get_write_buffer_size() > max_buffer:
+            return False
+        transport.write(frame)
+        return True
+
+class PatientFeed:
+    """EventBus subscriber forwarding one patient's events onto the hub's loop.
+
+    The feed without a patient id carries the events meant for everyone.
+    """
+
+    def __init__(self, hub, patient_id=None):
+        self.hub = hub
+        self.patient_id = patient_id
+        self.patient_ids = frozenset() if patient_id is None else frozenset([patient_id])
+        self.closed = False
+
+    def deliver(self, event):
+        if event.patient_id == self.patient_id:
+            self.hub.loop.call_soon_threadsafe(self.hub._dispatch, event)
+        return True
+
+class WebSocketHub:
+    """Pushes vitals changes and alerts to WebSocket clients per patient"""
+
+    def __init__(self, events, snapshot, max_buffer=256 * 1024):
+        self.events = events            # EventBus fed by the simulator
+        self.snapshot = snapshot        # patient id -> current vitals dict
+        self.max_buffer = max_buffer
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.ready = threading.Event()
+        self.clients = set()
+        self.watchers = {}              # patient id -> set of HubClient
+        self.feeds = {}                 # patient id -> PatientFeed
+        self.broadcast_feed = None
+        self.last_vitals = {}           # patient id -> last vitals pushed
+        self.dropped = 0
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1] if self.server else None
+
+    def start(self, host='0.0.0.0', port=8765):
+        """Start serving on a background thread"""
+        if self.thread is not None:
+            return
+        self.thread = threading.Thread(target=self._run, args=(host, port), daemon=True)
+        self.thread.start()
+        self.ready.wait(5)
+
+    def _run(self, host, port):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self._handle, host, port))
+        except OSError as e:
+            print(f"WebSocket hub failed to start: {e}")
+            self.ready.set()
+            return
+        print(f"WebSocket hub listening on port {self.port}")
+        self.broadcast_feed = self.events.subscribe([], PatientFeed(self))
+        self.ready.set()
+        self.loop.run_forever()
+
+        # Let the connection handlers finish after stop()
+        pending = asyncio.all_tasks(self.loop)
+        for task in pending:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        self.loop.close()
+
+    def stop(self):
+        """Close every connection and stop the loop"""
+        if self.loop is None or self.server is None:
+            return
+
+        def shutdown():
+            self.events.unsubscribe(self.broadcast_feed)
+            self.server.close()
+            for client in list(self.clients):
+                self._drop(client)
+                client.writer.transport.abort()
+            self.loop.stop()
+
+        self.loop.call_soon_threadsafe(shutdown)
+        self.thread.join(5)
+
+    async def _handshake(self, reader, writer):
+        request = await reader.readuntil(b'\r\n\r\n')
+        headers = {}
+        for line in request.decode('latin-1').split('\r\n')[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        key = headers.get('sec-websocket-key')
+        if headers.get('upgrade', '').lower() != 'websocket' or not key:
+            writer.write(b'HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n')
+            return False
+
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(
+            'HTTP/1.1 101 Switching Protocols\r\n'
+            'Upgrade: websocket\r\n'
+            'Connection: Upgrade\r\n'
+            f'Sec-WebSocket-Accept: {accept}\r\n\r\n'.encode()
+        )
+        return True
+
+    async def _handle(self, reader, writer):
+        client = None
+        try:
+            if not await self._handshake(reader, writer):
+                return
+            client = HubClient(writer)
+            self.clients.add(client)
+            while True:
+                fin, opcode, payload = await read_frame(reader)
+                if opcode == OP_CLOSE:
+                    writer.write(encode_frame(payload[:2], OP_CLOSE))
+                    break
+                if opcode == OP_PING:
+                    client.send(encode_frame(payload, OP_PONG), self.max_buffer)
+                elif opcode == OP_TEXT and fin:
+                    self._on_message(client, payload)
+                elif opcode != OP_PONG:
+                    # Binary and fragmented messages are not part of the protocol
+                    writer.write(encode_frame(struct.pack('!H', 1003), OP_CLOSE))
+                    break
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError, ValueError):
+            pass
+        finally:
+            if client is not None:
+                self._drop(client)
+            writer.close()
+
+    def _send_json(self, client, message):
+        client.send(encode_frame(json.dumps(message, separators=(',', ':'))), self.max_buffer)
+
+    def _on_message(self, client, payload):
+        try:
+            message = json.loads(payload)
+            action = message['action']
+            patient_ids = [str(pid) for pid in message.get('patient_ids', [])]
+        except (ValueError, KeyError, TypeError):
+            self._send_json(client, {'type': 'error', 'message': 'Expected {"action": ..., "patient_ids": [...]}'})
+            return
+
+        if action == 'subscribe':
+            for patient_id in patient_ids:
+                self._subscribe(client, patient_id)
+        elif action == 'unsubscribe':
+            for patient_id in patient_ids:
+                self._unsubscribe(client, patient_id)
+        else:
+            self._send_json(client, {'type': 'error', 'message': f"Unknown action: {action}"})
+
+    def _subscribe(self, client, patient_id):
+        try:
+            vitals = self.snapshot(patient_id)
+        except KeyError:
+            self._send_json(client, {'type': 'error', 'message': f"Unknown patient: {patient_id}"})
+            return
+
+        if patient_id not in self.watchers:
+            self.watchers[patient_id] = set()
+            self.last_vitals[patient_id] = vitals
+            self.feeds[patient_id] = self.events.subscribe([patient_id], PatientFeed(self, patient_id))
+        self.watchers[patient_id].add(client)
+        client.patient_ids.add(patient_id)
+        self._send_json(client, {'type': 'snapshot', 'patient_id': patient_id, 'vitals': vitals})
+
+    def _unsubscribe(self, client, patient_id):
+        client.patient_ids.discard(patient_id)
+        watchers = self.watchers.get(patient_id)
+        if watchers is None:
+            return
+        watchers.discard(client)
+        if not watchers:
+            del self.watchers[patient_id]
+            del self.last_vitals[patient_id]
+            self.events.unsubscribe(self.feeds.pop(patient_id))
+
+    def _drop(self, client):
+        for patient_id in list(client.patient_ids):
+            self._unsubscribe(client, patient_id)
+        self.clients.discard(client)
+
+    def _dispatch(self, event):
+        """Encode an event once and write it to every client watching its patient"""
+        if event.patient_id is None:
+            targets = self.clients
+            message = {'type': event.event, 'patient_id': None, 'data': event.payload}
+        else:
+            targets = self.watchers.get(event.patient_id)
+            if not targets:
+                return
+            if event.event == 'vitals':
+                last = self.last_vitals[event.patient_id]
+                changes = {name: value for name, value in event.payload.items()
+                           if name != 'timestamp' and last.get(name) != value}
+                if not changes:
+                    return
+                changes['timestamp'] = event.payload.get('timestamp')
+                self.last_vitals[event.patient_id] = event.payload
+                message = {'type': 'vitals', 'patient_id': event.patient_id, 'changes': changes}
+            else:
+                message = {'type': event.event, 'patient_id': event.patient_id, 'data': event.payload}
+
+        frame = encode_frame(json.dumps(message, separators=(',', ':')))
+        for client in list(targets):
+            if not client.send(frame, self.max_buffer):
+                self.dropped += 1
+                self._drop(client)
+                client.writer.transport.abort()
+
+# Global instance
+websocket_hub = WebSocketHub(vitals_simulator.events, vitals_simulator.get_current_vitals)
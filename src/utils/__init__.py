@@ -1,15 +1,20 @@
 # Utils package
-from .config import config, Config, DevelopmentConfig, ProductionConfig
+from .config import config, Config, DevelopmentConfig, ProductionConfig, VITAL_RANGES
 from .helpers import (
     format_timestamp, 
+    parse_timestamp,
     export_vitals_to_csv, 
     export_alerts_to_json, 
+    export_vitals_columnar,
+    load_vitals_columnar,
     validate_vital_ranges,
-    calculate_vital_trend
+    calculate_vital_trend,
+    VITAL_LIMITS
 )
 
 __all__ = [
-    'config', 'Config', 'DevelopmentConfig', 'ProductionConfig',
-    'format_timestamp', 'export_vitals_to_csv', 'export_alerts_to_json',
-    'validate_vital_ranges', 'calculate_vital_trend'
+    'config', 'Config', 'DevelopmentConfig', 'ProductionConfig', 'VITAL_RANGES',
+    'format_timestamp', 'parse_timestamp', 'export_vitals_to_csv', 'export_alerts_to_json',
+    'export_vitals_columnar', 'load_vitals_columnar',
+    'validate_vital_ranges', 'calculate_vital_trend', 'VITAL_LIMITS'
 ]
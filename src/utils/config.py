@@ -6,27 +6,82 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Vital sign ranges (normal, warning, critical) - the single source for the
+# simulator, alerting, reports and the dashboard (served at /api/thresholds)
+VITAL_RANGES = {
+    'heart_rate': {'normal': (60, 100), 'warning': (45, 120), 'critical': (35, 140)},
+    'spo2': {'normal': (95, 100), 'warning': (88, 94), 'critical': (0, 87)},
+    'temperature': {'normal': (36.0, 38.0), 'warning': (35.0, 39.0), 'critical': (33.0, 41.0)},
+    'respiratory_rate': {'normal': (10, 25), 'warning': (8, 30), 'critical': (5, 35)}
+}
+
+# Placeholder key for development; the shared state backend refuses to use it
+DEFAULT_SECRET_KEY = 'dev-secret-key-change-in-production'
+
 class Config:
     """Base configuration"""
-    SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
+    SECRET_KEY = os.environ.get('SECRET_KEY', DEFAULT_SECRET_KEY)
     DEBUG = os.environ.get('DEBUG', 'False').lower() == 'true'
     
     # AI Service Configuration
     OPENROUTER_API_KEY = os.environ.get('OPENROUTER_API_KEY', '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')
     AI_MODEL = os.environ.get('AI_MODEL', 'microsoft/phi-3.5-mini-128k-instruct')
+    AI_BASE_URL = os.environ.get('AI_BASE_URL', 'https://openrouter.ai/api/v1')
+    AI_TIMEOUT = int(os.environ.get('AI_TIMEOUT', '30'))  # seconds per chat completion
+    AI_POOL_SIZE = int(os.environ.get('AI_POOL_SIZE', '10'))  # kept-alive connections
+    AI_MAX_CONCURRENT = int(os.environ.get('AI_MAX_CONCURRENT', '4'))  # chat calls in flight at once
+    AI_BREAKER_FAILURES = int(os.environ.get('AI_BREAKER_FAILURES', '3'))  # failures in a row that open the circuit
+    AI_BREAKER_RESET = int(os.environ.get('AI_BREAKER_RESET', '30'))  # seconds between probes while open
+    AI_CACHE_SIZE = int(os.environ.get('AI_CACHE_SIZE', '256'))  # cached chat answers
+    AI_CACHE_TTL = int(os.environ.get('AI_CACHE_TTL', '60'))  # seconds a chat answer is reused
+    AI_STATUS_INTERVAL = int(os.environ.get('AI_STATUS_INTERVAL', '60'))  # seconds between provider status checks
+    CHAT_WORKERS = int(os.environ.get('CHAT_WORKERS', '2'))  # threads answering queued chat jobs
+    CHAT_QUEUE_SIZE = int(os.environ.get('CHAT_QUEUE_SIZE', '20'))  # waiting chat jobs before new ones are refused
+    CHAT_RESULT_TTL = int(os.environ.get('CHAT_RESULT_TTL', '300'))  # seconds a finished chat job can be fetched
     
     # Simulation Configuration
     DISABLE_SIMULATION = os.environ.get('DISABLE_SIMULATION', 'false').lower() == 'true'
     SIMULATION_INTERVAL_PROD = int(os.environ.get('SIMULATION_INTERVAL_PROD', '30'))  # seconds
     SIMULATION_INTERVAL_DEV = int(os.environ.get('SIMULATION_INTERVAL_DEV', '10'))   # seconds
+    VITALS_HISTORY_CAPACITY = int(os.environ.get('VITALS_HISTORY_CAPACITY', '1000'))  # readings per patient
+    ROLLUP_MINUTE_CAPACITY = int(os.environ.get('ROLLUP_MINUTE_CAPACITY', '1440'))  # 1-minute buckets per patient
+    ROLLUP_HOUR_CAPACITY = int(os.environ.get('ROLLUP_HOUR_CAPACITY', '720'))  # 1-hour buckets per patient
+    TREND_WINDOW = int(os.environ.get('TREND_WINDOW', '30'))  # readings per rolling trend window
+    TREND_EWMA_ALPHA = float(os.environ.get('TREND_EWMA_ALPHA', '0.3'))  # weight of the newest reading
+    # Off by default: the simulator's random walk drifts by design, which CUSUM flags many times a day
+    ANOMALY_DETECTION = os.environ.get('ANOMALY_DETECTION', 'false').lower() == 'true'
+    ANOMALY_Z_THRESHOLD = float(os.environ.get('ANOMALY_Z_THRESHOLD', '4.0'))  # |z| of a spike
+    ANOMALY_CUSUM_THRESHOLD = float(os.environ.get('ANOMALY_CUSUM_THRESHOLD', '12.0'))  # CUSUM sum of a drift
+    INGEST_MAX_READINGS = int(os.environ.get('INGEST_MAX_READINGS', '100000'))  # readings per ingest request
+
+    # Long-term vitals storage (disabled when no directory is set)
+    VITALS_STORE_DIR = os.environ.get('VITALS_STORE_DIR', '')
+    VITALS_STORE_SEGMENT_RECORDS = int(os.environ.get('VITALS_STORE_SEGMENT_RECORDS', '65536'))  # records per file
+
+    # Write-ahead log of readings and alerts, replayed on restart (disabled when no directory is set)
+    WAL_DIR = os.environ.get('WAL_DIR', '')
+    WAL_FLUSH_INTERVAL_MS = int(os.environ.get('WAL_FLUSH_INTERVAL_MS', '100'))  # group commit window
+    WAL_SNAPSHOT_INTERVAL = int(os.environ.get('WAL_SNAPSHOT_INTERVAL', '300'))  # seconds between snapshots
+
+    # SQLite database of patients, readings and alerts (disabled when no path is set)
+    DATABASE_PATH = os.environ.get('DATABASE_PATH', '')
     
     # Alert Configuration
-    MAX_ALERTS = int(os.environ.get('MAX_ALERTS', '50'))
+    MAX_ALERTS = int(os.environ.get('MAX_ALERTS', '50'))  # active warning/critical alerts per patient
+    MAX_ANOMALY_ALERTS = int(os.environ.get('MAX_ANOMALY_ALERTS', '10'))  # active anomaly alerts per patient
     ALERT_RETENTION_MINUTES = int(os.environ.get('ALERT_RETENTION_MINUTES', '30'))
     
     # Application Configuration
     PORT = int(os.environ.get('PORT', '5000'))
     HOST = os.environ.get('HOST', '0.0.0.0')
+    WEBSOCKET_PORT = int(os.environ.get('WEBSOCKET_PORT', '0'))  # 0 disables the WebSocket hub
+
+    # Worker state: 'local' runs the simulator in-process (one worker only),
+    # 'shared' lets many workers share one simulation over a Unix socket
+    STATE_BACKEND = os.environ.get('STATE_BACKEND', 'local')
+    # The socket's directory is created with mode 0700
+    STATE_SOCKET = os.environ.get('STATE_SOCKET', f'/tmp/kognicare-{os.getuid()}/state.sock'
+                                  if hasattr(os, 'getuid') else 'kognicare-state/state.sock')
 
 class DevelopmentConfig(Config):
     """Development configuration"""
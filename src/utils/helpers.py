@@ -4,6 +4,18 @@ Utility functions for KogniCare application
 from datetime import datetime
 import csv
 import json
+import os
+import shutil
+import struct
+import tempfile
+import zipfile
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:  # Columnar exports fall back to .npz
+    pa = None
 
 def format_timestamp(timestamp_str):
     """Format timestamp for display"""
@@ -13,6 +25,15 @@ def format_timestamp(timestamp_str):
     except Exception:
         return timestamp_str
 
+def parse_timestamp(value):
+    """Parse an epoch-seconds number or ISO 8601 string into epoch seconds"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value).replace('Z', '+00:00')).timestamp()
+
 def export_vitals_to_csv(vitals_history, filename=None):
     """Export vitals history to CSV file"""
     if not filename:
@@ -38,19 +59,141 @@ def export_alerts_to_json(alerts_list, filename=None):
     
     return filename
 
+# Columns of a columnar vitals export; patient_id is stored as int32 codes into a list of ids
+COLUMNAR_FIELDS = {
+    'timestamp_ms': np.int64,
+    'heart_rate': np.int16,
+    'spo2': np.int16,
+    'temperature': np.float32,
+    'respiratory_rate': np.int16
+}
+COLUMNAR_FORMATS = {'arrow': 'application/vnd.apache.arrow.file', 'npz': 'application/octet-stream'}
+ZIP_LOCAL_HEADER = struct.Struct('<4s5H3I2H')
+
+def export_vitals_columnar(pages, patient_ids, filename=None, fmt=None):
+    """Export vitals to a columnar file: Arrow IPC when pyarrow is installed, otherwise .npz.
+
+    ``pages`` yields (patient_id, columns) with epoch-second 'timestamp' and one
+    array per vital, such as DataExporter.vitals_pages(). Timestamps are written
+    as int64 epoch milliseconds, and pages are written as they arrive.
+    """
+    fmt = fmt or ('arrow' if pa is not None else 'npz')
+    if fmt == 'arrow' and pa is None:
+        raise ValueError('Arrow export needs pyarrow; use the npz format')
+    if fmt not in COLUMNAR_FORMATS:
+        raise ValueError(f"Unsupported columnar format: {fmt}")
+    if not filename:
+        filename = f"vitals_export_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt}"
+
+    codes = {patient_id: i for i, patient_id in enumerate(patient_ids)}
+    pages = ((codes[patient_id], _columnar_page(columns)) for patient_id, columns in pages)
+    if fmt == 'arrow':
+        _write_arrow(filename, list(patient_ids), pages)
+    else:
+        _write_npz(filename, list(patient_ids), pages)
+    return filename
+
+def _columnar_page(columns):
+    page = {'timestamp_ms': np.rint(np.asarray(columns['timestamp'], dtype=np.float64) * 1000).astype(np.int64)}
+    for name, dtype in COLUMNAR_FIELDS.items():
+        if name != 'timestamp_ms':
+            page[name] = np.asarray(columns[name]).astype(dtype)
+    return page
+
+def _write_arrow(filename, patient_ids, pages):
+    dictionary = pa.array(patient_ids, type=pa.string())
+    schema = pa.schema([
+        ('patient_id', pa.dictionary(pa.int32(), pa.string())),
+        ('timestamp_ms', pa.timestamp('ms', tz='UTC')),
+        *((name, pa.from_numpy_dtype(dtype)) for name, dtype in COLUMNAR_FIELDS.items() if name != 'timestamp_ms')
+    ])
+    with pa.OSFile(filename, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        for code, page in pages:
+            patient = pa.DictionaryArray.from_arrays(np.full(len(page['timestamp_ms']), code, np.int32), dictionary)
+            writer.write_batch(pa.record_batch([patient, *page.values()], schema=schema))
+
+def _write_npz(filename, patient_ids, pages):
+    # A .npy header holds the row count, so columns are spooled to raw files first
+    # and then copied into an uncompressed archive that can be memory-mapped
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(filename))) as spool:
+        names = ('patient', *COLUMNAR_FIELDS)
+        dtypes = {'patient': np.dtype('<i4'), **{name: np.dtype(dtype).newbyteorder('<')
+                                               for name, dtype in COLUMNAR_FIELDS.items()}}
+        files = {name: open(os.path.join(spool, name), 'wb') for name in names}
+        rows = 0
+        try:
+            for code, page in pages:
+                count = len(page['timestamp_ms'])
+                files['patient'].write(np.full(count, code, dtypes['patient']).tobytes())
+                for name in COLUMNAR_FIELDS:
+                    files[name].write(page[name].astype(dtypes[name]).tobytes())
+                rows += count
+        finally:
+            for f in files.values():
+                f.close()
+
+        with zipfile.ZipFile(filename, 'w', zipfile.ZIP_STORED, allowZip64=True) as archive:
+            with archive.open('patient_ids.npy', 'w') as member:
+                np.save(member, np.array(patient_ids, dtype=str))
+            for name in names:
+                with archive.open(f'{name}.npy', 'w', force_zip64=True) as member:
+                    np.lib.format.write_array_header_1_0(member, {
+                        'descr': np.lib.format.dtype_to_descr(dtypes[name]),
+                        'fortran_order': False,
+                        'shape': (rows,)
+                    })
+                    with open(os.path.join(spool, name), 'rb') as f:
+                        shutil.copyfileobj(f, member, 1 << 20)
+
+def load_vitals_columnar(filename):
+    """Open a columnar vitals export without parsing it.
+
+    Arrow files are memory-mapped and returned as a pyarrow Table. .npz files
+    are returned as a dict of read-only memory-mapped arrays ('patient' holds
+    codes into 'patient_ids').
+    """
+    with open(filename, 'rb') as f:
+        magic = f.read(6)
+    if magic == b'ARROW1':
+        if pa is None:
+            raise ValueError('Reading Arrow exports needs pyarrow')
+        return pa.ipc.open_file(pa.memory_map(filename)).read_all()
+
+    columns = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, 'rb') as f:
+        for info in archive.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{info.filename} is compressed and cannot be memory-mapped")
+            # The member's data follows its local header, whose extra field may differ from the directory's
+            f.seek(info.header_offset)
+            header = ZIP_LOCAL_HEADER.unpack(f.read(ZIP_LOCAL_HEADER.size))
+            f.seek(info.header_offset + ZIP_LOCAL_HEADER.size + header[-2] + header[-1])
+            if np.lib.format.read_magic(f) == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+            name = info.filename[:-len('.npy')]
+            if not np.prod(shape):
+                columns[name] = np.empty(shape, dtype=dtype)
+                continue
+            columns[name] = np.memmap(filename, dtype=dtype, mode='r', offset=f.tell(), shape=shape,
+                                      order='F' if fortran_order else 'C')
+    return columns
+
+# Physiologically plausible values; anything outside is treated as a device error
+VITAL_LIMITS = {
+    'heart_rate': (30, 200),
+    'spo2': (70, 100),
+    'temperature': (30.0, 45.0),
+    'respiratory_rate': (5, 50)
+}
+
 def validate_vital_ranges(vital_name, value):
     """Validate if vital sign value is within expected ranges"""
-    ranges = {
-        'heart_rate': (30, 200),
-        'spo2': (70, 100),
-        'temperature': (30.0, 45.0),
-        'respiratory_rate': (5, 50)
-    }
-    
-    if vital_name not in ranges:
+    if vital_name not in VITAL_LIMITS:
         return False
     
-    min_val, max_val = ranges[vital_name]
+    min_val, max_val = VITAL_LIMITS[vital_name]
     return min_val <= value <= max_val
 
 def calculate_vital_trend(history, vital_name, window=5):
@@ -1,11 +1,47 @@
 import unittest
 import sys
 import os
+import tempfile
+import json
+import gzip
+import socket
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 # Add the project root to Python path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from src.services.vitals_service import VitalsSimulator
+import numpy as np
+from flask import Flask
+from src.routes import api_bp
+from src.services.vitals_service import VitalsSimulator, VITAL_FIELDS
+from src.services.vitals_buffer import VitalsRingBuffer
+from src.services.vitals_store import VitalsStore, RECORD_DTYPE
+from src.services.vitals_rollup import VitalsRollups
+from src.services.vitals_trends import VitalsTrends
+from src.services.alert_store import AlertStore
+from src.services.thresholds import ThresholdTable, NORMAL, WARNING, CRITICAL
+from src.services.early_warning import EarlyWarningScore
+from src.services.anomaly import AnomalyDetector, SPIKE, DRIFT_UP
+from src.services.event_bus import EventBus
+from src.services.websocket_hub import WebSocketHub
+from src.services.state_backend import SharedBackend, create_backend, private_directory
+from src.services.scheduler import TickScheduler
+from src.services.vitals_ingest import parse_batch, validate_batch
+from src.services.vitals_wire import WIRE_DTYPE, WIRE_MIMETYPE, decode_records, encode_readings
+from src.services.vitals_wal import WriteAheadLog
+from src.services.export_service import DataExporter
+from src.services.ai_service import AIAssistant, ProviderStatus, ResponseCache
+from src.services.http_client import PooledClient, ServiceUnavailable
+from src.services.chat_jobs import ChatJobQueue, ChatQueueFull
+from src.models import Alert, Patient
+from src.models.database import Database
+from src.utils.config import Config, DEFAULT_SECRET_KEY
+from src.utils.helpers import export_vitals_columnar, load_vitals_columnar, pa
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import ws_client
 
 class TestVitalsService(unittest.TestCase):
     """Test cases for vitals service"""
@@ -82,5 +118,1505 @@ class TestVitalsService(unittest.TestCase):
         alerts = self.simulator.get_alerts()
         self.assertEqual(len(alerts), 0)
 
+class TestWardSimulation(unittest.TestCase):
+    """Test cases for multi-patient vitals simulation"""
+    
+    def setUp(self):
+        """Set up a ward of simulated patients"""
+        self.patient_ids = [f'bed-{i}' for i in range(500)]
+        self.simulator = VitalsSimulator(patient_ids=self.patient_ids, seed=42)
+    
+    def test_tick_advances_every_patient(self):
+        """Test that one tick keeps every patient within the simulation bounds"""
+        for _ in range(20):
+            self.simulator.generate_realistic_vitals()
+        
+        for name in VITAL_FIELDS:
+            self.assertEqual(len(self.simulator.vitals[name]), len(self.patient_ids))
+        self.assertTrue((self.simulator.vitals['heart_rate'] >= 45).all())
+        self.assertTrue((self.simulator.vitals['heart_rate'] <= 120).all())
+        self.assertTrue((self.simulator.vitals['spo2'] <= 100).all())
+    
+    def test_vitals_keyed_by_patient(self):
+        """Test current vitals and history lookups by patient id"""
+        self.simulator.generate_realistic_vitals()
+        self.simulator.generate_realistic_vitals()
+        
+        row = self.simulator.get_patient_row('bed-7')
+        vitals = self.simulator.get_current_vitals('bed-7')
+        self.assertEqual(vitals['heart_rate'], self.simulator.vitals['heart_rate'][row])
+        self.assertIsInstance(vitals['heart_rate'], int)
+        self.assertIsInstance(vitals['temperature'], float)
+        
+        history = self.simulator.get_vitals_history(10, 'bed-7')
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history[-1], vitals)
+    
+    def test_unknown_patient(self):
+        """Test lookups for patients that are not registered"""
+        with self.assertRaises(KeyError):
+            self.simulator.get_current_vitals('missing')
+    
+    def test_add_patients(self):
+        """Test registering patients after the ward was created"""
+        self.simulator.add_patients(['bed-0', 'late-arrival'])
+        self.assertEqual(len(self.simulator.patient_ids), len(self.patient_ids) + 1)
+        self.simulator.generate_realistic_vitals()
+        self.assertIn('heart_rate', self.simulator.get_current_vitals('late-arrival'))
+
+    def test_history_is_not_changed_by_later_ticks(self):
+        """Test that history reads are copies, not views a later tick overwrites"""
+        simulator = VitalsSimulator(patient_ids=['bed-1'], seed=2, history_capacity=4)
+        for _ in range(4):
+            simulator.generate_realistic_vitals()
+        columns = simulator.get_vitals_columns(4, 'bed-1')
+        ranged = simulator.get_vitals_range('bed-1')
+        before = {name: column.tolist() for name, column in columns.items()}
+        for _ in range(2):
+            simulator.generate_realistic_vitals()
+        self.assertEqual({name: column.tolist() for name, column in columns.items()}, before)
+        self.assertEqual({name: column.tolist() for name, column in ranged.items()}, before)
+    
+    def test_alert_reads_while_ticking(self):
+        """Test that alert reads and expiry are safe while ticks add and expire alerts"""
+        simulator = VitalsSimulator(patient_ids=[f'bed-{i}' for i in range(20)], seed=3)
+        simulator.alerts = AlertStore(dedupe_seconds=0, retention_seconds=0.001, max_per_patient=1000)
+        stop = threading.Event()
+        errors = []
+        
+        def write():
+            try:
+                while not stop.is_set():
+                    simulator.generate_realistic_vitals()
+                    for patient_id in simulator.patient_ids:
+                        simulator.create_test_alert(patient_id)
+            except Exception as e:
+                errors.append(e)
+        
+        def read():
+            try:
+                while not stop.is_set():
+                    simulator.get_alerts(50)
+                    simulator.get_alerts(5, 'bed-1')
+                    simulator.get_alerts_since(0, 'bed-2')
+                    simulator.get_alerts_version()
+                    simulator.search_alerts(vital='heart_rate', limit=20)
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(1)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+    
+    def test_vitals_since(self):
+        """Test that deltas return only readings after the client's version"""
+        simulator = VitalsSimulator(patient_ids=['bed-1'], seed=2, history_capacity=4)
+        for _ in range(3):
+            simulator.generate_realistic_vitals()
+        
+        delta = simulator.get_vitals_since(1, 'bed-1')
+        self.assertEqual(delta['version'], simulator.get_vitals_version('bed-1'))
+        self.assertEqual(len(delta['readings']), 2)
+        self.assertTrue(delta['complete'])
+        self.assertEqual(simulator.get_vitals_since(3, 'bed-1')['readings'], [])
+        
+        for _ in range(3):
+            simulator.generate_realistic_vitals()
+        self.assertFalse(simulator.get_vitals_since(0, 'bed-1')['complete'])
+        self.assertFalse(simulator.get_vitals_since(99, 'bed-1')['complete'])
+
+class TestVitalsRingBuffer(unittest.TestCase):
+    """Test cases for the columnar history ring buffer"""
+    
+    def setUp(self):
+        """Set up a small buffer for three patients"""
+        self.buffer = VitalsRingBuffer({'timestamp': np.float64, 'heart_rate': np.int16}, capacity=4, patients=3)
+    
+    def test_wraparound_keeps_newest(self):
+        """Test that the oldest readings are overwritten once capacity is reached"""
+        for i in range(10):
+            self.buffer.append({'timestamp': float(i), 'heart_rate': np.array([60, 70, 80]) + i})
+        
+        latest = self.buffer.latest(1)
+        self.assertEqual(latest['timestamp'].tolist(), [6.0, 7.0, 8.0, 9.0])
+        self.assertEqual(latest['heart_rate'].tolist(), [76, 77, 78, 79])
+        self.assertEqual(self.buffer.latest(1, 2)['heart_rate'].tolist(), [78, 79])
+        self.assertTrue(np.shares_memory(latest['heart_rate'], self.buffer.columns['heart_rate']))
+    
+    def test_batch_with_repeated_patients(self):
+        """Test appending several readings for the same patient in one batch"""
+        self.buffer.append({'timestamp': np.array([1.0, 2.0, 3.0]), 'heart_rate': np.array([61, 90, 62])},
+                           rows=[0, 2, 0])
+        
+        self.assertEqual(self.buffer.latest(0)['heart_rate'].tolist(), [61, 62])
+        self.assertEqual(self.buffer.latest(2)['heart_rate'].tolist(), [90])
+        self.assertEqual(len(self.buffer.latest(1)['heart_rate']), 0)
+    
+    def test_resize(self):
+        """Test growing the buffer keeps existing history"""
+        self.buffer.append({'timestamp': 1.0, 'heart_rate': 70})
+        self.buffer.resize(5)
+        
+        self.assertEqual(self.buffer.patients, 5)
+        self.assertEqual(self.buffer.latest(2)['heart_rate'].tolist(), [70])
+        self.assertEqual(len(self.buffer.latest(4)['heart_rate']), 0)
+
+class TestVitalsStore(unittest.TestCase):
+    """Test cases for the memory-mapped vitals store"""
+    
+    def setUp(self):
+        """Set up a store with tiny segments so tests cross segment boundaries"""
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.store = VitalsStore(self.tempdir.name, segment_records=100)
+    
+    def tearDown(self):
+        self.tempdir.cleanup()
+    
+    def _records(self, timestamps):
+        records = np.zeros(len(timestamps), dtype=RECORD_DTYPE)
+        records['timestamp'] = timestamps
+        records['heart_rate'] = 70
+        return records
+    
+    def test_range_query_across_segments(self):
+        """Test time-range queries spanning several segment files"""
+        self.store.append('bed/1', self._records(np.arange(1, 351, dtype=np.float64)))
+        
+        result = self.store.query('bed/1', 95.0, 205.5)
+        self.assertEqual(result['timestamp'][0], 95.0)
+        self.assertEqual(result['timestamp'][-1], 205.0)
+        self.assertEqual(len(result), 111)
+        self.assertEqual(len(self.store.query('bed/1', 400.0, 500.0)), 0)
+    
+    def test_reopen_restores_history(self):
+        """Test that a new store over the same directory sees earlier appends"""
+        self.store.append('bed-1', self._records(np.arange(1, 151, dtype=np.float64)))
+        self.store.flush()
+        
+        reopened = VitalsStore(self.tempdir.name, segment_records=100)
+        self.assertEqual(len(reopened.query('bed-1')), 150)
+        reopened.append('bed-1', self._records([151.0]))
+        self.assertEqual(reopened.query('bed-1')['timestamp'][-1], 151.0)
+        self.assertEqual(reopened.patient_ids(), ['bed-1'])
+    
+    def test_out_of_order_readings_dropped(self):
+        """Test that readings older than the stored ones are dropped"""
+        self.store.append('bed-1', self._records([10.0, 20.0]))
+        self.store.append('bed-1', self._records([15.0, 25.0]))
+        
+        self.assertEqual(self.store.query('bed-1')['timestamp'].tolist(), [10.0, 20.0, 25.0])
+        self.assertEqual(self.store.dropped, 1)
+    
+    def test_simulator_range_history(self):
+        """Test that an attached store answers time-range history queries"""
+        simulator = VitalsSimulator(patient_ids=['bed-1', 'bed-2'], seed=1)
+        simulator.attach_store(self.store)
+        for _ in range(5):
+            simulator.generate_realistic_vitals()
+        
+        history = simulator.get_vitals_history(None, 'bed-2', start=0)
+        self.assertEqual(len(history), 5)
+        self.assertEqual(history[-1], simulator.get_current_vitals('bed-2'))
+
+class TestVitalsTrends(unittest.TestCase):
+    """Test cases for the incremental rolling statistics"""
+    
+    def test_matches_statistics_of_the_window(self):
+        """Test that incremental updates equal statistics computed from the last readings"""
+        trends = VitalsTrends(['heart_rate'], window=5, alpha=0.5, patients=2)
+        rng = np.random.default_rng(4)
+        readings = []
+        for step in range(23):
+            rows = np.array([0, 1, 0]) if step % 4 == 0 else np.array([0])
+            timestamps = 1.7e9 + step * 30 + np.arange(len(rows))
+            values = rng.normal(80, 6, len(rows))
+            trends.update(timestamps, {'heart_rate': values}, rows=rows)
+            readings.extend((t, v) for row, t, v in zip(rows, timestamps, values) if row == 0)
+        
+        times, values = np.array(readings[-5:]).T
+        stats = trends.query(0)['vitals']['heart_rate']
+        self.assertEqual(trends.query(0)['readings'], 5)
+        self.assertAlmostEqual(stats['mean'], round(values.mean(), 2))
+        self.assertAlmostEqual(stats['std'], round(values.std(ddof=1), 2))
+        self.assertEqual((stats['min'], stats['max']), (round(values.min(), 2), round(values.max(), 2)))
+        self.assertAlmostEqual(stats['slope_per_minute'], round(np.polyfit(times - times[0], values, 1)[0] * 60, 3))
+    
+    def test_trend_labels_and_simulator(self):
+        """Test trend labels and the trends served by the simulator"""
+        trends = VitalsTrends(['spo2'], window=4, patients=1)
+        self.assertEqual(trends.query(0)['vitals']['spo2'], None)
+        for i, spo2 in enumerate([98, 97, 95, 94, 92]):
+            trends.update(float(i * 60), {'spo2': np.array([spo2])})
+        self.assertEqual(trends.query(0)['vitals']['spo2']['trend'], 'decreasing')
+        self.assertEqual(trends.query(0)['vitals']['spo2']['min'], 92)
+        
+        simulator = VitalsSimulator(patient_ids=['bed-1', 'bed-2'], seed=1, scheduler=TickScheduler())
+        for _ in range(3):
+            simulator.generate_realistic_vitals()
+        result = simulator.get_vital_trends('bed-2')
+        self.assertEqual(result['readings'], 3)
+        self.assertEqual(set(result['vitals']), set(VITAL_FIELDS))
+
+class TestVitalsRollups(unittest.TestCase):
+    """Test cases for the downsampling tiers"""
+    
+    def setUp(self):
+        """Set up 1-minute and 1-hour tiers for two patients"""
+        self.rollups = VitalsRollups(['heart_rate'], [(60, 100), (3600, 10)], patients=2)
+    
+    def test_buckets_track_min_max_mean(self):
+        """Test that readings fold into per-minute buckets as they arrive"""
+        for i, heart_rate in enumerate([70, 80, 90, 100]):
+            # Two readings per minute: 0s, 30s, 60s, 90s
+            self.rollups.update(float(i * 30), {'heart_rate': np.array([heart_rate, 60])})
+        
+        minute = self.rollups.tiers[0].query(0)
+        self.assertEqual(minute['timestamp'].tolist(), [0.0, 60.0])
+        self.assertEqual(minute['count'].tolist(), [2, 2])
+        self.assertEqual(minute['heart_rate_min'].tolist(), [70, 90])
+        self.assertEqual(minute['heart_rate_max'].tolist(), [80, 100])
+        self.assertEqual(minute['heart_rate_mean'].tolist(), [75, 95])
+        
+        hour = self.rollups.tiers[1].query(0)
+        self.assertEqual(hour['count'].tolist(), [4])
+        self.assertEqual(hour['heart_rate_mean'].tolist(), [85])
+    
+    def test_batch_with_repeated_patients(self):
+        """Test folding several readings of one patient from a single batch"""
+        self.rollups.update(np.array([0.0, 10.0, 70.0]), {'heart_rate': np.array([60, 64, 90])}, rows=[1, 1, 1])
+        
+        minute = self.rollups.tiers[0].query(1)
+        self.assertEqual(minute['count'].tolist(), [2, 1])
+        self.assertEqual(minute['heart_rate_mean'].tolist(), [62, 90])
+        self.assertEqual(len(self.rollups.tiers[0].query(0)['count']), 0)
+    
+    def test_tier_selection(self):
+        """Test choosing the coarsest tier that meets the requested resolution"""
+        self.assertIsNone(self.rollups.select(30))
+        self.assertEqual(self.rollups.select(600).bucket_seconds, 60)
+        self.assertEqual(self.rollups.select(7 * 24 * 3600 / 100).bucket_seconds, 3600)
+    
+    def test_selection_falls_back_when_a_tier_is_too_short(self):
+        """Test that a range older than the minute tier holds is served by the hour tier, or by nothing"""
+        for minute in range(200):
+            self.rollups.update(minute * 60.0, {'heart_rate': np.array([70, 70])})
+        self.assertEqual(self.rollups.select(600, 0, 150 * 60.0).bucket_seconds, 60)
+        self.assertEqual(self.rollups.select(600, 0, 0.0).bucket_seconds, 3600)
+        self.assertEqual(self.rollups.select(600, 0).bucket_seconds, 3600)
+        for minute in range(200, 720):
+            self.rollups.update(minute * 60.0, {'heart_rate': np.array([70, 70])})
+        self.assertIsNone(self.rollups.select(600, 0, 0.0))
+        self.assertEqual(self.rollups.select(600, 0, 11 * 3600.0).bucket_seconds, 60)
+    
+    def test_simulator_rollup_of_a_long_range(self):
+        """Test that a week at ~605 s per point returns buckets from the start of the week"""
+        simulator = VitalsSimulator(patient_ids=['bed-1'], seed=3, scheduler=TickScheduler())
+        now = time.time()
+        timestamps = now - np.arange(7 * 24 * 12)[::-1] * 300.0
+        simulator.ingest_readings(['bed-1'] * len(timestamps), timestamps, {
+            'heart_rate': np.full(len(timestamps), 75.0), 'spo2': np.full(len(timestamps), 98.0),
+            'temperature': np.full(len(timestamps), 37.0), 'respiratory_rate': np.full(len(timestamps), 16.0)
+        })
+        start = float(timestamps[0])
+        summary = simulator.get_vitals_rollup('bed-1', start=start, end=now, resolution=(now - start) / 1000)
+        self.assertEqual(summary['resolution'], 3600)
+        self.assertTrue(summary['complete'])
+        self.assertEqual(sum(bucket['count'] for bucket in summary['buckets']), len(timestamps))
+        
+        # Without a long-term store, a range older than every tier is flagged
+        simulator.rollups = VitalsRollups(VITAL_FIELDS, [(60, 100), (3600, 10)], patients=1)
+        simulator.rollups.update(timestamps, {name: np.full(len(timestamps), 1.0) for name in VITAL_FIELDS},
+                                 rows=np.zeros(len(timestamps), dtype=np.int64))
+        summary = simulator.get_vitals_rollup('bed-1', start=start, end=now, resolution=600)
+        self.assertEqual(summary['resolution'], 3600)
+        self.assertFalse(summary['complete'])
+    
+    def test_simulator_rollup_summary(self):
+        """Test rollup summaries served by the simulator"""
+        simulator = VitalsSimulator(seed=3)
+        for _ in range(3):
+            simulator.generate_realistic_vitals()
+        
+        raw = simulator.get_vitals_rollup(resolution=0)
+        self.assertEqual(raw['resolution'], 0)
+        self.assertEqual(len(raw['buckets']), 3)
+        
+        summary = simulator.get_vitals_rollup(resolution=3600)
+        self.assertEqual(summary['resolution'], 3600)
+        self.assertEqual(sum(bucket['count'] for bucket in summary['buckets']), 3)
+        self.assertIn('mean', summary['buckets'][-1]['heart_rate'])
+
+class TestAlertStore(unittest.TestCase):
+    """Test cases for indexed alert de-duplication and expiry"""
+    
+    def setUp(self):
+        """Set up a store driven by a fake monotonic clock"""
+        self.now = 0.0
+        self.store = AlertStore(dedupe_seconds=60, retention_seconds=1800, max_per_patient=3,
+                                clock=lambda: self.now)
+    
+    def _fire(self, patient_id, vital='heart_rate', severity='warning'):
+        if not self.store.should_fire(patient_id, vital, severity):
+            return None
+        return self.store.add(Alert(severity, vital, 110, 'test', patient_id=patient_id))
+    
+    def test_dedupe_window(self):
+        """Test that the same patient/vital/severity fires at most once a minute"""
+        self.assertIsNotNone(self._fire('bed-1'))
+        self.assertIsNone(self._fire('bed-1'))
+        self.assertIsNotNone(self._fire('bed-1', severity='critical'))
+        self.assertIsNotNone(self._fire('bed-2'))
+        
+        self.now = 61.0
+        self.assertIsNotNone(self._fire('bed-1'))
+        self.assertEqual([alert.id for alert in self.store.recent(10)], [1, 2, 3, 4])
+    
+    def test_expiry(self):
+        """Test that alerts expire after the retention period"""
+        self._fire('bed-1')
+        self.now = 1000.0
+        self._fire('bed-2')
+        
+        self.now = 1800.0
+        self.store.expire()
+        self.assertEqual([alert.patient_id for alert in self.store.recent(10)], ['bed-2'])
+        self.assertEqual(self.store.recent(10, 'bed-1'), [])
+    
+    def test_per_patient_cap(self):
+        """Test that a patient cannot hold more alerts than the cap"""
+        for vital in ('heart_rate', 'spo2', 'temperature', 'respiratory_rate'):
+            self._fire('bed-1', vital=vital)
+        
+        self.assertEqual(len(self.store.recent(10, 'bed-1')), 3)
+        self.assertIsNotNone(self._fire('bed-2'))
+    
+    def test_anomalies_have_their_own_cap(self):
+        """Test that anomaly alerts fill their own cap and never crowd out threshold alerts"""
+        self.store.max_anomalies_per_patient = 2
+        for vital in ('heart_rate', 'spo2', 'temperature'):
+            self._fire('bed-1', vital=vital, severity='anomaly')
+        self.assertEqual(len(self.store.recent(10, 'bed-1')), 2)
+        for vital in ('heart_rate', 'spo2', 'temperature', 'respiratory_rate'):
+            self._fire('bed-1', vital=vital, severity='critical')
+        self.assertEqual([alert.type for alert in self.store.recent(10, 'bed-1')],
+                         ['anomaly', 'anomaly', 'critical', 'critical', 'critical'])
+        
+        self.now = 1800.0
+        self.store.expire()
+        self.assertIsNotNone(self._fire('bed-1', severity='anomaly'))
+    
+    def test_since_and_version(self):
+        """Test polling for new alerts and the change counter"""
+        self._fire('bed-1')
+        self._fire('bed-2')
+        version = self.store.version
+        self.assertEqual([alert.id for alert in self.store.since(1)], [2])
+        self.assertEqual(self.store.since(1, 'bed-1'), [])
+        
+        self.now = 1800.0
+        self.store.expire()
+        self.assertGreater(self.store.version, version)
+        
+        self.store.clear()
+        self.assertEqual(self.store.cleared_through, 3)
+        self.assertEqual(self.store.last_id, 3)
+        self.assertEqual(self._fire('bed-1').id, 4)
+
+class TestThresholdTable(unittest.TestCase):
+    """Test cases for compiled threshold classification"""
+    
+    def setUp(self):
+        """Set up a table for three patients"""
+        self.table = ThresholdTable(patients=3)
+    
+    def test_batch_classification(self):
+        """Test classifying a batch of readings in one call"""
+        codes = self.table.classify('heart_rate', [75, 110, 150, 44])
+        self.assertEqual(codes.tolist(), [NORMAL, WARNING, CRITICAL, CRITICAL])
+        
+        statuses = self.table.classify_all({
+            'heart_rate': np.array([75, 75, 75]),
+            'spo2': np.array([98, 92, 85]),
+            'temperature': np.array([37.0, 38.5, 40.0], dtype=np.float32),
+            'respiratory_rate': np.array([18, 28, 40])
+        }, rows=slice(None))
+        self.assertEqual(statuses['spo2'].tolist(), [NORMAL, WARNING, CRITICAL])
+        self.assertEqual(statuses['temperature'].tolist(), [NORMAL, WARNING, CRITICAL])
+    
+    def test_patient_override(self):
+        """Test that per-patient ranges only apply to that patient"""
+        self.table.set_patient_ranges(1, 'heart_rate', normal=(50, 100))
+        
+        codes = self.table.classify('heart_rate', np.array([55, 55, 55]), rows=slice(None))
+        self.assertEqual(codes.tolist(), [WARNING, NORMAL, WARNING])
+        self.assertEqual(self.table.to_dict(1)['heart_rate']['normal'], [50, 100])
+        self.assertEqual(self.table.to_dict()['heart_rate']['normal'], [60, 100])
+        with self.assertRaises(ValueError):
+            self.table.set_patient_ranges(1, 'heart_rate', warning=(120, 45))
+    
+    def test_simulator_patient_thresholds(self):
+        """Test per-patient thresholds through the simulator"""
+        simulator = VitalsSimulator(patient_ids=['bed-1', 'bed-2'])
+        simulator.set_patient_thresholds('bed-2', 'heart_rate', normal=(80, 100))
+        
+        self.assertEqual(simulator.get_vital_status('heart_rate', 78, 'bed-1'), 'normal')
+        self.assertEqual(simulator.get_vital_status('heart_rate', 78, 'bed-2'), 'warning')
+
+class TestEarlyWarningScore(unittest.TestCase):
+    """Test cases for vectorized NEWS2-style scoring"""
+    
+    def test_band_edges_and_risk(self):
+        """Test points at the NEWS2 band edges and the resulting risk levels"""
+        scorer = EarlyWarningScore()
+        self.assertEqual(scorer.points('heart_rate', [40, 41, 50, 51, 90, 91, 111, 131]).tolist(),
+                         [3, 1, 1, 0, 0, 1, 2, 3])
+        self.assertEqual(scorer.points('temperature', np.array([35.0, 35.1, 36.1, 38.1, 39.1], dtype=np.float32)).tolist(),
+                         [3, 1, 0, 1, 2])
+        
+        total, points, risk = scorer.score({
+            'heart_rate': np.array([75, 75, 120, 135]),
+            'spo2': np.array([98, 98, 93, 88]),
+            'temperature': np.array([37.0, 37.0, 38.5, 39.5], dtype=np.float32),
+            'respiratory_rate': np.array([16, 26, 22, 28])
+        })
+        self.assertEqual(total.tolist(), [0, 3, 7, 11])
+        self.assertEqual(points['respiratory_rate'].tolist(), [0, 3, 2, 3])
+        self.assertEqual(risk.tolist(), [0, 1, 3, 3])
+    
+    def test_simulator_ranks_ward(self):
+        """Test that the simulator ranks beds by score, highest first"""
+        simulator = VitalsSimulator(patient_ids=['bed-1', 'bed-2', 'bed-3'], seed=1, scheduler=TickScheduler())
+        simulator.ingest_readings(['bed-2'], np.array([time.time()]), {
+            'heart_rate': np.array([125.0]), 'spo2': np.array([92.0]),
+            'temperature': np.array([38.4]), 'respiratory_rate': np.array([23.0])
+        })
+        
+        result = simulator.get_ward_scores()
+        self.assertEqual(result['patients'], 3)
+        self.assertEqual([entry['patient_id'] for entry in result['scores']], ['bed-2', 'bed-1', 'bed-3'])
+        self.assertEqual(result['scores'][0]['score'], 7)
+        self.assertEqual(result['scores'][0]['risk'], 'high')
+        self.assertEqual(len(simulator.get_ward_scores(min_score=1)['scores']), 1)
+
+class TestAnomalyDetector(unittest.TestCase):
+    """Test cases for the z-score/CUSUM anomaly detectors"""
+    
+    def test_drift_and_spike(self):
+        """Test that a slow drift inside the normal range and a single spike are both detected"""
+        detector = AnomalyDetector(['heart_rate'], patients=2)
+        rng = np.random.default_rng(5)
+        anomalies = []
+        for tick in range(200):
+            heart_rate = 72 + rng.normal(0, 2, 2)
+            # Patient 1 creeps up by 0.2 BPM per reading after tick 100, ending near 92
+            heart_rate[1] += max(0, tick - 100) * 0.2
+            if tick == 60:
+                heart_rate[0] = 110
+            anomalies.extend((tick, row, kind) for row, vital, kind, z in detector.update({'heart_rate': heart_rate}))
+        
+        self.assertIn((60, 0, SPIKE), anomalies)
+        drifts = [tick for tick, row, kind in anomalies if row == 1 and kind == DRIFT_UP]
+        self.assertTrue(drifts and drifts[0] > 100)
+        self.assertFalse([anomaly for anomaly in anomalies if anomaly[1] == 0 and anomaly[0] != 60])
+    
+    def test_simulator_raises_anomaly_alerts(self):
+        """Test that ingested readings feed the detectors and raise 'anomaly' alerts"""
+        simulator = VitalsSimulator(patient_ids=['bed-1'], seed=1, scheduler=TickScheduler())
+        # Detection is off by default
+        simulator.anomalies = AnomalyDetector(VITAL_FIELDS, patients=1)
+        now = time.time()
+        heart_rate = np.r_[np.full(30, 75.0), 96.0]
+        simulator.ingest_readings(['bed-1'] * 31, now - np.arange(31)[::-1] * 30.0, {
+            'heart_rate': heart_rate, 'spo2': np.full(31, 98.0),
+            'temperature': np.full(31, 37.0), 'respiratory_rate': np.full(31, 16.0)
+        })
+        
+        alerts = simulator.get_alerts(patient_id='bed-1')
+        self.assertEqual([(alert['type'], alert['vital'], alert['value']) for alert in alerts],
+                         [('anomaly', 'heart_rate', 96)])
+        self.assertIn('spike', alerts[0]['message'])
+
+class TestAIResponseCache(unittest.TestCase):
+    """Test cases for caching AI chat answers"""
+    
+    def test_lru_and_ttl(self):
+        """Test that entries expire after the TTL and the least recently used is evicted"""
+        now = [0.0]
+        cache = ResponseCache(max_entries=2, ttl=60, clock=lambda: now[0])
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.put('c', 3)
+        self.assertIsNone(cache.get('b'))
+        now[0] = 61
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats(), {'entries': 1, 'hits': 1, 'misses': 2, 'evictions': 1, 'hit_rate': 0.333})
+    
+    def test_chat_reuses_answers_for_similar_vitals(self):
+        """Test that rephrased questions about barely changed vitals hit the cache, and fallbacks are not cached"""
+        server = StubLLMServer()
+        self.addCleanup(server.stop)
+        assistant = AIAssistant(base_url=server.url)
+        patient = {'name': 'John Doe', 'attending_doctor': 'Dr. Sarah Wilson'}
+        vitals = {'heart_rate': 78, 'spo2': 98, 'temperature': 37.1, 'respiratory_rate': 16}
+        first = assistant.chat('How is the patient doing?', patient, vitals, 2, 'bed-1')
+        second = assistant.chat('  how is the patient   doing ', patient, dict(vitals, heart_rate=79), 3, 'bed-1')
+        assistant.chat('How is the patient doing?', patient, dict(vitals, heart_rate=95), 2, 'bed-1')
+        self.assertEqual(server.requests, 2)
+        self.assertEqual((first['cached'], second['cached']), (False, True))
+        self.assertEqual(second['response'], 'Stable.')
+        
+        server.status = 500
+        fallback = assistant.chat('Any concerns?', patient, vitals, 0, 'bed-1')
+        self.assertIn('fallback mode', fallback['response'])
+        self.assertEqual(len(assistant.cache.entries), 2)
+
+class StubLLMServer:
+    """Local OpenRouter stand-in answering /chat/completions and /models over keep-alive HTTP/1.1"""
+    
+    def __init__(self):
+        stub = self
+        self.status = 200
+        self.token_delay = 0
+        self.requests = 0
+        self.connections = set()
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            
+            def do_GET(self):
+                self._reply({'data': [{'id': 'microsoft/phi-3.5-mini-128k-instruct'}]})
+            
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                stub.requests += 1
+                if body.get('stream') and stub.status == 200:
+                    self._stream(['Vitals ', 'are ', 'stable.'])
+                else:
+                    self._reply({'choices': [{'message': {'content': 'Stable.'}}]})
+            
+            def _stream(self, words):
+                stub.connections.add(self.client_address)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                events = [': OPENROUTER PROCESSING\n\n']
+                events += [f"data: {json.dumps({'choices': [{'delta': {'content': word}}]})}\n\n" for word in words]
+                for event in events + ['data: [DONE]\n\n', '']:
+                    time.sleep(stub.token_delay if event.startswith('data: {') else 0)
+                    data = event.encode()
+                    self.wfile.write(f'{len(data):x}\r\n'.encode() + data + b'\r\n')
+                    self.wfile.flush()
+            
+            def _reply(self, payload):
+                stub.connections.add(self.client_address)
+                body = json.dumps(payload).encode()
+                self.send_response(stub.status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+class TestPooledClient(unittest.TestCase):
+    """Test cases for the pooled, circuit-broken OpenRouter client"""
+    
+    def setUp(self):
+        self.server = StubLLMServer()
+        self.addCleanup(self.server.stop)
+        self.patient = {'name': 'John Doe', 'attending_doctor': 'Dr. Sarah Wilson'}
+        self.vitals = {'heart_rate': 78, 'spo2': 98, 'temperature': 37.1, 'respiratory_rate': 16}
+    
+    def test_connections_are_kept_alive(self):
+        """Test that consecutive calls reuse one connection"""
+        assistant = AIAssistant(base_url=self.server.url)
+        for i in range(5):
+            self.assertEqual(assistant.chat(f'Question {i}', self.patient, self.vitals, 0)['response'], 'Stable.')
+        self.assertTrue(assistant.check_api_status()['phi3_available'])
+        self.assertEqual(self.server.requests, 5)
+        self.assertEqual(len(self.server.connections), 1)
+    
+    def test_breaker_opens_and_background_probe_closes_it(self):
+        """Test that repeated failures switch to the fallback at once until a probe succeeds"""
+        client = PooledClient(self.server.url, failure_threshold=2, reset_timeout=0.05, probe_path='/models')
+        self.server.status = 503
+        for _ in range(2):
+            client.post('/chat/completions', json={})
+        self.assertTrue(client.breaker.is_open)
+        with self.assertRaises(ServiceUnavailable):
+            client.post('/chat/completions', json={})
+        self.assertEqual(self.server.requests, 2)
+        
+        self.server.status = 200
+        deadline = time.time() + 5
+        while client.breaker.is_open and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertFalse(client.breaker.is_open)
+        self.assertEqual(client.post('/chat/completions', json={}).status_code, 200)
+        self.assertEqual(client.stats()['times_opened'], 1)
+
+class TestChatStreaming(unittest.TestCase):
+    """Test cases for token-streamed chat answers"""
+    
+    def setUp(self):
+        self.server = StubLLMServer()
+        self.addCleanup(self.server.stop)
+        self.assistant = AIAssistant(base_url=self.server.url)
+        self.patient = {'name': 'John Doe', 'attending_doctor': 'Dr. Sarah Wilson'}
+        self.vitals = {'heart_rate': 78, 'spo2': 98, 'temperature': 37.1, 'respiratory_rate': 16}
+    
+    def test_tokens_arrive_as_generated_and_answer_is_cached(self):
+        """Test that the first token arrives before generation ends and the joined answer is cached"""
+        self.server.token_delay = 0.1
+        started = time.perf_counter()
+        stream = self.assistant.chat_stream('How is the patient?', self.patient, self.vitals, 0, 'bed-1')
+        first = next(stream)
+        first_at = time.perf_counter() - started
+        chunks = [first] + list(stream)
+        total = time.perf_counter() - started
+        self.assertEqual(first, {'delta': 'Vitals '})
+        self.assertLess(first_at, total - 0.15)
+        self.assertEqual(''.join(chunk.get('delta', '') for chunk in chunks), 'Vitals are stable.')
+        self.assertEqual((chunks[-1]['done'], chunks[-1]['cached']), (True, False))
+        
+        again = list(self.assistant.chat_stream('how is the patient', self.patient, self.vitals, 0, 'bed-1'))
+        self.assertEqual(again[0], {'delta': 'Vitals are stable.'})
+        self.assertTrue(again[-1]['cached'])
+        self.assertEqual(self.server.requests, 1)
+    
+    def test_fallback_streams_in_chunks(self):
+        """Test that the fallback answer is streamed word by word and not cached"""
+        self.server.status = 500
+        chunks = list(self.assistant.chat_stream('Any concerns?', self.patient, self.vitals, 0, 'bed-1'))
+        answer = ''.join(chunk.get('delta', '') for chunk in chunks)
+        self.assertGreater(len(chunks), 10)
+        self.assertIn('fallback mode', answer)
+        self.assertEqual(answer, self.assistant._fallback_response('Any concerns?', self.patient, self.vitals))
+        self.assertTrue(chunks[-1]['done'])
+        self.assertEqual(len(self.assistant.cache.entries), 0)
+
+class TestChatJobQueue(unittest.TestCase):
+    """Test cases for background chat jobs"""
+    
+    def _wait_for(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.005)
+        self.assertTrue(condition())
+    
+    def test_bounded_queue_rejects_when_full(self):
+        """Test that jobs queue behind busy workers, overflow is refused and results can be fetched"""
+        release = threading.Event()
+        
+        def answer(message, patient_id=None):
+            release.wait(5)
+            return {'response': message.upper()}
+        
+        jobs = ChatJobQueue(answer, workers=1, max_queue=2)
+        first = jobs.submit('one', patient_id='bed-1')
+        self._wait_for(lambda: first.status == 'running')
+        queued = [jobs.submit('two'), jobs.submit('three')]
+        self.assertEqual([job.to_dict()['position'] for job in queued], [0, 1])
+        with self.assertRaises(ChatQueueFull):
+            jobs.submit('four')
+        self.assertEqual(jobs.stats()['queued'], 2)
+        
+        release.set()
+        self._wait_for(lambda: queued[-1].status == 'done')
+        self.assertEqual(jobs.get(queued[-1].id).to_dict()['result'], {'response': 'THREE'})
+        stats = jobs.stats()
+        self.assertEqual((stats['completed'], stats['rejected'], stats['queued'], stats['running']), (3, 1, 0, 0))
+        self.assertGreater(stats['wait_ms']['max'], 0)
+    
+    def test_failed_jobs_are_reported_and_results_expire(self):
+        """Test that errors end the job as failed, on_done is called and old results are dropped"""
+        now = [0.0]
+        done = []
+        
+        def answer(message):
+            raise ValueError('API down')
+        
+        jobs = ChatJobQueue(answer, workers=2, result_ttl=60, clock=lambda: now[0], on_done=done.append)
+        job = jobs.submit('hello')
+        self._wait_for(lambda: done)
+        self.assertEqual(done[0].to_dict(), {'id': job.id, 'status': 'failed', 'wait_ms': 0.0, 'run_ms': 0.0,
+                                             'error': 'API down'})
+        self.assertEqual(jobs.stats()['failed'], 1)
+        now[0] = 59
+        self.assertIs(jobs.get(job.id), job)
+        now[0] = 60
+        self.assertIsNone(jobs.get(job.id))
+
+class TestProviderStatus(unittest.TestCase):
+    """Test cases for the background-refreshed AI provider status"""
+    
+    def test_snapshot_never_waits_for_the_provider(self):
+        """Test that snapshots return at once, before and after the background check, with their age"""
+        now = [100.0]
+        release = threading.Event()
+        calls = []
+        
+        def check():
+            calls.append(now[0])
+            release.wait(5)
+            return {'api_available': True, 'phi3_available': True, 'provider': 'stub'}
+        
+        status = ProviderStatus(check, interval=3600, clock=lambda: now[0])
+        started = time.perf_counter()
+        pending = status.snapshot()
+        self.assertLess(time.perf_counter() - started, 0.5)
+        self.assertIsNone(pending['api_available'])
+        self.assertIsNone(pending['age_seconds'])
+        
+        release.set()
+        deadline = time.time() + 5
+        while status.latest is None and time.time() < deadline:
+            time.sleep(0.005)
+        now[0] = 112.5
+        for _ in range(100):
+            snapshot = status.snapshot()
+        self.assertEqual((snapshot['api_available'], snapshot['provider']), (True, 'stub'))
+        self.assertEqual(snapshot['age_seconds'], 12.5)
+        self.assertEqual(len(calls), 1)
+    
+    def test_refresh_tracks_provider_availability(self):
+        """Test that refreshes pick up the model list and the API going down"""
+        server = StubLLMServer()
+        self.addCleanup(server.stop)
+        status = AIAssistant(base_url=server.url).provider_status
+        status.refresh()
+        self.assertTrue(status.latest[1]['phi3_available'])
+        self.assertIsNotNone(status.latest[1]['checked_at'])
+        
+        server.status = 503
+        status.refresh()
+        self.assertEqual((status.latest[1]['api_available'], status.latest[1]['phi3_available']), (False, False))
+
+class TestApiRoutes(unittest.TestCase):
+    """Test cases for API routes, served by the global simulator"""
+    
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(api_bp)
+        self.client = app.test_client()
+    
+    def _ingest(self, readings):
+        return self.client.post('/api/vitals/ingest', json=readings)
+    
+    def test_points_without_start_span_the_stored_history(self):
+        """Test that ?points= alone picks buckets over the stored history, and non-positive points are refused"""
+        now = time.time()
+        readings = [{'patient_id': 'route-points', 'timestamp': now - 36000 + i * 1800, 'heart_rate': 80,
+                     'spo2': 97, 'temperature': 37.0, 'respiratory_rate': 16} for i in range(20)]
+        self.assertEqual(self._ingest(readings).status_code, 200)
+        
+        response = self.client.get('/api/vitals/history?patient_id=route-points&points=10')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_json()['resolution'], 3600)
+        self.assertLessEqual(len(response.get_json()['buckets']), 11)
+        for points in (0, -5):
+            response = self.client.get(f'/api/vitals/history?patient_id=route-points&points={points}')
+            self.assertEqual(response.status_code, 400)
+
+    def test_ingest_rejects_timestamps_outside_the_window(self):
+        """Test that a millisecond timestamp is reported instead of breaking reads of the ward"""
+        reading = {'patient_id': 'route-ms', 'timestamp': 1760000000000, 'heart_rate': 80,
+                   'spo2': 97, 'temperature': 37.0, 'respiratory_rate': 16}
+        response = self._ingest([reading])
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(response.get_json()['rejected'], 1)
+        self.assertIn('Timestamp', response.get_json()['errors'][0]['error'])
+        self.assertEqual(self.client.get('/api/ward/scores').status_code, 200)
+        self.assertEqual(self.client.get('/api/vitals/history').status_code, 200)
+
+class TestEventBus(unittest.TestCase):
+    """Test cases for vitals/alert event fan-out"""
+    
+    def test_fan_out_by_patient(self):
+        """Test that events reach only subscribers of that patient, serialized once"""
+        bus = EventBus()
+        first = bus.subscribe(['bed-1'])
+        second = bus.subscribe(['bed-1', 'bed-2'])
+        
+        event = bus.publish('vitals', {'heart_rate': 80}, 'bed-1')
+        bus.publish('vitals', {'heart_rate': 90}, 'bed-2')
+        
+        self.assertIs(first.get(0), event)
+        self.assertIs(second.get(0), event)
+        self.assertEqual(second.get(0).data, '{"heart_rate":90}')
+        self.assertIsNone(first.get(0))
+        self.assertTrue(event.sse.startswith('event: vitals\ndata: '))
+    
+    def test_slow_consumer_dropped(self):
+        """Test that a subscriber whose queue overflows is closed and removed"""
+        bus = EventBus(max_queue=2)
+        subscriber = bus.subscribe(['bed-1'])
+        for i in range(3):
+            bus.publish('vitals', {'seq': i}, 'bed-1')
+        
+        self.assertTrue(subscriber.closed)
+        self.assertEqual(bus.watched_patients(), set())
+    
+    def test_simulator_publishes_vitals_and_alerts(self):
+        """Test that ticks and alerts are pushed to watchers"""
+        simulator = VitalsSimulator(patient_ids=['bed-1', 'bed-2'], seed=5)
+        subscriber = simulator.events.subscribe(['bed-2'])
+        simulator.generate_realistic_vitals()
+        simulator.create_test_alert('bed-2')
+        
+        vitals_event = subscriber.get(0)
+        self.assertEqual(vitals_event.event, 'vitals')
+        self.assertEqual(vitals_event.patient_id, 'bed-2')
+        self.assertEqual(subscriber.get(0).event, 'alert')
+
+class TestWebSocketHub(unittest.TestCase):
+    """Test cases for the WebSocket fan-out hub"""
+    
+    def setUp(self):
+        self.bus = EventBus()
+        self.vitals = {'bed-1': {'heart_rate': 80, 'spo2': 97, 'timestamp': 't0'},
+                       'bed-2': {'heart_rate': 70, 'spo2': 99, 'timestamp': 't0'}}
+        self.hub = WebSocketHub(self.bus, lambda pid: dict(self.vitals[pid]), max_buffer=1024)
+        self.hub.start('127.0.0.1', 0)
+        self.sockets = []
+    
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+        self.hub.stop()
+    
+    def connect(self, *patient_ids):
+        sock = ws_client.connect('127.0.0.1', self.hub.port)
+        sock.settimeout(5)
+        self.sockets.append(sock)
+        ws_client.send_json(sock, {'action': 'subscribe', 'patient_ids': list(patient_ids)})
+        return sock
+    
+    def receive(self, sock):
+        opcode, payload = ws_client.recv_message(sock)
+        return json.loads(payload)
+    
+    def wait_for(self, condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+    
+    def test_subscribe_snapshot_and_changes(self):
+        """Test that subscribers get a snapshot, then only changed fields of their patients"""
+        sock = self.connect('bed-1')
+        snapshot = self.receive(sock)
+        self.assertEqual(snapshot['type'], 'snapshot')
+        self.assertEqual(snapshot['vitals']['heart_rate'], 80)
+        
+        self.bus.publish('vitals', {'heart_rate': 70, 'spo2': 99, 'timestamp': 't1'}, 'bed-2')
+        self.bus.publish('vitals', {'heart_rate': 80, 'spo2': 97, 'timestamp': 't1'}, 'bed-1')
+        self.bus.publish('vitals', {'heart_rate': 85, 'spo2': 97, 'timestamp': 't2'}, 'bed-1')
+        self.bus.publish('alerts_cleared', {})
+        
+        message = self.receive(sock)
+        self.assertEqual(message['type'], 'vitals')
+        self.assertEqual(message['changes'], {'heart_rate': 85, 'timestamp': 't2'})
+        self.assertEqual(self.receive(sock)['type'], 'alerts_cleared')
+    
+    def test_unknown_patient_and_unsubscribe(self):
+        """Test errors for unknown patients and that the last watcher releases the feed"""
+        sock = self.connect('bed-9')
+        self.assertEqual(self.receive(sock)['type'], 'error')
+        
+        ws_client.send_json(sock, {'action': 'subscribe', 'patient_ids': ['bed-1']})
+        self.receive(sock)
+        self.assertEqual(self.bus.watched_patients(), {'bed-1'})
+        ws_client.send_json(sock, {'action': 'unsubscribe', 'patient_ids': ['bed-1']})
+        self.wait_for(lambda: not self.bus.watched_patients())
+    
+    def test_slow_consumer_dropped(self):
+        """Test that a client that stops reading is disconnected"""
+        slow = self.connect('bed-1')
+        slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        self.wait_for(lambda: self.bus.watched_patients() == {'bed-1'})
+        
+        for i in range(2000):
+            self.bus.publish('vitals', {'heart_rate': i, 'note': f'{i:05d}' * 1000, 'timestamp': i}, 'bed-1')
+        self.wait_for(lambda: self.hub.dropped == 1)
+        self.assertEqual(self.bus.watched_patients(), set())
+
+class TestVitalsIngest(unittest.TestCase):
+    """Test cases for batched device readings"""
+    
+    T = 1700000000.0   # a recent epoch timestamp; readings must fall between 2000 and now
+    
+    def _reading(self, patient_id, timestamp, heart_rate=80):
+        return {'patient_id': patient_id, 'timestamp': timestamp, 'heart_rate': heart_rate,
+                'spo2': 97, 'temperature': 37.2, 'respiratory_rate': 16}
+    
+    def test_formats(self):
+        """Test that JSON arrays, NDJSON and columnar JSON parse to the same columns"""
+        readings = [self._reading('bed-1', self.T + 100.0), self._reading('bed-2', self.T + 101.0)]
+        rows = parse_batch(json.dumps(readings).encode())
+        ndjson = parse_batch('\n'.join(json.dumps(r) for r in readings).encode(), 'application/x-ndjson')
+        columnar = parse_batch(json.dumps({name: [r[name] for r in readings] for name in readings[0]}).encode())
+        
+        self.assertEqual(rows, ndjson)
+        self.assertEqual(rows, columnar)
+        self.assertEqual(rows['heart_rate'], [80, 80])
+        with self.assertRaises(ValueError):
+            parse_batch(b'{"x": 1}\nnot json', 'application/x-ndjson')
+    
+    def test_validation(self):
+        """Test that invalid readings are rejected with a reason and the rest kept"""
+        readings = [self._reading('bed-1', None), self._reading('bed-1', 'soon'),
+                    self._reading('bed-2', self.T + 5, heart_rate=250), self._reading('', self.T + 5),
+                    {'patient_id': 'bed-3', 'heart_rate': 80}]
+        batch = validate_batch(parse_batch(json.dumps(readings).encode()), now=self.T + 42)
+        
+        self.assertEqual(batch.patient_ids, ['bed-1'])
+        self.assertEqual(batch.timestamps.tolist(), [self.T + 42])
+        self.assertEqual(batch.rejected, 4)
+        self.assertEqual([error['index'] for error in batch.errors], [1, 2, 3, 4])
+        self.assertIn('heart_rate', batch.errors[1]['error'])
+    
+    def test_timestamps_outside_the_sane_window(self):
+        """Test that infinite, millisecond, pre-2000 and far-future timestamps are rejected"""
+        columns = parse_batch(json.dumps([self._reading('bed-1', self.T)]).encode())
+        for timestamp in (float('inf'), float('-inf'), self.T * 1000, 5.0, self.T + 3600, self.T + 200):
+            columns['timestamp'] = [timestamp]
+            batch = validate_batch(columns, now=self.T)
+            if timestamp == self.T + 200:
+                # Within the allowed clock skew
+                self.assertEqual(len(batch), 1)
+            else:
+                self.assertEqual((len(batch), batch.rejected), (0, 1))
+                self.assertIn('Timestamp', batch.errors[0]['error'])
+    
+    def test_binary_format(self):
+        """Test that binary messages round-trip and parse like JSON batches"""
+        columns = {'timestamp': np.array([self.T + 100.25, self.T + 101.5]), 'heart_rate': np.array([80, 150]),
+                   'spo2': np.array([97, 96]), 'temperature': np.array([37.2, 38.1]),
+                   'respiratory_rate': np.array([16, 18])}
+        body = encode_readings('bed-1', columns)
+        self.assertEqual(len(body), 8 + 2 * WIRE_DTYPE.itemsize)
+        self.assertEqual(decode_records(body)['timestamp_ms'].tolist(), [1700000100250, 1700000101500])
+        
+        parsed = parse_batch(body, WIRE_MIMETYPE)
+        self.assertEqual(parsed['patient_id'], ['bed-1', 'bed-1'])
+        batch = validate_batch(parsed)
+        self.assertEqual(batch.timestamps.tolist(), [self.T + 100.25, self.T + 101.5])
+        self.assertEqual(batch.values['heart_rate'].tolist(), [80, 150])
+        
+        with self.assertRaises(ValueError):
+            parse_batch(b'JSON' + body[4:], WIRE_MIMETYPE)
+        with self.assertRaises(ValueError):
+            parse_batch(body[:-1], WIRE_MIMETYPE)
+    
+    def test_ingest_into_simulator(self):
+        """Test that ingested readings reach history, current vitals and alerts"""
+        simulator = VitalsSimulator(patient_ids=['bed-1'], seed=3)
+        readings = [self._reading('bed-9', self.T + 300, heart_rate=150), self._reading('bed-9', self.T + 200),
+                    self._reading('bed-1', self.T + 100)]
+        batch = validate_batch(parse_batch(json.dumps(readings).encode()))
+        result = simulator.ingest_readings(batch.patient_ids, batch.timestamps, batch.values)
+        
+        self.assertEqual(result, {'accepted': 3, 'late': 0, 'patients': 2, 'registered': 1})
+        history = simulator.get_vitals_columns(10, 'bed-9')
+        self.assertEqual(history['timestamp'].tolist(), [self.T + 200, self.T + 300])
+        self.assertEqual(simulator.get_current_vitals('bed-9')['heart_rate'], 150)
+        # bed-1 already had a newer simulated reading, so it stays current
+        self.assertEqual(simulator.get_current_vitals('bed-1')['heart_rate'], 78)
+        self.assertEqual([alert.vital for alert in simulator.alerts.recent(10, 'bed-9')], ['heart_rate'])
+        self.assertIsNone(simulator.patient_intervals[simulator.get_patient_row('bed-9')])
+
+    def test_late_readings_are_dropped(self):
+        """Test that readings older than a patient's newest are dropped so range queries stay correct"""
+        simulator = VitalsSimulator(patient_ids=['bed-1'], seed=3, scheduler=TickScheduler())
+        readings = [self._reading('dev1', self.T + t) for t in (100, 200, 300)]
+        first = validate_batch(parse_batch(json.dumps(readings).encode()))
+        simulator.ingest_readings(first.patient_ids, first.timestamps, first.values)
+        
+        readings = [self._reading('dev1', self.T + 150, heart_rate=120), self._reading('dev1', self.T + 400),
+                    self._reading('dev1', self.T + 300, heart_rate=90), self._reading('dev1', self.T + 50)]
+        batch = validate_batch(parse_batch(json.dumps(readings).encode()))
+        result = simulator.ingest_readings(batch.patient_ids, batch.timestamps, batch.values)
+        
+        self.assertEqual((result['accepted'], result['late']), (2, 2))
+        history = simulator.get_vitals_columns(10, 'dev1')
+        self.assertEqual(history['timestamp'].tolist(), [self.T + t for t in (100, 200, 300, 300, 400)])
+        ranged = simulator.get_vitals_range('dev1', self.T + 120, self.T + 250)
+        self.assertEqual(ranged['timestamp'].tolist(), [self.T + 200])
+        self.assertNotIn(120, simulator.get_vitals_range('dev1')['heart_rate'].tolist())
+    
+    def test_ingest_while_simulating(self):
+        """Test that device patients are paused before any tick and cancelled jobs never tick"""
+        now = [0.0]
+        scheduler = TickScheduler(clock=lambda: now[0])
+        simulator = VitalsSimulator(patient_ids=['bed-1'], seed=3, scheduler=scheduler)
+        simulator._schedule_ticks()
+        simulator.simulation_started = True
+        scheduler.run_pending()
+        job = simulator.tick_jobs[simulator.default_tick_interval()]
+        
+        now[0] = 1.0
+        batch = validate_batch(parse_batch(json.dumps([self._reading('dev0', time.time(), heart_rate=150)]).encode()))
+        simulator.ingest_readings(batch.patient_ids, batch.timestamps, batch.values)
+        scheduler.run_pending()
+        self.assertEqual(simulator.get_current_vitals('dev0')['heart_rate'], 150)
+        self.assertEqual(simulator.vitals_history.counts.tolist(), [1, 1])
+        self.assertIs(simulator.tick_jobs[simulator.default_tick_interval()], job)
+        
+        # A tick already taken off the heap runs after its job was cancelled
+        scheduler.cancel(job)
+        job.callback()
+        self.assertEqual(simulator.vitals_history.counts.tolist(), [1, 1])
+
+class TestTickScheduler(unittest.TestCase):
+    """Test cases for the fixed-rate tick scheduler"""
+    
+    def setUp(self):
+        self.now = 0.0
+        self.scheduler = TickScheduler(tolerance=0.1, clock=lambda: self.now)
+    
+    def test_fixed_rate_without_drift(self):
+        """Test that slow ticks do not push later ticks back"""
+        def slow_tick():
+            self.now += 0.3
+        job = self.scheduler.schedule('tick', 1.0, slow_tick)
+        
+        for _ in range(5):
+            self.assertEqual(self.scheduler.run_pending(), job.next_run - self.now)
+            self.now = job.next_run
+        self.assertEqual(job.runs, 5)
+        self.assertEqual(job.next_run, 5.0)
+        self.assertEqual(job.late, 0)
+    
+    def test_late_and_skipped_ticks(self):
+        """Test that a stalled job skips missed ticks and errors do not stop it"""
+        calls = []
+        def failing_tick():
+            calls.append(self.now)
+            raise RuntimeError('boom')
+        job = self.scheduler.schedule('tick', 1.0, failing_tick)
+        
+        self.scheduler.run_pending()
+        self.now = 3.5
+        self.scheduler.run_pending()
+        self.assertEqual(calls, [0.0, 3.5])
+        self.assertEqual((job.late, job.skipped, job.errors), (1, 2, 2))
+        self.assertEqual(job.next_run, 4.0)
+        
+        self.scheduler.cancel(job)
+        self.assertIsNone(self.scheduler.run_pending())
+        self.assertEqual(self.scheduler.stats(), {})
+    
+    def test_per_patient_intervals(self):
+        """Test that patients tick at their own intervals from one scheduler"""
+        simulator = VitalsSimulator(patient_ids=['bed-1', 'bed-2', 'bed-3'], seed=4, scheduler=self.scheduler)
+        simulator.set_patient_interval('bed-1', 1)
+        simulator.set_patient_interval('bed-3', None)
+        simulator._schedule_ticks()
+        simulator.simulation_started = True
+        
+        for _ in range(simulator.default_tick_interval()):
+            self.scheduler.run_pending()
+            self.now += 1
+        counts = simulator.vitals_history.counts.tolist()
+        self.assertEqual(counts, [simulator.default_tick_interval(), 1, 0])
+        self.assertEqual(set(simulator.get_tick_stats()), {'vitals-1s', f'vitals-{simulator.default_tick_interval()}s'})
+
+    def test_reschedule_keeps_the_tick_grid(self):
+        """Test that new patients and intervals do not trigger extra ticks or reset the grid"""
+        simulator = VitalsSimulator(patient_ids=['bed-1', 'bed-2'], seed=4, scheduler=self.scheduler)
+        simulator._schedule_ticks()
+        simulator.simulation_started = True
+        default = simulator.default_tick_interval()
+        self.scheduler.run_pending()
+        default_job = simulator.tick_jobs[default]
+        
+        self.now = 3.0
+        simulator.add_patients(['bed-3'])
+        simulator.set_patient_interval('bed-2', 4)
+        self.scheduler.run_pending()
+        self.assertEqual(simulator.vitals_history.counts.tolist(), [1, 1, 0])
+        self.assertIs(simulator.tick_jobs[default], default_job)
+        self.assertEqual(default_job.next_run, default)
+        # The new interval lines up with the grid laid at time 0
+        self.assertEqual(simulator.tick_jobs[4].next_run, 4.0)
+        
+        self.now = 4.0
+        self.scheduler.run_pending()
+        self.assertEqual(simulator.vitals_history.counts.tolist(), [1, 2, 0])
+        self.now = float(default)
+        self.scheduler.run_pending()
+        self.assertEqual(simulator.vitals_history.counts.tolist()[::2], [2, 1])
+        self.assertEqual((default_job.runs, default_job.late, default_job.skipped), (2, 0, 0))
+    
+    def test_tick_stats_while_rescheduling(self):
+        """Test that tick stats can be read while intervals change from another thread"""
+        patient_ids = [f'bed-{i}' for i in range(50)]
+        simulator = VitalsSimulator(patient_ids=patient_ids, seed=4, scheduler=self.scheduler)
+        simulator._schedule_ticks()
+        simulator.simulation_started = True
+        stop = threading.Event()
+        errors = []
+        
+        def reschedule():
+            while not stop.is_set():
+                for i, patient_id in enumerate(patient_ids):
+                    simulator.set_patient_interval(patient_id, i + 1)
+                for patient_id in patient_ids:
+                    simulator.set_patient_interval(patient_id, 1)
+        
+        def read():
+            try:
+                while not stop.is_set():
+                    simulator.get_tick_stats()
+            except Exception as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=reschedule)] + [threading.Thread(target=read) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        time.sleep(1)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+class TestWriteAheadLog(unittest.TestCase):
+    """Test cases for restoring the simulator from its write-ahead log"""
+    
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.simulator = self._restart()
+    
+    def tearDown(self):
+        self.simulator.wal.stop()
+        self.tempdir.cleanup()
+    
+    def _restart(self):
+        """Build a fresh simulator over the log directory, as a new process would"""
+        simulator = VitalsSimulator(patient_ids=['bed-1', 'bed-2'], seed=1, scheduler=TickScheduler())
+        simulator.attach_wal(WriteAheadLog(self.tempdir.name, flush_interval=0.01))
+        return simulator
+    
+    def _assert_same_state(self, before, after):
+        self.assertEqual(after.patient_ids, before.patient_ids)
+        for patient_id in before.patient_ids:
+            self.assertEqual(after.get_current_vitals(patient_id), before.get_current_vitals(patient_id))
+            self.assertEqual(after.get_vitals_history(None, patient_id), before.get_vitals_history(None, patient_id))
+            self.assertEqual(after.get_vitals_rollup(patient_id, resolution=60),
+                             before.get_vitals_rollup(patient_id, resolution=60))
+        self.assertEqual(after.get_alerts(100), before.get_alerts(100))
+        self.assertEqual(after.patient_intervals, before.patient_intervals)
+    
+    def test_replay_after_restart(self):
+        """Test that readings, device patients and alerts survive a restart"""
+        for _ in range(5):
+            self.simulator.generate_realistic_vitals()
+        now = time.time()
+        self.simulator.ingest_readings(['bed-3', 'bed-1'], np.array([now, now + 1]), {
+            'heart_rate': np.array([80.0, 82.0]), 'spo2': np.array([97.0, 96.0]),
+            'temperature': np.array([37.1, 37.3]), 'respiratory_rate': np.array([16.0, 18.0])
+        })
+        self.simulator.create_test_alert('bed-2')
+        self.simulator.wal.stop()
+        
+        restarted = self._restart()
+        self._assert_same_state(self.simulator, restarted)
+        self.assertEqual(restarted.create_test_alert('bed-1')['id'], self.simulator.alerts.next_id)
+        self.simulator = restarted
+    
+    def test_snapshot_then_replay(self):
+        """Test restoring from a snapshot plus the records logged after it"""
+        for _ in range(3):
+            self.simulator.generate_realistic_vitals()
+        self.simulator.create_test_alert('bed-1')
+        self.simulator.wal.snapshot()
+        self.simulator.generate_realistic_vitals()
+        self.simulator.clear_alerts()
+        self.simulator.wal.stop()
+        self.assertEqual(len(self.simulator.wal.segments()), 1)
+        
+        restarted = self._restart()
+        self._assert_same_state(self.simulator, restarted)
+        self.assertEqual(restarted.alerts.cleared_through, self.simulator.alerts.cleared_through)
+        self.simulator = restarted
+    
+    def test_torn_tail_ignored(self):
+        """Test that a partly written last record is dropped instead of failing recovery"""
+        self.simulator.generate_realistic_vitals()
+        self.simulator.wal.stop()
+        path = self.simulator.wal._segment_path(self.simulator.wal.segment)
+        with open(path, 'ab') as f:
+            f.write(b'\x02\xff\x00')
+        
+        restarted = self._restart()
+        self.assertEqual(restarted.get_vitals_history(None, 'bed-1'), self.simulator.get_vitals_history(None, 'bed-1'))
+        restarted.generate_realistic_vitals()
+        restarted.wal.stop()
+        self.simulator = self._restart()
+        self.assertEqual(len(self.simulator.get_vitals_history(None, 'bed-1')), 2)
+
+class TestDatabase(unittest.TestCase):
+    """Test cases for the SQLite persistence layer"""
+    
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, 'kognicare.db')
+        self.database = Database(self.path)
+        self.simulator = VitalsSimulator(patient_ids=['bed-1', 'bed-2'], seed=1, scheduler=TickScheduler())
+        self.simulator.attach_database(self.database)
+    
+    def tearDown(self):
+        self.tempdir.cleanup()
+    
+    def test_readings_served_from_database(self):
+        """Test that each tick is written in the background and range queries read it back"""
+        for _ in range(5):
+            self.simulator.generate_realistic_vitals()
+        self.assertTrue(self.database.flush(5))
+        
+        history = self.simulator.get_vitals_history(None, 'bed-2', start=0)
+        self.assertEqual(history, self.simulator.get_vitals_history(None, 'bed-2'))
+        self.assertEqual(len(self.simulator.get_vitals_history(2, 'bed-2', start=0)), 2)
+        self.assertGreaterEqual(self.database.stats()['transactions'], 1)
+        
+        # The limit goes into the query: only the newest readings are read
+        limited = self.database.vitals_range('bed-2', 0, None, 2)
+        self.assertEqual(len(limited['timestamp']), 2)
+        self.assertEqual(self.simulator.get_history_columns(2, 'bed-2', start=0)['timestamp'].tolist(),
+                         limited['timestamp'].tolist())
+    
+    def test_patient_details_stored(self):
+        """Test that patient details are saved to the database and read back"""
+        self.assertIsNone(self.simulator.get_patient('bed-1'))
+        self.simulator.save_patient('bed-1', Patient('Jane Roe', 70, 'Female', 'ICU-3', 'today', 'Sepsis',
+                                                     'Dr. Lee', 'Sam Park'))
+        self.assertTrue(self.database.flush(5))
+        self.assertEqual(self.simulator.get_patient('bed-1')['name'], 'Jane Roe')
+        self.assertIsNone(self.simulator.get_patient('bed-2'))
+    
+    def test_flush_waits_for_commit(self):
+        """Test that writes are visible to other connections as soon as flush returns"""
+        for _ in range(200):
+            alert = self.simulator.create_test_alert('bed-1')
+            self.assertTrue(self.database.flush(5))
+            self.assertIsNotNone(self.database.get_alert(alert['id']))
+    
+    def test_acknowledge_and_search_alerts(self):
+        """Test acknowledging alerts, including ones no longer active, and searching them"""
+        first = self.simulator.create_test_alert('bed-1')
+        second = self.simulator.create_test_alert('bed-2')
+        self.assertTrue(self.simulator.acknowledge_alert(first['id'])['acknowledged'])
+        self.simulator.clear_alerts()
+        self.assertTrue(self.database.flush(5))
+        
+        self.assertEqual(self.simulator.acknowledge_alert(second['id'])['patient_id'], 'bed-2')
+        self.assertIsNone(self.simulator.acknowledge_alert(999))
+        self.assertTrue(self.database.flush(5))
+        self.assertEqual([alert['id'] for alert in self.simulator.search_alerts(acknowledged=True)],
+                         [second['id'], first['id']])
+        self.assertEqual(len(self.simulator.search_alerts(patient_id='bed-1', vital='heart_rate', alert_type='critical')), 1)
+        
+        # Ids keep growing after a restart instead of reusing stored ones
+        restarted = VitalsSimulator(patient_ids=['bed-1'], seed=1, scheduler=TickScheduler())
+        restarted.attach_database(Database(self.path))
+        self.assertEqual(restarted.create_test_alert('bed-1')['id'], second['id'] + 1)
+
+class TestDataExport(unittest.TestCase):
+    """Test cases for streaming CSV/NDJSON exports"""
+    
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        # Tiny pages so every export crosses page boundaries
+        self.exporter = DataExporter(page_rows=2)
+    
+    def tearDown(self):
+        self.tempdir.cleanup()
+    
+    def _simulator(self):
+        simulator = VitalsSimulator(patient_ids=['bed-1', 'bed,2'], seed=1, scheduler=TickScheduler())
+        for _ in range(5):
+            simulator.generate_realistic_vitals()
+        return simulator
+    
+    def test_vitals_pages_from_each_source(self):
+        """Test that memory, store and database exports all match the recorded history"""
+        expected = None
+        for source in ('memory', 'store', 'database'):
+            simulator = VitalsSimulator(patient_ids=['bed-1', 'bed,2'], seed=1, scheduler=TickScheduler())
+            if source == 'store':
+                simulator.attach_store(VitalsStore(os.path.join(self.tempdir.name, 'store'), segment_records=3))
+            elif source == 'database':
+                simulator.attach_database(Database(os.path.join(self.tempdir.name, 'export.db')))
+            for _ in range(5):
+                simulator.generate_realistic_vitals()
+            if source == 'database':
+                simulator.database.flush(5)
+            
+            lines = b''.join(self.exporter.vitals(simulator, ['bed-1', 'bed,2'], fmt='ndjson')).splitlines()
+            readings = [json.loads(line) for line in lines]
+            self.assertEqual(len(readings), 10)
+            history = simulator.get_vitals_history(None, 'bed,2')
+            self.assertEqual([{key: value for key, value in reading.items() if key != 'patient_id'}
+                              for reading in readings[5:]], history)
+            expected = expected or readings
+            self.assertEqual([reading['patient_id'] for reading in readings], [reading['patient_id'] for reading in expected])
+    
+    def test_csv_gzip_and_alerts(self):
+        """Test CSV quoting, on-the-fly gzip and alert exports"""
+        simulator = self._simulator()
+        csv_text = gzip.decompress(b''.join(self.exporter.gzip(self.exporter.vitals(simulator, ['bed,2'])))).decode()
+        lines = csv_text.splitlines()
+        self.assertEqual(lines[0], 'patient_id,timestamp,heart_rate,spo2,temperature,respiratory_rate')
+        self.assertEqual(len(lines), 6)
+        self.assertTrue(lines[1].startswith('"bed,2",'))
+        
+        for patient_id in ('bed-1', 'bed-1', 'bed,2'):
+            simulator.create_test_alert(patient_id)
+        alerts = [json.loads(line) for line in b''.join(
+            self.exporter.alerts(simulator, ['bed-1'], fmt='ndjson')).splitlines()]
+        self.assertEqual([alert['id'] for alert in alerts], [1, 2])
+    
+    def test_columnar_npz_is_memory_mapped(self):
+        """Test that .npz exports reopen as memory-mapped int64 epoch and per-vital columns"""
+        simulator = self._simulator()
+        path = os.path.join(self.tempdir.name, 'vitals.npz')
+        pages = self.exporter.vitals_pages(simulator, ['bed-1', 'bed,2'])
+        export_vitals_columnar(pages, ['bed-1', 'bed,2'], path, 'npz')
+        
+        columns = load_vitals_columnar(path)
+        self.assertIsInstance(columns['heart_rate'], np.memmap)
+        self.assertEqual(columns['timestamp_ms'].dtype, np.int64)
+        self.assertEqual(columns['patient'].tolist(), [0] * 5 + [1] * 5)
+        self.assertEqual(columns['patient_ids'].tolist(), ['bed-1', 'bed,2'])
+        history = simulator.get_vitals_history(None, 'bed,2')
+        self.assertEqual(columns['heart_rate'][5:].tolist(), [reading['heart_rate'] for reading in history])
+        with np.load(path) as archive:
+            np.testing.assert_array_equal(archive['temperature'], columns['temperature'])
+    
+    @unittest.skipIf(pa is None, 'Arrow exports need pyarrow')
+    def test_columnar_arrow(self):
+        """Test that Arrow exports hold dictionary-encoded patients and millisecond timestamps"""
+        simulator = self._simulator()
+        path = os.path.join(self.tempdir.name, 'vitals.arrow')
+        export_vitals_columnar(self.exporter.vitals_pages(simulator, ['bed,2']), ['bed,2'], path, 'arrow')
+        
+        table = load_vitals_columnar(path)
+        self.assertEqual(table.num_rows, 5)
+        self.assertEqual(table.column('patient_id').to_pylist(), ['bed,2'] * 5)
+        history = simulator.get_vitals_history(None, 'bed,2')
+        self.assertEqual(table.column('spo2').to_pylist(), [reading['spo2'] for reading in history])
+
+@unittest.skipIf(os.name != 'posix', 'The shared state backend needs Unix sockets')
+class TestSharedBackend(unittest.TestCase):
+    """Test cases for sharing one simulation between workers"""
+    
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        path = os.path.join(self.directory.name, 'run', 'state.sock')
+        self.previous = os.environ.get('DISABLE_SIMULATION')
+        os.environ['DISABLE_SIMULATION'] = 'true'
+        self.chat_jobs = ChatJobQueue(lambda message, patient_id=None: {'response': message.upper()})
+        self.leader = SharedBackend(VitalsSimulator(patient_ids=['bed-1'], seed=1), self.chat_jobs, path, b'test')
+        self.follower = SharedBackend(VitalsSimulator(patient_ids=['bed-1'], seed=2), ChatJobQueue(str.upper), path, b'test')
+        self.leader.start()
+        self.follower.start()
+    
+    def tearDown(self):
+        self.follower.stop()
+        self.leader.stop()
+        if self.previous is None:
+            del os.environ['DISABLE_SIMULATION']
+        else:
+            os.environ['DISABLE_SIMULATION'] = self.previous
+        self.directory.cleanup()
+    
+    def test_follower_reads_leader_state(self):
+        """Test that only one worker leads and the others see its simulation"""
+        self.assertTrue(self.leader.is_leader)
+        self.assertFalse(self.follower.is_leader)
+        
+        self.leader.local.generate_realistic_vitals()
+        simulator = self.follower.simulator
+        self.assertEqual(simulator.get_current_vitals('bed-1'), self.leader.local.get_current_vitals('bed-1'))
+        self.assertEqual(simulator.epoch, self.leader.local.epoch)
+        simulator.create_test_alert('bed-1')
+        self.assertEqual(len(self.leader.local.get_alerts()), 1)
+        with self.assertRaises(KeyError):
+            simulator.get_current_vitals('bed-9')
+    
+    def test_events_relayed_to_follower(self):
+        """Test that a follower's clients receive the leader's events for their patients"""
+        subscriber = self.follower.simulator.events.subscribe(['bed-1'])
+        deadline = time.time() + 5
+        while 'bed-1' not in self.leader.local.events.watched_patients() and time.time() < deadline:
+            time.sleep(0.01)
+        
+        self.leader.local.create_test_alert('bed-1')
+        event = subscriber.get(timeout=5)
+        self.assertEqual(event.event, 'alert')
+        self.assertEqual(event.payload['patient_id'], 'bed-1')
+    
+    def test_chat_jobs_run_in_the_leader(self):
+        """Test that a chat job submitted through a follower can be polled through any worker"""
+        job = self.follower.chat_jobs.submit('hello', patient_id='bed-1')
+        deadline = time.time() + 5
+        while self.follower.chat_jobs.get(job.id).status != 'done' and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.follower.chat_jobs.get(job.id).to_dict()['result'], {'response': 'HELLO'})
+        self.assertEqual(self.leader.chat_jobs.get(job.id).result, {'response': 'HELLO'})
+        self.assertIsNone(self.follower.chat_jobs.get('unknown'))
+        self.assertEqual(self.follower.chat_jobs.stats()['completed'], 1)
+    
+    def test_only_shared_methods_are_served(self):
+        """Test that the leader refuses calls outside the shared methods"""
+        with self.assertRaises(AttributeError):
+            self.follower.simulator.snapshot_state
+        conn = self.follower._connect()
+        try:
+            for request in (('simulator', 'generate_realistic_vitals', (), {}, False), ('simulator', 'alerts', (), {}, True),
+                            ('chat_jobs', 'start', (), {}, False), ('ai_assistant', 'chat', (), {}, False)):
+                conn.send(request)
+                status, error = conn.recv()
+                self.assertEqual(status, 'error')
+                self.assertIsInstance(error, AttributeError)
+        finally:
+            conn.close()
+        self.assertEqual(self.leader.local.get_alerts(), [])
+    
+    def test_socket_directory_and_key_are_private(self):
+        """Test that the socket lives in a 0700 directory and the default key is refused"""
+        directory = os.path.dirname(self.leader.socket_path)
+        self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+        shared = os.path.join(self.directory.name, 'shared')
+        os.mkdir(shared, 0o755)
+        os.chmod(shared, 0o755)
+        with self.assertRaises(RuntimeError):
+            private_directory(shared)
+        
+        previous = Config.SECRET_KEY
+        Config.SECRET_KEY = DEFAULT_SECRET_KEY
+        try:
+            with self.assertRaises(RuntimeError):
+                create_backend('shared', self.leader.local, self.chat_jobs)
+        finally:
+            Config.SECRET_KEY = previous
+
 if __name__ == '__main__':
     unittest.main()